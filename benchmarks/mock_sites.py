@@ -0,0 +1,398 @@
+"""
+Local stand-ins for the Zeit epaper site, the Tolino webreader and the Tolino cloud API.
+They mimic just enough markup for ZeitScraper, TolinoUploader and TolinoCloudUploader to run end-to-end,
+with configurable latency and failure injection.
+"""
+import io
+import re
+import time
+import random
+import zipfile
+import secrets
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+USERNAME = "bench@example.com"
+PASSWORD = "bench-password"
+
+
+class MockConfig:
+    """
+    latency: base delay per response in seconds (plus up to 50% jitter).
+    failure_rate: probability that an EPUB download or an upload fails (HTTP 500 or a truncated body).
+    """
+    def __init__(self, latency=0.05, failure_rate=0.0, epub_size=2 * 1024 * 1024, multiple_upload=False, issues=4, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.epub_size = epub_size
+        self.multiple_upload = multiple_upload
+        self.random = random.Random(seed)
+        today = date.today()
+        self.issues = [(today - timedelta(days=7 * i)).strftime("%d.%m.%Y") for i in range(issues)]
+        self.uploads = []
+        self.lock = threading.Lock()
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency * (1 + self.random.random() * 0.5))
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.failure_rate
+
+
+def build_epub(issue_id, size):
+    """
+    Returns a valid EPUB (mimetype stored first) padded to roughly `size` bytes with incompressible data.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        archive.writestr("META-INF/container.xml", (
+            '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles></container>'
+        ))
+        archive.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+            f'<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:identifier id="id">zeit-{issue_id}</dc:identifier>'
+            f'<dc:title>DIE ZEIT {issue_id}</dc:title><dc:language>de</dc:language></metadata>'
+            '<manifest><item id="text" href="text.xhtml" media-type="application/xhtml+xml"/>'
+            '<item id="cover" href="cover.bin" media-type="application/octet-stream"/></manifest>'
+            '<spine><itemref idref="text"/></spine></package>'
+        ))
+        archive.writestr("OEBPS/text.xhtml", f"<html xmlns='http://www.w3.org/1999/xhtml'><body><h1>DIE ZEIT {issue_id}</h1></body></html>")
+        archive.writestr(zipfile.ZipInfo("OEBPS/cover.bin"), random.Random(issue_id).randbytes(max(size - 2048, 0)))
+    return buffer.getvalue()
+
+
+# Images, a web font and a tracker like the real epaper pages load; what request blocking should save.
+HEAVY_ASSETS = (
+    "<img src='/assets/teaser-1.jpg' width='1' height='1'><img src='/assets/teaser-2.jpg' width='1' height='1'>"
+    "<style>@font-face {font-family: 'Tablet Gothic'; src: url('/assets/tablet-gothic.woff2');} body {font-family: 'Tablet Gothic';}</style>"
+    "<script src='/www.googletagmanager.com/gtm.js' async></script>"
+)
+ASSET_SIZE = 256 * 1024
+
+
+def page(title, body, script=""):
+    return f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{title}</title></head><body>{body}<script>{script}</script></body></html>"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    config = None
+    sessions = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def session_cookie(self, name):
+        cookies = dict(part.strip().split("=", 1) for part in self.headers.get("Cookie", "").split(";") if "=" in part)
+        return cookies.get(name) in self.sessions
+
+    def send_html(self, html, status=200, headers=None):
+        body = html.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def redirect(self, location, headers=None):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def send_json(self, text, status=200):
+        body = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_asset(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(ASSET_SIZE))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(b"\0" * ASSET_SIZE)
+
+    def read_form(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+
+    def new_session(self, cookie_name):
+        token = secrets.token_hex(16)
+        self.sessions.add(token)
+        return {"Set-Cookie": f"{cookie_name}={token}; Path=/"}
+
+    def drain_body(self):
+        """
+        Reads the request body in chunks without keeping it; returns the number of bytes received.
+        """
+        remaining = int(self.headers.get("Content-Length", 0))
+        received = 0
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 256 * 1024))
+            if not chunk:
+                break
+            received += len(chunk)
+            remaining -= len(chunk)
+        return received
+
+
+class ZeitHandler(MockHandler):
+    """
+    /login (Keycloak-like form), /abo/diezeit/ (epaper with 'Zur aktuellen Ausgabe' and an archive),
+    /abo/diezeit/<date> (issue page) and /download/<date>.epub (Range-capable download).
+    """
+    epubs = {}
+
+    def do_GET(self):
+        self.config.delay()
+        path = urlparse(self.path).path
+        logged_in = self.session_cookie("zeit_session")
+
+        if path.startswith("/assets/") or path.startswith("/www.googletagmanager.com/"):
+            return self.send_asset()
+
+        if path == "/login":
+            if logged_in:
+                return self.send_html(page("Konto", "<a href='/logout'>Abmelden</a>"))
+            return self.send_html(page("Anmelden", (
+                "<form method='post' action='/login'>"
+                "<input id='username' name='username'><input id='password' name='password' type='password'>"
+                "<input id='kc-login' type='submit' value='Anmelden'></form>"
+            )))
+
+        if not logged_in:
+            return self.redirect("/login")
+
+        if path == "/abo/diezeit/":
+            current = self.config.issues[0]
+            archive = "".join(f'<li><a href="/abo/diezeit/{issue}">Ausgabe vom {issue}</a></li>' for issue in self.config.issues)
+            return self.send_html(page("Die Zeit E-Paper", (
+                f'<a class="btn-danger" href="/abo/diezeit/{current}">Zur aktuellen Ausgabe</a><ul>{archive}</ul>'
+                "<a href='/logout'>Abmelden</a>" + HEAVY_ASSETS
+            )))
+
+        match = re.match(r"^/abo/diezeit/(\d{2}\.\d{2}\.\d{4})$", path)
+        if match:
+            return self.send_html(page(f"Ausgabe {match.group(1)}", f"<a href='/download/{match.group(1)}.epub'>EPUB für E-Reader laden</a>" + HEAVY_ASSETS))
+
+        match = re.match(r"^/download/(\d{2}\.\d{2}\.\d{4})\.epub$", path)
+        if match:
+            return self.send_epub(match.group(1))
+
+        self.send_html(page("Not found", "404"), status=404)
+
+    def send_epub(self, issue_id):
+        if issue_id not in self.epubs:
+            self.epubs[issue_id] = build_epub(issue_id, self.config.epub_size)
+        data = self.epubs[issue_id]
+        if self.config.should_fail():
+            return self.send_html(page("Fehler", "500"), status=500)
+
+        start = 0
+        range_header = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if range_header:
+            start = int(range_header.group(1))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                return self.end_headers()
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/epub+zip")
+        self.send_header("Content-Disposition", f'attachment; filename="DIE_ZEIT_{issue_id}.epub"')
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+
+        # Failure injection, second kind: the connection drops halfway through the body.
+        if self.config.should_fail():
+            self.wfile.write(data[start:start + (len(data) - start) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(data[start:])
+
+    def do_POST(self):
+        self.config.delay()
+        if urlparse(self.path).path != "/login":
+            return self.send_html(page("Not found", "404"), status=404)
+        form = self.read_form()
+        if form.get("username") != USERNAME or form.get("password") != PASSWORD:
+            return self.send_html(page("Anmelden", "<p>Ungültige Anmeldedaten</p>"))
+        self.redirect("/login", headers=self.new_session("zeit_session"))
+
+
+LIBRARY_SCRIPT = """
+var multiple = %s;
+var input = document.querySelector("input[type='file']");
+input.multiple = multiple;
+document.querySelector("button[data-test-id='library-headerBar-overflowMenu-button']").onclick = function() {
+    document.getElementById('menu').style.display = 'block';
+};
+function toast(text) {
+    var el = document.createElement('div');
+    el.className = 'toast';
+    el.textContent = text;
+    document.getElementById('toasts').appendChild(el);
+    setTimeout(function() { el.remove(); }, 1500);
+}
+input.onchange = function() {
+    Array.prototype.forEach.call(input.files, function(file) {
+        var data = new FormData();
+        data.append('file', file);
+        fetch('/upload', {method: 'POST', body: data}).then(function(response) {
+            if (response.ok) { toast(file.name + ' wurde erfolgreich hinzugefügt'); }
+        });
+    });
+    document.getElementById('menu').style.display = 'none';
+};
+"""
+
+
+class TolinoHandler(MockHandler):
+    """
+    Webreader stand-in: / (country and provider picker), /landing ('Anmelden'), /login (Thalia form),
+    /library/index.html (overflow menu, hidden file input, success toasts) and POST /upload.
+    """
+    def do_GET(self):
+        self.config.delay()
+        path = urlparse(self.path).path
+        logged_in = self.session_cookie("tolino_session")
+
+        if path == "/":
+            if logged_in:
+                return self.redirect("/library/index.html")
+            return self.send_html(page("tolino webreader", (
+                "<button id='country'>Deutschland</button>"
+                "<a id='provider' href='/landing' style='display:none'><img alt='Thalia DE' width='120' height='40'></a>"
+            ), "document.getElementById('country').onclick = function() { document.getElementById('provider').style.display = 'inline'; };"))
+
+        if path == "/landing":
+            return self.send_html(page("Thalia", "<a href='/login'>Anmelden</a>"))
+
+        if path == "/login":
+            return self.send_html(page("Thalia Login", (
+                "<form method='post' action='/login'>"
+                "<input name='username' type='email'><input name='password' type='password'>"
+                "<button type='submit'>Einloggen</button></form>"
+            )))
+
+        if path == "/library/index.html":
+            if not logged_in:
+                return self.redirect("/")
+            return self.send_html(page("Meine Bücher", (
+                "<button data-test-id='library-headerBar-overflowMenu-button'>...</button>"
+                "<div id='menu' style='display:none'><span>Hochladen</span></div>"
+                "<input type='file' style='display:none'><div id='toasts'></div>"
+            ), LIBRARY_SCRIPT % ("true" if self.config.multiple_upload else "false")))
+
+        self.send_html(page("Not found", "404"), status=404)
+
+    def do_POST(self):
+        self.config.delay()
+        path = urlparse(self.path).path
+        if path == "/login":
+            form = self.read_form()
+            if form.get("username") != USERNAME or form.get("password") != PASSWORD:
+                return self.send_html(page("Thalia Login", "<p>Falsche Zugangsdaten</p>"))
+            return self.redirect("/library/index.html#/mybooks/titles", headers=self.new_session("tolino_session"))
+
+        if path == "/upload":
+            if not self.session_cookie("tolino_session"):
+                return self.send_json('{"error": "unauthorized"}', status=401)
+            received = self.drain_body()
+            if self.config.should_fail():
+                return self.send_json('{"error": "internal"}', status=500)
+            with self.config.lock:
+                self.config.uploads.append(received)
+            return self.send_json('{"status": "ok"}')
+
+        self.send_html(page("Not found", "404"), status=404)
+
+
+class TolinoApiHandler(MockHandler):
+    """
+    Cloud API stand-in for TolinoCloudUploader: /auth/login, /auth/authorize, /auth/token and /rest/upload.
+    """
+    tokens = None
+
+    def do_GET(self):
+        self.config.delay()
+        url = urlparse(self.path)
+        if url.path == "/auth/authorize":
+            if not self.session_cookie("api_session"):
+                return self.send_html(page("Login", "login required"), status=401)
+            redirect_uri = parse_qs(url.query).get("redirect_uri", ["http://localhost/"])[0]
+            return self.redirect(f"{redirect_uri}?code={secrets.token_hex(8)}")
+        self.send_json('{"error": "not found"}', status=404)
+
+    def do_POST(self):
+        self.config.delay()
+        path = urlparse(self.path).path
+        if path == "/auth/login":
+            form = self.read_form()
+            if form.get("j_username") != USERNAME or form.get("j_password") != PASSWORD:
+                return self.send_html(page("Login", "Falsche Zugangsdaten"), status=401)
+            return self.send_html(page("Login", "ok"), headers=self.new_session("api_session"))
+
+        if path == "/auth/token":
+            form = self.read_form()
+            if form.get("grant_type") == "refresh_token" and form.get("refresh_token") not in self.tokens:
+                return self.send_json('{"error": "invalid_grant"}', status=400)
+            access, refresh = secrets.token_hex(16), secrets.token_hex(16)
+            self.tokens.update({access, refresh})
+            return self.send_json(f'{{"access_token": "{access}", "refresh_token": "{refresh}", "expires_in": 3600}}')
+
+        if path == "/rest/upload":
+            if self.headers.get("t_auth_token") not in self.tokens:
+                self.drain_body()
+                return self.send_json('{"error": "invalid token"}', status=401)
+            received = self.drain_body()
+            if self.config.should_fail():
+                return self.send_json('{"error": "internal"}', status=500)
+            with self.config.lock:
+                self.config.uploads.append(received)
+            return self.send_json(f'{{"metadata": {{"size": {received}}}}}')
+
+        self.send_json('{"error": "not found"}', status=404)
+
+
+class MockSite:
+    """
+    Runs one handler class on a free localhost port in a background thread.
+    """
+    def __init__(self, handler, config):
+        attributes = {"config": config, "sessions": set()}
+        if handler is TolinoApiHandler:
+            attributes["tokens"] = set()
+        if handler is ZeitHandler:
+            attributes["epubs"] = {}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), type(handler.__name__, (handler,), attributes))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
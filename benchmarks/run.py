@@ -0,0 +1,231 @@
+"""
+Runs ZeitScraper, TolinoUploader and TolinoCloudUploader end-to-end against the local mock sites
+and reports p50/p95 per phase (from the run tracer) for each scenario.
+
+    python -m benchmarks.run --iterations 10 --latency 0.05 --failure-rate 0.1
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+SCENARIOS = ("zeit", "tolino-web", "tolino-api")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark against local mock Zeit and Tolino sites")
+    parser.add_argument("--iterations", type=int, default=5, help="Runs per scenario (default: 5)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.05, help="Base latency per mock response in seconds (default: 0.05)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability of injected download/upload failures (default: 0)")
+    parser.add_argument("--epub-mb", type=float, default=2.0, help="Size of the served EPUB in MB (default: 2)")
+    parser.add_argument("--multiple-upload", action="store_true", help="Let the mock upload input accept several files")
+    parser.add_argument("--browser-download", action="store_true", help="Download the EPUB by clicking in Chrome instead of via HTTP")
+    parser.add_argument("--compare-blocking", action="store_true", help="Run each scenario with and without request blocking (BLOCK_RESOURCES)")
+    parser.add_argument("--warm", action="store_true", help="Keep the session cache between iterations (measures cached logins)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latency jitter and failure injection")
+    parser.add_argument("--output", help="Write all samples and the summary as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the application logs")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    workdir = tempfile.mkdtemp(prefix="zeit-bench-")
+    # Keep every file the application writes inside the work dir; must be set before src is imported.
+    os.environ.update({
+        "WAIT_STATS_FILE": os.path.join(workdir, "wait_stats.json"),
+        "SELECTOR_STATS_FILE": os.path.join(workdir, "selector_stats.json"),
+        "SCHEDULER_STATE_FILE": os.path.join(workdir, "request_budget.json"),
+        # The local stand-ins need no request budget; it would only add waits to the measured phases.
+        "SCHEDULER_RATE": "0",
+        "LEDGER_FILE": os.path.join(workdir, "ledger.sqlite"),
+        "SESSION_CACHE_DIR": os.path.join(workdir, "session_cache"),
+        "SESSION_CACHE_KEY": "benchmark",
+        "TRACE_DIR": "",
+    })
+
+    from benchmarks.mock_sites import MockConfig, MockSite, ZeitHandler, TolinoHandler, TolinoApiHandler, USERNAME, PASSWORD, build_epub
+    from src.ledger import RunLedger
+    from src.session_cache import SessionCache
+    from src.tracing import reset_tracer, get_tracer
+    from src.epub_store import inspect_epub
+    from src.resource_monitor import ResourceMonitor
+    from src.waits import percentile
+    from src.zeit_scraper import ZeitScraper
+    from src.tolino_uploader import TolinoUploader
+    from src.tolino_cloud import TolinoCloudUploader
+
+    config = MockConfig(
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+        epub_size=int(args.epub_mb * 1024 * 1024),
+        multiple_upload=args.multiple_upload,
+        seed=args.seed
+    )
+    zeit = MockSite(ZeitHandler, config).start()
+    tolino = MockSite(TolinoHandler, config).start()
+    api = MockSite(TolinoApiHandler, config).start()
+
+    sample_epub = os.path.join(workdir, "DIE_ZEIT_sample.epub")
+    with open(sample_epub, 'wb') as f:
+        f.write(build_epub(config.issues[0], config.epub_size))
+    ledger = RunLedger(legacy_history_file=None)
+
+    def cache(site):
+        if not args.warm:
+            shutil.rmtree(os.environ["SESSION_CACHE_DIR"], ignore_errors=True)
+        return SessionCache(site, USERNAME, PASSWORD)
+
+    def run_zeit(iteration):
+        download_dir = os.path.join(workdir, f"download-{iteration}")
+        scraper = ZeitScraper(
+            username=USERNAME,
+            password=PASSWORD,
+            login_url=f"{zeit.url}/login",
+            download_url=f"{zeit.url}/abo/diezeit/",
+            download_dir=download_dir,
+            ledger=ledger,
+            test_mode=True,
+            session_cache=cache("zeit"),
+            http_download=not args.browser_download
+        )
+        path = scraper.download_latest_issue()
+        ok = bool(path) and path != "SKIPPED"
+        if ok:
+            with get_tracer().span("validate") as span:
+                problem = inspect_epub(path)[0]
+                if problem:
+                    span.fail(problem)
+            ok = not problem
+        shutil.rmtree(download_dir, ignore_errors=True)
+        return ok
+
+    def run_tolino_web(iteration):
+        uploader = TolinoUploader(
+            username=USERNAME,
+            password=PASSWORD,
+            login_url=f"{tolino.url}/",
+            library_url=f"{tolino.url}/library/index.html#/mybooks/titles",
+            session_cache=cache("tolino")
+        )
+        return uploader.upload_epub(sample_epub)
+
+    def run_tolino_api(iteration):
+        uploader = TolinoCloudUploader(
+            username=USERNAME,
+            password=PASSWORD,
+            session_cache=cache("tolino-api"),
+            endpoints={
+                "login_url": f"{api.url}/auth/login",
+                "auth_url": f"{api.url}/auth/authorize",
+                "token_url": f"{api.url}/auth/token",
+                "upload_url": f"{api.url}/rest/upload",
+                "redirect_uri": f"{api.url}/library/",
+                "client_id": "webreader",
+                "scope": "SCOPE_BOSH",
+                "reseller_id": "3",
+            }
+        )
+        try:
+            return uploader.upload_epub(sample_epub)
+        finally:
+            uploader.close()
+
+    runners = {"zeit": run_zeit, "tolino-web": run_tolino_web, "tolino-api": run_tolino_api}
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in runners]
+    if unknown:
+        print(f"Unknown scenario(s): {', '.join(unknown)}", file=sys.stderr)
+        sys.exit(2)
+
+    # With --compare-blocking every scenario runs twice; the unblocked variant is reported as '<scenario> (unblocked)'.
+    variants = [(name, "1") for name in scenarios]
+    if args.compare_blocking:
+        variants = [(name, blocking) for name in scenarios for blocking in ("1", "0")]
+    samples = {}
+    try:
+        for name, blocking in variants:
+            label = name if blocking == "1" else f"{name} (unblocked)"
+            samples[label] = []
+            os.environ["BLOCK_RESOURCES"] = blocking
+            for iteration in range(args.iterations):
+                tracer = reset_tracer()
+                monitor = ResourceMonitor(interval=0.25).start()
+                start = time.time()
+                try:
+                    ok = bool(runners[name](iteration))
+                except Exception as e:
+                    logging.getLogger("benchmark").error(f"{name} #{iteration + 1} crashed: {e}")
+                    ok = False
+                finally:
+                    monitor.stop()
+                phases = {phase: stats["total"] for phase, stats in tracer.phases().items()}
+                phases["total"] = time.time() - start
+                samples[label].append({"ok": ok, "phases": phases, "counters": dict(tracer.counters)})
+                print(f"{label} #{iteration + 1}: {'ok' if ok else 'FAILED'} in {phases['total']:.2f}s", flush=True)
+    finally:
+        zeit.stop()
+        tolino.stop()
+        api.stop()
+
+    summary = {}
+    for name, runs in samples.items():
+        phase_names = []
+        for run in runs:
+            phase_names += [phase for phase in run["phases"] if phase not in phase_names]
+        summary[name] = {
+            "success_rate": sum(1 for run in runs if run["ok"]) / len(runs) if runs else 0,
+            "phases": {
+                phase: {
+                    "p50": percentile(values, 50),
+                    "p95": percentile(values, 95),
+                    "n": len(values),
+                }
+                for phase in phase_names
+                for values in [[run["phases"][phase] for run in runs if phase in run["phases"]]]
+            },
+            "page_transfer_bytes": percentile([run["counters"].get("page.transfer_bytes", 0) for run in runs], 50) if runs else 0,
+            "peak_rss_bytes": percentile([run["counters"].get("resources.peak_rss_bytes", 0) for run in runs], 50) if runs else 0,
+        }
+
+    print()
+    for name, result in summary.items():
+        print(f"== {name} (success {result['success_rate']:.0%}) ==")
+        width = max(len(phase) for phase in result["phases"]) if result["phases"] else 5
+        print(f"{'phase'.ljust(width)}  {'n':>3}  {'p50 s':>7}  {'p95 s':>7}")
+        for phase, stats in result["phases"].items():
+            print(f"{phase.ljust(width)}  {stats['n']:>3}  {stats['p50']:>7.2f}  {stats['p95']:>7.2f}")
+        if result["page_transfer_bytes"]:
+            print(f"page transfer p50: {result['page_transfer_bytes'] / 1024:.0f} KB")
+        if result["peak_rss_bytes"]:
+            print(f"peak RSS p50: {result['peak_rss_bytes'] / 1048576:.0f} MB")
+        print()
+
+    if args.compare_blocking:
+        for name in scenarios:
+            blocked, unblocked = summary.get(name), summary.get(f"{name} (unblocked)")
+            if not blocked or not unblocked or "total" not in blocked["phases"]:
+                continue
+            saved_time = unblocked["phases"]["total"]["p50"] - blocked["phases"]["total"]["p50"]
+            saved_bytes = unblocked["page_transfer_bytes"] - blocked["page_transfer_bytes"]
+            print(f"Blocking saves on {name}: {saved_time:.2f}s p50, {saved_bytes / 1024:.0f} KB page transfer")
+
+    if args.output:
+        settings = {key: value for key, value in vars(args).items() if key != "output"}
+        with open(args.output, 'w') as f:
+            json.dump({"settings": settings, "summary": summary, "samples": samples}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    ledger.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
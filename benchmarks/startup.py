@@ -0,0 +1,120 @@
+"""
+Measures interpreter startup of src.main in fresh processes: the import time, an early exit (missing configuration)
+and Chrome version detection with a cold and a warm cache. Fails if selenium, undetected_chromedriver or Pillow
+are loaded by the import, or if the median import time exceeds --budget-ms.
+
+    python -m benchmarks.startup --runs 10 --budget-ms 1000
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be loaded once a browser or the optimizer is actually needed.
+HEAVY_MODULES = ("selenium", "undetected_chromedriver", "PIL")
+
+IMPORT_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+import src.main
+print(json.dumps({"seconds": time.perf_counter() - start, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+VERSION_SCRIPT = """
+import time, json
+from src.browser import get_chrome_version
+start = time.perf_counter()
+version = get_chrome_version(%r)
+print(json.dumps({"seconds": time.perf_counter() - start, "version": version}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Startup benchmark for src.main")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement (default: 5)")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if the median import time is above this")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    return parser.parse_args()
+
+
+def run_python(args, env):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return result, time.perf_counter() - start
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="zeit-startup-")
+    try:
+        return benchmark(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def benchmark(args, workdir):
+    env = dict(os.environ, PYTHONPATH=ROOT, CHROME_CACHE_DIR=os.path.join(workdir, "chrome_cache"), TRACE_DIR="",
+               LEDGER_FILE=os.path.join(workdir, "ledger.sqlite"))
+    results = {"import": [], "early_exit": [], "chrome_version_cold": [], "chrome_version_warm": []}
+    loaded = set()
+
+    for _ in range(args.runs):
+        result, _ = run_python(["-c", IMPORT_SCRIPT], env)
+        if result.returncode != 0:
+            print(result.stderr, file=sys.stderr)
+            return 1
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        results["import"].append(sample["seconds"])
+        loaded.update(sample["loaded"])
+
+        # Empty values count as missing; load_dotenv does not override them.
+        _, elapsed = run_python(["-m", "src.main"], dict(env, ZEIT_USER="", ZEIT_PASSWORD=""))
+        results["early_exit"].append(elapsed)
+
+    chrome_bin = os.getenv("CHROME_BIN")
+    for _ in range(args.runs):
+        for key in ("chrome_version_cold", "chrome_version_warm"):
+            if key == "chrome_version_cold":
+                cache_file = os.path.join(env["CHROME_CACHE_DIR"], "versions.json")
+                if os.path.exists(cache_file):
+                    os.remove(cache_file)
+            result, _ = run_python(["-c", VERSION_SCRIPT % (chrome_bin,)], env)
+            sample = json.loads(result.stdout.strip().splitlines()[-1]) if result.returncode == 0 else None
+            if sample and sample["version"]:
+                results[key].append(sample["seconds"])
+
+    print(f"{'measurement'.ljust(20)}  {'n':>3}  {'median ms':>9}  {'max ms':>7}")
+    for name, values in results.items():
+        if values:
+            print(f"{name.ljust(20)}  {len(values):>3}  {median(values) * 1000:>9.1f}  {max(values) * 1000:>7.1f}")
+        else:
+            print(f"{name.ljust(20)}  {0:>3}  {'-':>9}  {'-':>7}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"samples": results, "heavy_modules_loaded": sorted(loaded)}, f, indent=2)
+
+    failed = False
+    if loaded:
+        print(f"FAIL: importing src.main loads {', '.join(sorted(loaded))}; import them where they are used.")
+        failed = True
+    if args.budget_ms and median(results["import"]) * 1000 > args.budget_ms:
+        print(f"FAIL: median import time {median(results['import']) * 1000:.0f} ms is above the budget of {args.budget_ms:.0f} ms.")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
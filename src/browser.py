@@ -0,0 +1,371 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+import subprocess
+import threading
+import urllib.request
+from src.tracing import get_tracer
+
+# undetected_chromedriver (and with it selenium) is only imported when Chrome is actually started, so runs that
+# end early (missing config, issue already uploaded) don't pay for it.
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW_SIZE = "1280,900"
+DEFAULT_CHROME_CACHE_DIR = ".chrome_cache"
+DEFAULT_BROWSER_SERVER_STATE = ".browser_server.json"
+
+# Flags that switch off everything a scripted run never uses (extensions, sync, update checks, ...).
+LEAN_FLAGS = (
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-domain-reliability",
+    "--disable-client-side-phishing-detection",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,InterestFeedContentSuggestions",
+    "--metrics-recording-only",
+    "--no-first-run",
+    "--mute-audio",
+)
+
+# URL patterns for Network.setBlockedURLs ('*' is a wildcard), grouped by resource type.
+RESOURCE_BLOCK_PATTERNS = {
+    "image": ("*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.ico"),
+    "font": ("*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"),
+    "media": ("*.mp4", "*.webm", "*.mp3", "*.m3u8"),
+}
+
+# Ads, analytics and trackers seen on zeit.de and the webreader.
+THIRD_PARTY_BLOCK_PATTERNS = (
+    "*googletagmanager.com*", "*google-analytics.com*", "*doubleclick.net*", "*googlesyndication.com*",
+    "*adservice.google.*", "*facebook.net*", "*connect.facebook.*", "*hotjar.com*", "*ioam.de*",
+    "*xiti.com*", "*chartbeat.*", "*criteo.*", "*adnxs.com*", "*taboola.com*", "*outbrain.com*",
+    "*scorecardresearch.com*", "*nr-data.net*", "*newrelic.com*", "*cloudflareinsights.com*",
+    "*optimizely.com*", "*bat.bing.com*", "*adition.com*", "*yieldlove*", "*sentry.io*",
+)
+
+# Resource types dropped per site. The Tolino login clicks the 'Thalia DE' provider image, so images stay on there.
+SITE_BLOCK_PROFILES = {
+    "zeit": ("image", "font", "media"),
+    "tolino": ("font", "media"),
+}
+
+PAGE_STATS_SCRIPT = """
+var nav = performance.getEntriesByType('navigation')[0];
+var entries = performance.getEntriesByType('resource');
+var bytes = entries.reduce(function(sum, e) { return sum + (e.transferSize || 0); }, nav ? (nav.transferSize || 0) : 0);
+return {resources: entries.length, transfer_bytes: bytes, load_ms: nav && nav.loadEventEnd ? Math.round(nav.loadEventEnd - nav.startTime) : null};
+"""
+
+# uc.Chrome patches the chromedriver binary on launch; concurrent launches must not patch it at the same time.
+_launch_lock = threading.Lock()
+_version_cache = {}
+
+
+def chrome_cache_dir():
+    return os.getenv("CHROME_CACHE_DIR", DEFAULT_CHROME_CACHE_DIR)
+
+
+def binary_key(path):
+    """
+    Returns (resolved path, mtime) of an executable (looked up on PATH if needed), or None if it does not exist.
+    An updated binary gets a new mtime, which invalidates everything cached for the old one.
+    """
+    resolved = shutil.which(path) or path
+    try:
+        resolved = os.path.realpath(resolved)
+        return resolved, os.stat(resolved).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_chrome_version(chrome_bin=None):
+    """
+    Returns the major version of the Chrome binary that will be launched, or None if it cannot be detected.
+    The result is cached in memory and in CHROME_CACHE_DIR/versions.json, keyed by binary path and mtime,
+    so 'chrome --version' only runs once per installed Chrome.
+    """
+    # Read the version of the exact binary we will launch (chrome_bin),
+    # falling back to 'google-chrome' on PATH for local runs.
+    executable = chrome_bin or 'google-chrome'
+    key = binary_key(executable)
+    cache_key = f"{key[0]}:{key[1]}" if key else None
+    if cache_key in _version_cache:
+        return _version_cache[cache_key]
+
+    cache_path = os.path.join(chrome_cache_dir(), "versions.json")
+    try:
+        with open(cache_path, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        cached = {}
+    if cache_key and cache_key in cached:
+        _version_cache[cache_key] = cached[cache_key]
+        return cached[cache_key]
+
+    version = None
+    try:
+        result = subprocess.run([executable, '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        match = re.search(r'Chrome (\d+)', result.stdout)
+        if match:
+            version = int(match.group(1))
+    except Exception as e:
+        logger.warning(f"Could not detect Chrome version: {e}")
+
+    if cache_key and version:
+        _version_cache[cache_key] = version
+        try:
+            os.makedirs(chrome_cache_dir(), exist_ok=True)
+            # Entries of replaced binaries are dropped.
+            cached = {k: v for k, v in cached.items() if not k.startswith(key[0] + ":")}
+            cached[cache_key] = version
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(cached, f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.debug(f"Could not cache Chrome version: {e}")
+    return version
+
+
+def cached_driver(driver_bin, version_main):
+    """
+    Returns a private copy of driver_bin in CHROME_CACHE_DIR that uc patches on the first launch and then reuses,
+    keyed by the source binary's path, mtime and the Chrome version, so the driver given by CHROMEDRIVER_BIN is
+    never touched. Returns None without driver_bin (uc then fetches its own). Call with _launch_lock held.
+    """
+    key = binary_key(driver_bin) if driver_bin else None
+    if not key or not os.path.isfile(key[0]):
+        return None
+    digest = hashlib.sha256(f"{key[0]}:{key[1]}:{version_main}".encode()).hexdigest()[:16]
+    directory = os.path.join(chrome_cache_dir(), "drivers")
+    target = os.path.join(directory, f"chromedriver-{digest}")
+    if os.path.exists(target):
+        return target
+    try:
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        shutil.copy2(key[0], target + ".tmp")
+        os.replace(target + ".tmp", target)
+        logger.info(f"Cached chromedriver for Chrome {version_main} ({key[0]}); it is patched on this launch and reused afterwards.")
+        return target
+    except OSError as e:
+        logger.warning(f"Could not cache chromedriver, using {key[0]}: {e}")
+        return None
+
+
+def window_size():
+    width, height = os.getenv("CHROME_WINDOW_SIZE", DEFAULT_WINDOW_SIZE).split(",")
+    return int(width), int(height)
+
+
+def build_chrome_options(download_dir=None):
+    import undetected_chromedriver as uc
+    width, height = window_size()
+    options = uc.ChromeOptions()
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-gpu")
+    options.add_argument(f"--window-size={width},{height}")
+    options.add_argument(f"user-agent={USER_AGENT}")
+    for flag in LEAN_FLAGS:
+        options.add_argument(flag)
+
+    if download_dir:
+        prefs = {
+            "download.default_directory": download_dir,
+            "download.prompt_for_download": False,
+            "download.directory_upgrade": True,
+            "safebrowsing.enabled": True,
+            "plugins.always_open_pdf_externally": True
+        }
+        options.add_experimental_option("prefs", prefs)
+    return options
+
+
+def launch_chrome(download_dir=None, profile_dir=None):
+    """
+    Starts an undetected Chrome instance and returns the driver.
+    If download_dir is given, downloads are saved there without prompting.
+    If profile_dir is given, it is used as a persistent, isolated user-data-dir.
+    Without profile_dir, a running browser server (BROWSER_SERVER, see src.browser_server) is attached to instead.
+    CHROME_HEADLESS=1 runs the new headless mode (only where the WAF of both sites tolerates it).
+    """
+    # Per-account profiles (fan-out) need a browser of their own, the server's cookies belong to its profile.
+    address = browser_server_address() if not profile_dir else None
+    if address:
+        return attach_chrome(address, download_dir)
+
+    import undetected_chromedriver as uc
+    options = build_chrome_options(download_dir)
+
+    # Use the Chrome + ChromeDriver paths provided by the CI workflow so that
+    # the launched browser and the driver always come from the same matched pair.
+    chrome_bin = os.environ.get("CHROME_BIN")
+    driver_bin = os.environ.get("CHROMEDRIVER_BIN")
+    version_main = get_chrome_version(chrome_bin)
+
+    kwargs = dict(use_subprocess=True, options=options)
+    if chrome_bin:
+        kwargs["browser_executable_path"] = chrome_bin
+    if version_main:
+        kwargs["version_main"] = version_main
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        kwargs["user_data_dir"] = profile_dir
+    if os.getenv("CHROME_HEADLESS", "0") == "1":
+        # uc starts --headless=new for current Chrome versions and hides 'HeadlessChrome' from the user agent.
+        kwargs["headless"] = True
+
+    logger.info(
+        f"Starting Chrome (binary={chrome_bin or 'auto'}, driver={driver_bin or 'auto'}, version_main={version_main})"
+    )
+    with get_tracer().span("chrome.launch", profile=bool(profile_dir)):
+        with _launch_lock:
+            cached = cached_driver(driver_bin, version_main) if os.getenv("CHROME_DRIVER_CACHE", "1") != "0" else None
+            if driver_bin:
+                kwargs["driver_executable_path"] = cached or driver_bin
+            driver = uc.Chrome(**kwargs)
+        driver.set_window_size(*window_size())
+    return driver
+
+
+def devtools_version(address, timeout=2):
+    """
+    Returns the /json/version answer of the DevTools endpoint at address ('host:port'), or None if it doesn't answer.
+    """
+    try:
+        with urllib.request.urlopen(f"http://{address}/json/version", timeout=timeout) as response:
+            return json.load(response)
+    except Exception:
+        return None
+
+
+def browser_server_address():
+    """
+    Returns the address of the browser server to attach to, or None to launch Chrome locally.
+    BROWSER_SERVER is either 'host:port' or 'auto' (the address written to BROWSER_SERVER_STATE_FILE by src.browser_server).
+    A server that doesn't answer within a second is skipped.
+    """
+    setting = os.getenv("BROWSER_SERVER", "")
+    if not setting or setting == "0":
+        return None
+    address = setting
+    if setting in ("1", "auto"):
+        state_file = os.getenv("BROWSER_SERVER_STATE_FILE", DEFAULT_BROWSER_SERVER_STATE)
+        try:
+            with open(state_file, 'r') as f:
+                address = json.load(f)["address"]
+        except (OSError, ValueError, KeyError):
+            logger.info(f"No browser server running ({state_file} not found), launching Chrome locally.")
+            return None
+    if devtools_version(address, timeout=1) is None:
+        logger.warning(f"Browser server at {address} is not responding, launching Chrome locally.")
+        return None
+    return address
+
+
+def attach_chrome(address, download_dir=None):
+    """
+    Attaches to the Chrome of the browser server at address and returns a driver switched to a fresh tab.
+    quit() on that driver closes the tabs it opened and stops its chromedriver; the browser keeps running.
+    """
+    import undetected_chromedriver as uc
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    class AttachedChrome(webdriver.Chrome):
+        def quit(self):
+            try:
+                for handle in self.window_handles:
+                    if handle not in self.server_handles:
+                        self.switch_to.window(handle)
+                        self.close()
+            except Exception as e:
+                logger.debug(f"Could not close attached tabs: {e}")
+            finally:
+                self.service.stop()
+
+    options = webdriver.ChromeOptions()
+    options.debugger_address = address
+    driver_bin = os.environ.get("CHROMEDRIVER_BIN")
+    version_main = get_chrome_version(os.environ.get("CHROME_BIN"))
+
+    tracer = get_tracer()
+    with tracer.span("chrome.attach"):
+        with _launch_lock:
+            cached = cached_driver(driver_bin, version_main) if os.getenv("CHROME_DRIVER_CACHE", "1") != "0" else None
+            # The same patched chromedriver uc.Chrome would use, so pages don't see the automation markers.
+            patcher = uc.Patcher(executable_path=cached or driver_bin, version_main=version_main or 0)
+            patcher.auto()
+            driver = AttachedChrome(service=Service(executable_path=patcher.executable_path), options=options)
+        driver.server_handles = set(driver.window_handles)
+        driver.switch_to.new_window('tab')
+    tracer.set("chrome.mode", "attached")
+    logger.info(f"Attached to browser server at {address}.")
+    if download_dir:
+        set_download_dir(driver, download_dir)
+    return driver
+
+
+def set_download_dir(driver, download_dir):
+    """
+    Points downloads of an already running driver to download_dir.
+    Needed when the driver was not launched with the matching download prefs.
+    """
+    try:
+        driver.execute_cdp_cmd("Page.setDownloadBehavior", {"behavior": "allow", "downloadPath": download_dir})
+    except Exception as e:
+        logger.warning(f"Could not set download directory via CDP: {e}")
+
+
+def block_patterns(site):
+    """
+    Returns the Network.setBlockedURLs patterns for a site profile plus BLOCK_EXTRA_PATTERNS (comma separated).
+    """
+    patterns = [pattern for kind in SITE_BLOCK_PROFILES.get(site, ()) for pattern in RESOURCE_BLOCK_PATTERNS[kind]]
+    patterns += list(THIRD_PARTY_BLOCK_PATTERNS)
+    patterns += [pattern.strip() for pattern in os.getenv("BLOCK_EXTRA_PATTERNS", "").split(",") if pattern.strip()]
+    return patterns
+
+
+def apply_request_blocking(driver, site):
+    """
+    Blocks non-essential requests (per SITE_BLOCK_PROFILES) in the current tab. BLOCK_RESOURCES=0 turns it off
+    (and clears a block list set earlier in the same tab).
+    """
+    patterns = block_patterns(site) if os.getenv("BLOCK_RESOURCES", "1") != "0" else []
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+        if patterns:
+            logger.info(f"Blocking {len(patterns)} URL pattern(s) for {site}.")
+    except Exception as e:
+        logger.warning(f"Could not set up request blocking: {e}")
+
+
+def record_page_stats(driver, name):
+    """
+    Adds transferred bytes and resource count of the current page to the run trace and returns the stats.
+    Comparing runs with BLOCK_RESOURCES=0 and 1 shows what the blocking saves.
+    """
+    try:
+        stats = driver.execute_script(PAGE_STATS_SCRIPT) or {}
+    except Exception as e:
+        logger.debug(f"Could not read page stats: {e}")
+        return {}
+    tracer = get_tracer()
+    tracer.count("page.transfer_bytes", stats.get("transfer_bytes") or 0)
+    tracer.count("page.resources", stats.get("resources") or 0)
+    if stats.get("load_ms") is not None:
+        tracer.set(f"page.{name}.load_ms", stats["load_ms"])
+    logger.info(f"Page {name}: {stats.get('resources')} resources, {(stats.get('transfer_bytes') or 0) / 1024:.0f} KB, load {stats.get('load_ms')} ms.")
+    return stats
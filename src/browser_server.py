@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import logging
+import argparse
+import threading
+import subprocess
+import urllib.request
+from dotenv import load_dotenv
+from src.browser import (
+    USER_AGENT, LEAN_FLAGS, DEFAULT_BROWSER_SERVER_STATE, window_size, devtools_version
+)
+
+DEFAULT_PORT = 9222
+DEFAULT_PROFILE_DIR = os.path.join(".profiles", "server")
+CHROME_CANDIDATES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser")
+STARTUP_TIMEOUT = 30
+BLANK_URLS = ("about:blank", "chrome://newtab/")
+
+
+class BrowserServer:
+    """
+    Keeps one Chrome with a DevTools endpoint on 127.0.0.1 running between runs. Runs with BROWSER_SERVER=auto
+    attach to it (see browser.attach_chrome) and work in fresh tabs, so they skip the Chrome launch and find the
+    Zeit and Tolino cookies of the last run in its profile.
+    Every BROWSER_SERVER_CHECK_SECONDS the endpoint is checked: after BROWSER_SERVER_MAX_FAILURES failed checks in a row
+    (or if Chrome exited) it is restarted. Tabs left open longer than BROWSER_SERVER_TAB_TTL_MINUTES (e.g. by a killed run)
+    are closed, and an idle browser is restarted after BROWSER_SERVER_MAX_AGE_HOURS to give back the memory it accumulated.
+    """
+    def __init__(self, port=None, profile_dir=None, state_file=None):
+        self.port = port or int(os.getenv("BROWSER_SERVER_PORT", str(DEFAULT_PORT)))
+        self.address = f"127.0.0.1:{self.port}"
+        self.profile_dir = os.path.abspath(profile_dir or os.getenv("BROWSER_SERVER_PROFILE", DEFAULT_PROFILE_DIR))
+        self.state_file = state_file or os.getenv("BROWSER_SERVER_STATE_FILE", DEFAULT_BROWSER_SERVER_STATE)
+        self.check_interval = float(os.getenv("BROWSER_SERVER_CHECK_SECONDS", "30"))
+        self.max_failures = int(os.getenv("BROWSER_SERVER_MAX_FAILURES", "3"))
+        self.tab_ttl = float(os.getenv("BROWSER_SERVER_TAB_TTL_MINUTES", "30")) * 60
+        self.max_age = float(os.getenv("BROWSER_SERVER_MAX_AGE_HOURS", "24")) * 3600
+        self.logger = logging.getLogger(__name__)
+        self.stop_event = threading.Event()
+        self.process = None
+        self.started = 0
+        self.failures = 0
+        self.restarts = 0
+        self.tabs = {}
+
+    def chrome_binary(self):
+        chrome_bin = os.environ.get("CHROME_BIN")
+        if chrome_bin:
+            return chrome_bin
+        for candidate in CHROME_CANDIDATES:
+            if shutil.which(candidate):
+                return candidate
+        raise RuntimeError("No Chrome binary found. Set CHROME_BIN.")
+
+    def command(self):
+        width, height = window_size()
+        command = [
+            self.chrome_binary(),
+            f"--remote-debugging-port={self.port}",
+            "--remote-debugging-address=127.0.0.1",
+            f"--user-data-dir={self.profile_dir}",
+            "--disable-blink-features=AutomationControlled",
+            "--no-sandbox",
+            "--disable-gpu",
+            "--no-default-browser-check",
+            f"--window-size={width},{height}",
+            f"--user-agent={USER_AGENT}",
+        ] + list(LEAN_FLAGS)
+        if os.getenv("CHROME_HEADLESS", "0") == "1":
+            command.append("--headless=new")
+        return command + ["about:blank"]
+
+    def write_state(self):
+        try:
+            tmp_path = self.state_file + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"address": self.address, "pid": self.process.pid, "started": self.started}, f)
+            os.replace(tmp_path, self.state_file)
+        except Exception as e:
+            self.logger.warning(f"Failed to write browser server state: {e}")
+
+    def start(self):
+        if devtools_version(self.address) is not None:
+            raise RuntimeError(f"Port {self.port} is already in use by another DevTools endpoint.")
+        os.makedirs(self.profile_dir, exist_ok=True)
+        self.process = subprocess.Popen(self.command(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        deadline = time.time() + STARTUP_TIMEOUT
+        while time.time() < deadline:
+            info = devtools_version(self.address)
+            if info:
+                self.started = time.time()
+                self.failures = 0
+                self.tabs = {}
+                self.write_state()
+                self.logger.info(f"Browser server ready at {self.address} ({info.get('Browser')}, pid {self.process.pid}).")
+                return
+            if self.process.poll() is not None:
+                break
+            time.sleep(0.2)
+        self.terminate()
+        raise RuntimeError(f"Chrome did not open its DevTools endpoint on port {self.port}.")
+
+    def terminate(self):
+        if not self.process:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.logger.warning("Chrome did not exit, killing it.")
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def restart(self, reason):
+        self.restarts += 1
+        self.logger.warning(f"Restarting Chrome ({reason}), restart {self.restarts}.")
+        self.terminate()
+        self.start()
+
+    def request(self, path, method="GET"):
+        request = urllib.request.Request(f"http://{self.address}{path}", method=method)
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.read()
+
+    def recycle_tabs(self):
+        """
+        Closes tabs that have been open longer than the tab TTL and makes sure a blank tab is left, so Chrome
+        doesn't exit when a run closes its last tab. Returns True if only blank tabs are open (nothing is attached).
+        """
+        now = time.time()
+        pages = [tab for tab in json.loads(self.request("/json/list")) if tab.get("type") == "page"]
+        self.tabs = {tab["id"]: self.tabs.get(tab["id"], now) for tab in pages}
+        blank = [tab for tab in pages if tab.get("url") in BLANK_URLS]
+        if not blank:
+            self.request("/json/new?about:blank", method="PUT")
+        # One blank tab is kept; everything else (also blank tabs, e.g. of a run killed before it navigated) expires.
+        for tab in pages[:]:
+            if blank and tab is blank[0]:
+                continue
+            if now - self.tabs[tab["id"]] > self.tab_ttl:
+                self.logger.info(f"Closing tab left open for {(now - self.tabs[tab['id']]) / 60:.0f} min: {tab.get('url')}")
+                self.request(f"/json/close/{tab['id']}")
+                del self.tabs[tab["id"]]
+                pages.remove(tab)
+        return all(tab.get("url") in BLANK_URLS for tab in pages)
+
+    def check(self):
+        """
+        One health check: restarts Chrome if it exited or stopped answering, recycles tabs otherwise.
+        """
+        if not self.process:
+            self.restart("not running")
+            return
+        if self.process.poll() is not None:
+            self.restart(f"exited with code {self.process.returncode}")
+            return
+        if devtools_version(self.address, timeout=5) is None:
+            self.failures += 1
+            self.logger.warning(f"DevTools endpoint not responding ({self.failures}/{self.max_failures}).")
+            if self.failures >= self.max_failures:
+                self.restart("not responding")
+            return
+        self.failures = 0
+        try:
+            idle = self.recycle_tabs()
+        except Exception as e:
+            self.logger.warning(f"Could not recycle tabs: {e}")
+            return
+        if idle and self.max_age and time.time() - self.started > self.max_age:
+            self.restart(f"idle and older than {self.max_age / 3600:g}h")
+
+    def stop(self, *args):
+        self.logger.info("Stopping browser server...")
+        self.stop_event.set()
+
+    def serve(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.start()
+        try:
+            while not self.stop_event.wait(self.check_interval):
+                try:
+                    self.check()
+                except Exception as e:
+                    self.logger.error(f"Health check failed: {e}")
+        finally:
+            self.terminate()
+            if os.path.exists(self.state_file):
+                os.remove(self.state_file)
+        return 0
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Keep a Chrome running for runs to attach to (BROWSER_SERVER=auto)")
+    parser.add_argument("--port", type=int, default=None, help=f"DevTools port (default: BROWSER_SERVER_PORT or {DEFAULT_PORT})")
+    parser.add_argument("--profile-dir", default=None, help=f"User data dir (default: BROWSER_SERVER_PROFILE or {DEFAULT_PROFILE_DIR})")
+    args = parser.parse_args()
+
+    try:
+        return BrowserServer(port=args.port, profile_dir=args.profile_dir).serve()
+    except RuntimeError as e:
+        logging.getLogger(__name__).error(str(e))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import signal
+import logging
+import statistics
+import subprocess
+import threading
+from datetime import datetime, timezone
+from src.ledger import RunLedger, parse_issue_date
+from src.issue_probe import IssueProbe
+from src.session_cache import SessionCache
+from src.scheduler import get_scheduler
+
+DEFAULT_STATE_FILE = ".release_window.json"
+DEFAULT_PERIOD_DAYS = 7
+# Monday 1970-01-05 00:00 UTC; release times are learned as offsets into the period from here.
+EPOCH = 4 * 86400
+MIN_SAMPLES = 3
+MAX_SAMPLES = 26
+WINDOW_PADDING = 30 * 60
+JITTER = 0.1
+
+
+def quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1) + 0.5))]
+
+
+class ReleaseModel:
+    """
+    When new issues usually appear, as an offset into the release period (learned from the issue dates, one week
+    for DIE ZEIT). Precise samples come from the daemon's own observations (the issue changed between two probes).
+    Issues it has not observed fall back to the first time the ledger saw them, which is only an upper bound
+    (e.g. the cron time). The window spans the 10th to 90th percentile of the samples plus WINDOW_PADDING.
+    """
+    def __init__(self, observations, first_seen):
+        self.period = self.learn_period(set(observations) | set(first_seen))
+        samples = {issue_id: (obs["first_seen"] + obs["last_miss"]) / 2 for issue_id, obs in observations.items()}
+        for issue_id, seen in first_seen.items():
+            samples.setdefault(issue_id, seen)
+        self.samples = sorted(samples.values())[-MAX_SAMPLES:]
+        self.ready = len(self.samples) >= MIN_SAMPLES
+        if not self.ready:
+            return
+
+        # Offsets are taken relative to the first sample, so a window around the period boundary doesn't wrap.
+        self.reference = (self.samples[0] - EPOCH) % self.period
+        relative = [((sample - EPOCH - self.reference + self.period / 2) % self.period) - self.period / 2 for sample in self.samples]
+        self.expected = self.reference + statistics.median(relative)
+        self.start = self.reference + quantile(relative, 0.1) - WINDOW_PADDING
+        self.end = self.reference + quantile(relative, 0.9) + WINDOW_PADDING
+
+    @staticmethod
+    def learn_period(issue_ids):
+        dates = sorted(parse_issue_date(issue_id) for issue_id in issue_ids)[-MAX_SAMPLES:]
+        gaps = [(later - earlier).days for earlier, later in zip(dates, dates[1:]) if later > earlier]
+        return (statistics.median(gaps) if gaps else DEFAULT_PERIOD_DAYS) * 86400
+
+    def window_after(self, timestamp):
+        """
+        Returns (start, expected, end) of the first release window whose expected time lies after timestamp.
+        """
+        cycle = math.floor((timestamp - EPOCH - self.expected) / self.period) + 1
+        base = EPOCH + cycle * self.period
+        return base + self.start, base + self.expected, base + self.end
+
+    def describe(self):
+        if not self.ready:
+            return f"not enough samples yet ({len(self.samples)}/{MIN_SAMPLES})"
+        start, expected, end = self.window_after(time.time())
+        fmt = lambda ts: datetime.fromtimestamp(ts, timezone.utc).strftime("%a %H:%M")
+        return f"{fmt(start)} - {fmt(end)} UTC, expected {fmt(expected)} ({len(self.samples)} samples, period {self.period / 86400:g} days)"
+
+
+class ServeDaemon:
+    """
+    Stays resident and checks for a new issue with the HTTP probe (no browser while idle). Polls every
+    SERVE_MIN_POLL_MINUTES inside the learned release window. Before the window the interval halves towards its start,
+    capped at SERVE_MAX_POLL_MINUTES. After the window it backs off up to SERVE_LATE_POLL_MINUTES. While Zeit is in
+    backoff after a WAF block (see RequestScheduler), it waits for the backoff to end.
+    A new issue is delivered by a regular run of src.main in a child process, so Chrome only lives as long as that run.
+    """
+    def __init__(self, run_args=(), state_file=None):
+        self.run_args = list(run_args)
+        self.download_url = os.getenv("ZEIT_DOWNLOAD_URL")
+        self.state_file = state_file or os.getenv("SERVE_STATE_FILE", DEFAULT_STATE_FILE)
+        self.min_poll = float(os.getenv("SERVE_MIN_POLL_MINUTES", "2")) * 60
+        self.max_poll = float(os.getenv("SERVE_MAX_POLL_MINUTES", "180")) * 60
+        self.late_poll = float(os.getenv("SERVE_LATE_POLL_MINUTES", "20")) * 60
+        self.idle_poll = float(os.getenv("SERVE_IDLE_POLL_MINUTES", "30")) * 60
+        self.fallback_interval = float(os.getenv("SERVE_FALLBACK_MINUTES", "60")) * 60
+        self.keepalive_interval = float(os.getenv("SERVE_KEEPALIVE_MINUTES", "360")) * 60
+        self.logger = logging.getLogger(__name__)
+        self.stop_event = threading.Event()
+
+        self.ledger = RunLedger()
+        self.zeit_cache = SessionCache("zeit", os.getenv("ZEIT_USER"), os.getenv("ZEIT_PASSWORD"))
+        self.state = self.load_state()
+        self.failures = 0
+        self.last_run = 0
+        self.last_keepalive = 0
+
+    def load_state(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r') as f:
+                    state = json.load(f)
+                state.setdefault("observations", {})
+                return state
+            except Exception as e:
+                self.logger.warning(f"Release window state unreadable, starting empty: {e}")
+        return {"observations": {}}
+
+    def save_state(self):
+        try:
+            tmp_path = self.state_file + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp_path, self.state_file)
+        except Exception as e:
+            self.logger.warning(f"Failed to save release window state: {e}")
+
+    def model(self):
+        return ReleaseModel(self.state["observations"], self.ledger.first_seen())
+
+    def current_release(self):
+        """
+        Best guess of when the current issue appeared.
+        """
+        issue_id = self.state.get("current_issue")
+        observation = self.state["observations"].get(issue_id)
+        if observation:
+            return (observation["first_seen"] + observation["last_miss"]) / 2
+        return self.ledger.first_seen().get(issue_id) or time.time()
+
+    def probe(self):
+        """
+        Probes the epaper page and records when the issue changed. Returns the current issue or None.
+        """
+        now = time.time()
+        probe = IssueProbe(self.download_url, cookies=self.zeit_cache.get_cookies())
+        issue_id = probe.probe()
+        if not issue_id:
+            return None
+        # Cookies the site renewed are written back, so the Zeit session stays alive between full runs.
+        self.zeit_cache.update_cookies(probe.refreshed_cookies())
+        previous = self.state.get("current_issue")
+        # Only a change between two regular polls is precise enough to learn from (not one across a long downtime).
+        if previous and issue_id != previous and now - self.state.get("last_probe", 0) <= 2 * self.max_poll:
+            observations = self.state["observations"]
+            observations[issue_id] = {"first_seen": now, "last_miss": self.state["last_probe"]}
+            for old in sorted(observations, key=lambda key: observations[key]["first_seen"])[:-MAX_SAMPLES]:
+                del observations[old]
+            self.logger.info(f"New issue {issue_id} appeared within the last {(now - self.state['last_probe']) / 60:.0f} min.")
+        self.state["current_issue"] = issue_id
+        self.state["last_probe"] = now
+        self.save_state()
+        return issue_id
+
+    def deliver(self, reason):
+        """
+        Runs src.main once in a child process. Returns True if it succeeded.
+        """
+        self.logger.info(f"Starting delivery run ({reason})...")
+        start = time.time()
+        scheduler = get_scheduler()
+        scheduler.save()
+        result = subprocess.run([sys.executable, "-m", "src.main"] + self.run_args)
+        # Picks up the WAF blocks the run ran into.
+        scheduler.refresh()
+        self.last_run = time.time()
+        if result.returncode == 0:
+            self.failures = 0
+            self.logger.info(f"Delivery run finished in {time.time() - start:.0f}s.")
+            return True
+        self.failures += 1
+        self.logger.error(f"Delivery run failed with exit code {result.returncode} (failure {self.failures} in a row).")
+        return False
+
+    def next_delay(self, window, now):
+        if self.failures:
+            delay = min(self.min_poll * 2 ** self.failures, self.max_poll)
+        elif not window:
+            delay = self.idle_poll
+        elif now < window[0]:
+            delay = min(max((window[0] - now) / 2, self.min_poll), self.max_poll)
+        elif now <= window[2]:
+            delay = self.min_poll
+        else:
+            delay = min(max((now - window[2]) / 4, self.min_poll), self.late_poll)
+        # Jitter, so the checks don't hit the site at fixed times.
+        return delay * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def check(self):
+        """
+        One poll: probe, deliver if needed, and return the seconds until the next poll.
+        """
+        now = time.time()
+        issue_id = self.probe()
+        model = self.model()
+        # Look for the window after the current issue's release, so an early release isn't mistaken for the next one.
+        window = model.window_after(self.current_release() + model.period / 2) if model.ready else None
+
+        if issue_id and not self.ledger.is_complete(issue_id):
+            self.deliver(f"issue {issue_id} not delivered yet")
+        elif not issue_id and get_scheduler().next_attempt(self.download_url) > now:
+            self.logger.info("Zeit is in backoff after a WAF block, no full run before it ends.")
+        elif not issue_id:
+            # Without an answer from the probe only a full run can tell; not more often than SERVE_FALLBACK_MINUTES
+            # inside the window and every SERVE_MAX_POLL_MINUTES outside of it.
+            inside = window and window[0] <= now
+            if now - self.last_run >= (self.fallback_interval if inside or not window else self.max_poll):
+                self.deliver("probe inconclusive")
+            else:
+                self.logger.info("Probe inconclusive, next full run later.")
+        # Never poll again before a WAF backoff is over.
+        backoff = get_scheduler().next_attempt(self.download_url) - time.time()
+        return max(self.next_delay(window, time.time()), backoff)
+
+    def keep_sessions_warm(self):
+        """
+        Refreshes the Tolino API tokens of all accounts every SERVE_KEEPALIVE_MINUTES (API mode only; the webreader
+        session in web mode is not refreshed). The Zeit session is kept alive by probe(), which sends the cached
+        cookies and writes back the ones the site renews.
+        """
+        if os.getenv("TOLINO_UPLOAD_MODE", "web") != "api" or time.time() - self.last_keepalive < self.keepalive_interval:
+            return
+        from src.fanout import load_tolino_accounts, build_uploader
+        self.last_keepalive = time.time()
+        for account in load_tolino_accounts():
+            uploader = build_uploader(account, None, "api")
+            try:
+                if not uploader.login():
+                    self.logger.warning(f"Tolino API session of {account['user']} could not be refreshed.")
+            finally:
+                uploader.close()
+
+    def stop(self, *args):
+        self.logger.info("Stopping after the current check...")
+        self.stop_event.set()
+
+    def serve(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.logger.info(f"Serving. Release window: {self.model().describe()}")
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    delay = self.check()
+                    self.keep_sessions_warm()
+                except Exception as e:
+                    self.logger.error(f"Check failed: {e}")
+                    delay = self.late_poll
+                self.logger.info(f"Next check in {delay / 60:.1f} min.")
+                self.stop_event.wait(delay)
+        finally:
+            self.ledger.close()
+        return 0
@@ -0,0 +1,162 @@
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+# inotify(7) event masks
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+EVENT_HEADER = struct.Struct("iIII")
+PARTIAL_SUFFIX = ".crdownload"
+PROGRESS_LOG_INTERVAL = 2.0
+
+
+class DownloadWatcher:
+    """
+    Waits for Chrome to finish a download into download_dir.
+    On Linux it is woken by inotify events (rename of the .crdownload file to its final name, or its deletion
+    on cancel); elsewhere it falls back to listing the directory every poll_interval seconds.
+    Call start() before triggering the download so files that already existed are ignored.
+    """
+    def __init__(self, download_dir, extension=".epub", poll_interval=0.25):
+        self.download_dir = download_dir
+        self.extension = extension
+        self.poll_interval = poll_interval
+        self.logger = logging.getLogger(__name__)
+
+        self.existing = set()
+        self.inotify_fd = None
+        self.finished_file = None
+        self.cancelled = False
+        self.partial_seen = False
+
+    def start(self):
+        self.existing = set(os.listdir(self.download_dir))
+        self.inotify_fd = self._open_inotify()
+        self.start_time = time.time()
+        return self
+
+    def _open_inotify(self):
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+            if libc.inotify_add_watch(fd, self.download_dir.encode(), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except Exception as e:
+            self.logger.info(f"inotify unavailable, polling download directory instead: {e}")
+            return None
+
+    def _read_events(self, timeout):
+        readable, _, _ = select.select([self.inotify_fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            data = os.read(self.inotify_fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + name_len].rstrip(b"\0").decode(errors="replace")
+            offset += EVENT_HEADER.size + name_len
+
+            if name.endswith(PARTIAL_SUFFIX):
+                if mask & IN_CREATE:
+                    self.partial_seen = True
+                elif mask & IN_DELETE:
+                    # Chrome renames the partial file on success; deleting it means the download was cancelled.
+                    self.cancelled = True
+            elif name.endswith(self.extension) and mask & (IN_MOVED_TO | IN_CLOSE_WRITE):
+                if not os.path.exists(os.path.join(self.download_dir, name + PARTIAL_SUFFIX)):
+                    self.finished_file = name
+
+    def _scan_directory(self):
+        names = set(os.listdir(self.download_dir))
+        # Partials from before start() (e.g. left by a crashed run) don't belong to this download.
+        partials = [n for n in names - self.existing if n.endswith(PARTIAL_SUFFIX)]
+        if partials:
+            self.partial_seen = True
+            return
+
+        new_files = [n for n in names - self.existing if n.endswith(self.extension)]
+        if new_files:
+            self.finished_file = max(new_files, key=lambda n: os.path.getmtime(os.path.join(self.download_dir, n)))
+        elif self.partial_seen:
+            # Partial file vanished without a finished file appearing.
+            self.cancelled = True
+
+    def partial_bytes(self):
+        total = 0
+        for name in os.listdir(self.download_dir):
+            if name.endswith(PARTIAL_SUFFIX):
+                try:
+                    total += os.path.getsize(os.path.join(self.download_dir, name))
+                except OSError:
+                    pass
+        return total
+
+    def wait(self, timeout=60):
+        """
+        Blocks until the download finished, was cancelled or timed out.
+        Returns the full path of the file Chrome saved, or None.
+        """
+        deadline = self.start_time + timeout
+        last_report = self.start_time
+        last_bytes = 0
+
+        try:
+            while time.time() < deadline:
+                if self.inotify_fd is not None:
+                    self._read_events(min(self.poll_interval * 4, max(deadline - time.time(), 0)))
+                else:
+                    time.sleep(self.poll_interval)
+                    self._scan_directory()
+
+                if self.finished_file:
+                    path = os.path.join(self.download_dir, self.finished_file)
+                    size = os.path.getsize(path)
+                    elapsed = max(time.time() - self.start_time, 0.001)
+                    self.logger.info(
+                        f"Download finished: {self.finished_file} ({size / 1e6:.1f} MB in {elapsed:.1f}s, {size / 1e6 / elapsed:.2f} MB/s)"
+                    )
+                    return path
+
+                if self.cancelled:
+                    self.logger.error("Download was cancelled by the browser.")
+                    return None
+
+                now = time.time()
+                if now - last_report >= PROGRESS_LOG_INTERVAL:
+                    if self.inotify_fd is not None:
+                        # Safety net in case an event was missed (e.g. inotify queue overflow).
+                        self._scan_directory()
+                    received = self.partial_bytes()
+                    if received:
+                        rate = (received - last_bytes) / (now - last_report)
+                        self.logger.info(f"Downloading... {received / 1e6:.1f} MB received ({rate / 1e6:.2f} MB/s)")
+                    last_report, last_bytes = now, received
+            return None
+        finally:
+            self.close()
+
+    def close(self):
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
@@ -0,0 +1,169 @@
+import io
+import os
+import sys
+import shutil
+import logging
+import zipfile
+import argparse
+import importlib.util
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from src.epub_store import validate_epub
+
+# Tolino Vision / Shine (6", 300 ppi) screen in portrait.
+DEFAULT_TARGET_SIZE = "1072x1448"
+DEFAULT_JPEG_QUALITY = 70
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+COPY_CHUNK_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def optimization_enabled():
+    return os.getenv("EPUB_OPTIMIZE", "0") == "1"
+
+
+def load_settings():
+    """
+    Returns the optimizer settings from EPUB_TARGET_SIZE (WIDTHxHEIGHT), EPUB_GRAYSCALE, EPUB_JPEG_QUALITY
+    and EPUB_OPTIMIZE_WORKERS (default: one per core).
+    """
+    width, height = os.getenv("EPUB_TARGET_SIZE", DEFAULT_TARGET_SIZE).lower().split("x")
+    return {
+        "max_size": (int(width), int(height)),
+        "grayscale": os.getenv("EPUB_GRAYSCALE", "1") != "0",
+        "quality": int(os.getenv("EPUB_JPEG_QUALITY", str(DEFAULT_JPEG_QUALITY))),
+        "workers": int(os.getenv("EPUB_OPTIMIZE_WORKERS", "0")) or os.cpu_count() or 1,
+    }
+
+
+def transcode_image(data, extension, max_size, grayscale, quality):
+    """
+    Downscales one image to fit max_size and re-encodes it in its original format (so hrefs and media types in
+    the manifest stay valid). Returns the new bytes, or None if the image should be kept as it is.
+    Runs in a worker process.
+    """
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as image:
+        if getattr(image, "is_animated", False):
+            return None
+        # For JPEGs this lets the decoder scale down by up to 8x before the image is fully decoded.
+        image.draft("L" if grayscale else "RGB", max_size)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        if grayscale:
+            image = image.convert("LA" if has_alpha else "L")
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        image.thumbnail(max_size, Image.LANCZOS)
+
+        output = io.BytesIO()
+        if extension in (".jpg", ".jpeg"):
+            if image.mode in ("LA", "RGBA"):
+                image = image.convert(image.mode[:-1])
+            image.save(output, "JPEG", quality=quality, optimize=True, progressive=True)
+        elif extension == ".png":
+            image.save(output, "PNG", optimize=True)
+        else:
+            image.save(output, "WEBP", quality=quality)
+    result = output.getvalue()
+    return result if len(result) < len(data) else None
+
+
+def optimize_epub(path, output_path=None, max_size=None, grayscale=None, quality=None, workers=None):
+    """
+    Rewrites the EPUB at path with downscaled, re-encoded images; replaces path unless output_path is given.
+    Entries are streamed from the old ZIP into the new one; images are transcoded in a process pool with at most
+    two per worker in flight, so memory use does not grow with the size of the EPUB. 'mimetype' stays the first,
+    uncompressed entry. The result is only kept if it is smaller and passes validate_epub (which includes the manifest check).
+    Returns {'before', 'after', 'images', 'transcoded'} or None if the file was left unchanged.
+    """
+    # Pillow is optional (and only imported by the workers); without it the stage is skipped.
+    if importlib.util.find_spec("PIL") is None:
+        logger.warning("Pillow is not installed, skipping EPUB optimization.")
+        return None
+    settings = load_settings()
+    max_size = max_size or settings["max_size"]
+    grayscale = settings["grayscale"] if grayscale is None else grayscale
+    quality = quality or settings["quality"]
+    workers = workers or settings["workers"]
+
+    tmp_path = (output_path or path) + ".optimizing"
+    stats = {"before": os.path.getsize(path), "after": None, "images": 0, "transcoded": 0}
+    try:
+        with zipfile.ZipFile(path) as source, zipfile.ZipFile(tmp_path, "w") as target, \
+                ProcessPoolExecutor(max_workers=workers) as pool:
+            target.writestr(zipfile.ZipInfo("mimetype", date_time=source.getinfo("mimetype").date_time), source.read("mimetype"), zipfile.ZIP_STORED)
+            in_flight = deque()
+
+            def write_next_image():
+                info, data, future = in_flight.popleft()
+                result = future.result()
+                if result:
+                    stats["transcoded"] += 1
+                # Re-encoded images don't compress any further.
+                target.writestr(clone_info(info, zipfile.ZIP_STORED), result or data)
+
+            for info in source.infolist():
+                if info.filename == "mimetype" or info.is_dir():
+                    continue
+                extension = os.path.splitext(info.filename)[1].lower()
+                if extension in IMAGE_EXTENSIONS:
+                    stats["images"] += 1
+                    data = source.read(info)
+                    in_flight.append((info, data, pool.submit(transcode_image, data, extension, max_size, grayscale, quality)))
+                    if len(in_flight) >= workers * 2:
+                        write_next_image()
+                    continue
+                with source.open(info) as reader, target.open(clone_info(info, info.compress_type), "w", force_zip64=info.file_size > 0x7FFFFFFF) as writer:
+                    shutil.copyfileobj(reader, writer, COPY_CHUNK_SIZE)
+            while in_flight:
+                write_next_image()
+
+        problem = validate_epub(tmp_path)
+        stats["after"] = os.path.getsize(tmp_path)
+        if problem or stats["after"] >= stats["before"]:
+            logger.info(f"Keeping original {os.path.basename(path)} ({problem or 'optimized file is not smaller'}).")
+            os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, output_path or path)
+    except Exception as e:
+        logger.error(f"EPUB optimization of {os.path.basename(path)} failed: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    logger.info(
+        f"Optimized {os.path.basename(path)}: {stats['transcoded']}/{stats['images']} images re-encoded, "
+        f"{stats['before'] / 1e6:.1f} MB -> {stats['after'] / 1e6:.1f} MB."
+    )
+    return stats
+
+
+def clone_info(info, compress_type):
+    """
+    Copies name and timestamp of an entry, so an optimized issue is byte-identical across runs (store dedupe).
+    """
+    clone = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    clone.compress_type = compress_type
+    clone.external_attr = info.external_attr
+    return clone
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Downscale and re-encode the images of an EPUB for e-ink readers")
+    parser.add_argument("epub")
+    parser.add_argument("output", nargs="?", help="Write here instead of replacing the input file")
+    parser.add_argument("--size", default=None, help=f"Target WIDTHxHEIGHT (default: {DEFAULT_TARGET_SIZE})")
+    parser.add_argument("--color", action="store_true", help="Keep colors instead of converting to grayscale")
+    parser.add_argument("--quality", type=int, default=None, help=f"JPEG/WebP quality (default: {DEFAULT_JPEG_QUALITY})")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    max_size = tuple(int(n) for n in args.size.lower().split("x")) if args.size else None
+    stats = optimize_epub(args.epub, args.output, max_size=max_size, grayscale=False if args.color else None, quality=args.quality, workers=args.workers)
+    return 0 if stats else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+import os
+import re
+import json
+import time
+import shutil
+import zlib
+import hashlib
+import logging
+import zipfile
+import posixpath
+import threading
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from src.ledger import ISSUE_DATE_FORMAT
+
+DEFAULT_STORE_DIR = "store"
+HASH_CHUNK_SIZE = 1024 * 1024
+CRC_CHUNK_SIZE = 256 * 1024
+
+CONTAINER_PATH = "META-INF/container.xml"
+CONTAINER_NS = "{urn:oasis:names:tc:opendocument:xmlns:container}"
+OPF_NS = "{http://www.idpf.org/2007/opf}"
+DC_NS = "{http://purl.org/dc/elements/1.1/}"
+ZIP_MAGIC = b"PK\x03\x04"
+# e.g. 'DIE ZEIT 33/2026'
+ISSUE_NUMBER_PATTERN = re.compile(r"\b(\d{1,2})\s*/\s*(\d{4})\b")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_package(archive):
+    """
+    Returns (path, parsed root element) of the package document named in META-INF/container.xml.
+    Raises KeyError, AttributeError or ET.ParseError if it is missing or unreadable.
+    """
+    container = ET.fromstring(archive.read(CONTAINER_PATH))
+    opf_path = container.find(f".//{CONTAINER_NS}rootfile").get("full-path")
+    return opf_path, ET.fromstring(archive.read(opf_path))
+
+
+def manifest_problem(archive, package=None):
+    """
+    Returns the first manifest item of the package document that is missing from archive, or None.
+    """
+    try:
+        opf_path, package = package or read_package(archive)
+    except (KeyError, AttributeError, ET.ParseError) as e:
+        return f"package document unreadable ({e})"
+    names = set(archive.namelist())
+    base = posixpath.dirname(opf_path)
+    for item in package.iter(f"{OPF_NS}item"):
+        href = item.get("href", "").split("#")[0]
+        if href and "://" not in href and posixpath.normpath(posixpath.join(base, href)) not in names:
+            return f"manifest item {href} missing"
+    return None
+
+
+def package_metadata(package):
+    """
+    Title, identifier, issue date (DD.MM.YYYY, like the ledger's issue ids) and issue number ('33/2026')
+    from the OPF metadata; missing fields are None.
+    """
+    metadata = package.find(f"{OPF_NS}metadata")
+    if metadata is None:
+        return {"title": None, "identifier": None, "issue_id": None, "issue_number": None}
+    def text(element):
+        return (element.text or "").strip() or None if element is not None else None
+
+    unique_id = package.get("unique-identifier")
+    identifiers = metadata.findall(f"{DC_NS}identifier")
+    identifier = next((element for element in identifiers if element.get("id") == unique_id), identifiers[0] if identifiers else None)
+    title = text(metadata.find(f"{DC_NS}title"))
+
+    issue_id = None
+    date = text(metadata.find(f"{DC_NS}date"))
+    if date:
+        try:
+            issue_id = datetime.strptime(date[:10], "%Y-%m-%d").strftime(ISSUE_DATE_FORMAT)
+        except ValueError:
+            pass
+
+    # EPUB 3 collection position or calibre series index, else the number in the title.
+    issue_number = None
+    for meta in metadata.iter(f"{OPF_NS}meta"):
+        if meta.get("property") == "group-position" or meta.get("name") == "calibre:series_index":
+            issue_number = (meta.text or meta.get("content") or "").strip() or None
+    match = ISSUE_NUMBER_PATTERN.search(title or "")
+    if match and not issue_number:
+        issue_number = f"{int(match.group(1))}/{match.group(2)}"
+    return {"title": title, "identifier": text(identifier), "issue_id": issue_id, "issue_number": issue_number}
+
+
+def inspect_epub(path):
+    """
+    Validates a downloaded EPUB in one streaming pass and reads its metadata. Returns (problem, metadata):
+    problem is None for a valid file, otherwise the reason; metadata (see package_metadata) is None if the
+    package document could not be read.
+    Only the ZIP central directory and the small XML files are held in memory; every entry is decompressed in
+    chunks to check its CRC, so memory use doesn't depend on the file size.
+    Checks: ZIP signature (an HTML error page is reported as such), 'mimetype' first and 'application/epub+zip',
+    readable container and package document, all manifest items present, all CRCs.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(len(ZIP_MAGIC))
+        if head != ZIP_MAGIC:
+            return ("an HTML page, not an EPUB" if head.lstrip().startswith(b"<") else "not a ZIP file"), None
+
+        with zipfile.ZipFile(path) as archive:
+            infos = archive.infolist()
+            if not infos or infos[0].filename != "mimetype":
+                return "mimetype is not the first entry", None
+            if archive.read("mimetype").strip() != b"application/epub+zip":
+                return "wrong mimetype", None
+            try:
+                package = read_package(archive)
+            except (KeyError, AttributeError, ET.ParseError) as e:
+                return f"package document unreadable ({e})", None
+            metadata = package_metadata(package[1])
+            problem = manifest_problem(archive, package)
+            if problem:
+                return problem, metadata
+
+            for info in infos:
+                try:
+                    # ZipExtFile checks the CRC once the entry is read to its end.
+                    with archive.open(info) as reader:
+                        while reader.read(CRC_CHUNK_SIZE):
+                            pass
+                except (zipfile.BadZipFile, zlib.error):
+                    return f"CRC mismatch in {info.filename}", metadata
+                except (NotImplementedError, RuntimeError) as e:
+                    # Unsupported compression method or an encrypted entry
+                    return f"{info.filename} unreadable ({e})", metadata
+    except (zipfile.BadZipFile, OSError, EOFError, NotImplementedError, RuntimeError) as e:
+        return f"not a readable ZIP ({e})", None
+    return None, metadata
+
+
+def validate_epub(path):
+    """
+    Returns None if path is a valid EPUB (see inspect_epub), otherwise the reason.
+    """
+    return inspect_epub(path)[0]
+
+
+def inspect_in_background(path):
+    """
+    Starts inspect_epub(path) in a worker thread and returns its Future. CRC checks and decompression release
+    the GIL, so the check runs alongside whatever the run does next (e.g. the Tolino login).
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="epub-validate")
+    return _executor.submit(inspect_epub, path)
+
+
+class EpubStore:
+    """
+    Content-addressed store for downloaded EPUBs.
+    Files live under objects/<sha[:2]>/<sha>/<original filename>; index.json maps issue date -> hash, package
+    identifier -> hash and hash -> size, download time, issue dates and upload status per destination (plain dict lookups).
+    Adding a file whose content is already stored just drops the duplicate.
+    """
+    def __init__(self, root=None):
+        self.root = os.path.abspath(root or os.getenv("EPUB_STORE_DIR", DEFAULT_STORE_DIR))
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.index_path = os.path.join(self.root, "index.json")
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index = self.load_index()
+
+    def load_index(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    index = json.load(f)
+                index.setdefault("issues", {})
+                index.setdefault("objects", {})
+                if "identifiers" not in index:
+                    # Indexes written before the identifier map existed
+                    index["identifiers"] = {
+                        entry["metadata"]["identifier"]: sha for sha, entry in index["objects"].items()
+                        if entry.get("metadata", {}).get("identifier")
+                    }
+                return index
+            except Exception as e:
+                self.logger.warning(f"Store index unreadable, starting empty: {e}")
+        return {"issues": {}, "objects": {}, "identifiers": {}}
+
+    def save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+    def add(self, path, issue_id=None, metadata=None):
+        """
+        Moves path into the store and returns its SHA-256. Duplicates of stored content are deleted.
+        metadata (see inspect_epub) is kept with the object.
+        """
+        sha = sha256_file(path)
+        with self.lock:
+            entry = self.index["objects"].get(sha)
+            if entry and os.path.exists(self.path_for(sha)):
+                self.logger.info(f"{os.path.basename(path)} is identical to stored object {sha[:12]}. Dropping duplicate.")
+                os.remove(path)
+            else:
+                target_dir = os.path.join(self.objects_dir, sha[:2], sha)
+                os.makedirs(target_dir, exist_ok=True)
+                filename = os.path.basename(path)
+                shutil.move(path, os.path.join(target_dir, filename))
+                entry = self.index["objects"].setdefault(sha, {"issues": [], "uploads": {}})
+                entry.update({"filename": filename, "size": os.path.getsize(os.path.join(target_dir, filename)), "downloaded_at": time.time()})
+                self.logger.info(f"Stored {filename} as {sha[:12]} ({entry['size']} bytes).")
+
+            if metadata:
+                entry["metadata"] = metadata
+                if metadata.get("identifier"):
+                    self.index["identifiers"][metadata["identifier"]] = sha
+            if issue_id:
+                self._link(sha, issue_id)
+            self.save_index()
+        return sha
+
+    def link_issue(self, sha, issue_id):
+        """
+        Records that issue_id is (also) the stored object sha, e.g. for the issue date from the EPUB metadata.
+        """
+        with self.lock:
+            if sha in self.index["objects"]:
+                self._link(sha, issue_id)
+                self.save_index()
+
+    def _link(self, sha, issue_id):
+        self.index["issues"][issue_id] = sha
+        if issue_id not in self.index["objects"][sha]["issues"]:
+            self.index["objects"][sha]["issues"].append(issue_id)
+
+    def path_for(self, sha):
+        entry = self.index["objects"].get(sha)
+        if not entry:
+            return None
+        return os.path.join(self.objects_dir, sha[:2], sha, entry["filename"])
+
+    def lookup_issue(self, issue_id):
+        """
+        Returns (sha, entry) for an issue date, or (None, None).
+        """
+        sha = self.index["issues"].get(issue_id)
+        return (sha, self.index["objects"].get(sha)) if sha else (None, None)
+
+    def lookup_identifier(self, identifier, exclude=None):
+        """
+        Returns the hash of another stored object with the same package identifier (the same issue packaged
+        again, e.g. with a new timestamp), or None.
+        """
+        sha = self.index["identifiers"].get(identifier) if identifier else None
+        return sha if sha != exclude else None
+
+    def issues_for(self, sha):
+        return list(self.index["objects"].get(sha, {}).get("issues", []))
+
+    def is_uploaded(self, sha, destination):
+        entry = self.index["objects"].get(sha, {})
+        return entry.get("uploads", {}).get(destination, {}).get("status") == "uploaded"
+
+    def mark_upload(self, sha, destination, uploaded):
+        with self.lock:
+            entry = self.index["objects"].get(sha)
+            if not entry:
+                return
+            entry["uploads"][destination] = {"status": "uploaded" if uploaded else "failed", "time": time.time()}
+            self.save_index()
+
+    def pending_uploads(self, destinations):
+        """
+        Returns the hashes (oldest first) that have not been uploaded to every destination yet.
+        """
+        pending = [
+            sha for sha, entry in self.index["objects"].items()
+            if any(not self.is_uploaded(sha, dest) for dest in destinations)
+        ]
+        return sorted(pending, key=lambda sha: self.index["objects"][sha].get("downloaded_at", 0))
+
+    def prune(self, max_bytes=None, max_age_days=None, keep=()):
+        """
+        Evicts objects older than max_age_days, then the oldest objects until the store fits in max_bytes.
+        Hashes in keep (e.g. still pending uploads) are never evicted.
+        """
+        with self.lock:
+            objects = self.index["objects"]
+            candidates = sorted((sha for sha in objects if sha not in keep), key=lambda sha: objects[sha].get("downloaded_at", 0))
+            total = sum(entry.get("size", 0) for entry in objects.values())
+            cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+            evicted = []
+
+            for sha in candidates:
+                too_old = cutoff is not None and objects[sha].get("downloaded_at", 0) < cutoff
+                too_big = max_bytes is not None and total > max_bytes
+                if not too_old and not too_big:
+                    continue
+                total -= objects[sha].get("size", 0)
+                shutil.rmtree(os.path.join(self.objects_dir, sha[:2], sha), ignore_errors=True)
+                for issue_id in objects[sha].get("issues", []):
+                    if self.index["issues"].get(issue_id) == sha:
+                        del self.index["issues"][issue_id]
+                identifier = objects[sha].get("metadata", {}).get("identifier")
+                if identifier and self.index["identifiers"].get(identifier) == sha:
+                    del self.index["identifiers"][identifier]
+                del objects[sha]
+                evicted.append(sha)
+
+            if evicted:
+                self.save_index()
+                self.logger.info(f"Pruned {len(evicted)} object(s) from store, {total / 1e6:.1f} MB left.")
+            return evicted
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from src.session_cache import SessionCache
+
+DEFAULT_PROFILE_ROOT = ".profiles"
+
+logger = logging.getLogger(__name__)
+
+
+def load_tolino_accounts():
+    """
+    Returns the Tolino recipients as a list of {'user', 'password'} dicts.
+    Read from TOLINO_ACCOUNTS (JSON list) or the JSON file named by TOLINO_ACCOUNTS_FILE,
+    falling back to the single TOLINO_USER/TOLINO_PASSWORD pair.
+    """
+    raw = os.getenv("TOLINO_ACCOUNTS")
+    accounts_file = os.getenv("TOLINO_ACCOUNTS_FILE")
+    if not raw and accounts_file:
+        with open(accounts_file, 'r') as f:
+            raw = f.read()
+
+    if raw:
+        accounts = []
+        for entry in json.loads(raw):
+            user = entry.get("user") or entry.get("username")
+            password = entry.get("password")
+            if not user or not password:
+                raise ValueError("Every Tolino account needs 'user' and 'password'.")
+            accounts.append({"user": user, "password": password})
+        return accounts
+
+    if os.getenv("TOLINO_USER") and os.getenv("TOLINO_PASSWORD"):
+        return [{"user": os.getenv("TOLINO_USER"), "password": os.getenv("TOLINO_PASSWORD")}]
+    return []
+
+
+def profile_dir_for(user, profile_root=DEFAULT_PROFILE_ROOT):
+    return os.path.abspath(os.path.join(profile_root, "tolino-" + hashlib.sha256(user.encode()).hexdigest()[:12]))
+
+
+def build_uploader(account, login_url, mode="web", profile_dir=None):
+    """
+    Returns the uploader for one account: TolinoUploader (webreader in Chrome) for mode 'web',
+    TolinoCloudUploader (plain HTTP, no browser) for mode 'api'. Only the module of the chosen mode is imported,
+    so API mode never loads selenium.
+    """
+    if mode == "api":
+        from src.tolino_cloud import TolinoCloudUploader
+        return TolinoCloudUploader(
+            username=account["user"],
+            password=account["password"],
+            session_cache=SessionCache("tolino-api", account["user"], account["password"])
+        )
+    from src.tolino_uploader import TolinoUploader
+    return TolinoUploader(
+        username=account["user"],
+        password=account["password"],
+        login_url=login_url,
+        session_cache=SessionCache("tolino", account["user"], account["password"]),
+        profile_dir=profile_dir
+    )
+
+
+class FanOutUploader:
+    """
+    Uploads the same files to several Tolino accounts over a bounded worker pool.
+    In web mode every account runs in its own Chrome with its own user-data-dir and session cache, so logins never mix.
+    """
+    def __init__(self, accounts, login_url, parallelism=2, profile_root=DEFAULT_PROFILE_ROOT, mode="web"):
+        self.accounts = accounts
+        self.login_url = login_url
+        self.mode = mode
+        self.parallelism = max(1, parallelism)
+        self.profile_root = profile_root
+
+    def _upload_account(self, account, file_paths):
+        start = time.time()
+        uploader = build_uploader(account, self.login_url, self.mode, profile_dir=profile_dir_for(account["user"], self.profile_root))
+        try:
+            results = uploader.upload_many(file_paths)
+        except Exception as e:
+            logger.error(f"Upload to {account['user']} crashed: {e}")
+            results = {path: False for path in file_paths}
+        return {"results": results, "confirmed": dict(uploader.confirmations), "duration": time.time() - start}
+
+    def upload(self, files_by_user):
+        """
+        Uploads files_by_user[user] to each account (accounts with nothing to upload are skipped).
+        Returns {user: {'results': {file_path: bool}, 'confirmed': {file_path: bool}, 'duration': seconds}}.
+        """
+        jobs = [account for account in self.accounts if files_by_user.get(account["user"])]
+        if not jobs:
+            return {}
+        logger.info(f"Fan-out upload to {len(jobs)} account(s), parallelism {self.parallelism}...")
+        with ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="tolino") as pool:
+            futures = {account["user"]: pool.submit(self._upload_account, account, files_by_user[account["user"]]) for account in jobs}
+            outcome = {user: future.result() for user, future in futures.items()}
+
+        for user, result in outcome.items():
+            ok = sum(1 for uploaded in result["results"].values() if uploaded)
+            logger.info(f"  {user}: {ok}/{len(result['results'])} uploaded in {result['duration']:.1f}s")
+        return outcome
@@ -0,0 +1,139 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import requests
+from urllib.parse import urlparse, unquote
+from requests.adapters import HTTPAdapter
+from src.browser import USER_AGENT
+from src.tracing import get_tracer
+from src.scheduler import get_scheduler, is_waf_block
+
+CHUNK_SIZE = 256 * 1024
+
+
+class HttpDownloader:
+    """
+    Streams files over a pooled requests.Session that carries the cookies of a logged-in browser.
+    Partial downloads are kept as .part files and resumed with HTTP Range requests.
+    Every request takes a slot from the host's request budget (see RequestScheduler); `rate` overrides its rate.
+    """
+    def __init__(self, user_agent=None, max_attempts=3, timeout=30, rate=None):
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.rate = rate
+        self.scheduler = get_scheduler()
+        self.logger = logging.getLogger(__name__)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = user_agent or USER_AGENT
+        self.tracer = get_tracer()
+
+    def load_cookies(self, cookies):
+        """
+        Copies browser cookies (Selenium or CDP dicts) into the HTTP session.
+        """
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie["name"], cookie["value"],
+                domain=cookie.get("domain", ""), path=cookie.get("path", "/")
+            )
+
+    def get_filename(self, response, url):
+        disposition = response.headers.get("Content-Disposition", "")
+        match = re.search(r"filename\*=UTF-8''([^;]+)", disposition) or re.search(r'filename="?([^";]+)"?', disposition)
+        if match:
+            name = unquote(match.group(1))
+        else:
+            name = unquote(os.path.basename(urlparse(url).path)) or "download"
+        name = os.path.basename(name.strip())
+        if not name.lower().endswith(".epub"):
+            name += ".epub"
+        return name
+
+    def download(self, url, download_dir, referer=None):
+        """
+        Downloads url into download_dir and returns the final file path, or None if it failed.
+        The file is only moved into place once its size matches the announced length.
+        """
+        part_path = os.path.join(download_dir, f".{hashlib.sha1(url.encode()).hexdigest()[:16]}.part")
+        headers = {"Referer": referer} if referer else {}
+
+        for attempt in range(1, self.max_attempts + 1):
+            if attempt > 1:
+                self.tracer.count("retries.http_download")
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            request_headers = dict(headers)
+            if offset:
+                request_headers["Range"] = f"bytes={offset}-"
+                self.logger.info(f"Resuming download at byte {offset} (attempt {attempt})...")
+
+            if not self.scheduler.acquire(url, rate=self.rate):
+                self.logger.error("HTTP download postponed, the host is in backoff after a WAF block.")
+                return None
+
+            try:
+                start = time.time()
+                with self.session.get(url, headers=request_headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code == 429 or (response.status_code in (403, 503) and is_waf_block(response.text)):
+                        self.logger.error(f"HTTP download blocked by WAF (HTTP {response.status_code}).")
+                        self.scheduler.record(url, blocked=True)
+                        return None
+                    self.scheduler.record(url, latency=time.time() - start)
+                    if response.status_code == 416:
+                        # Range not satisfiable: the part file is stale or already complete, start over.
+                        if os.path.exists(part_path):
+                            os.remove(part_path)
+                        continue
+                    response.raise_for_status()
+
+                    content_type = response.headers.get("Content-Type", "")
+                    if "text/html" in content_type:
+                        self.logger.error(f"Expected an EPUB but got {content_type} (session not accepted?).")
+                        return None
+
+                    if response.status_code == 206:
+                        mode = 'ab'
+                        total = self._total_from_content_range(response)
+                    else:
+                        mode = 'wb'
+                        offset = 0
+                        length = response.headers.get("Content-Length")
+                        total = int(length) if length else None
+
+                    filename = self.get_filename(response, url)
+                    with open(part_path, mode) as f:
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            if chunk:
+                                f.write(chunk)
+                                self.tracer.count("bytes.http_download", len(chunk))
+
+                size = os.path.getsize(part_path)
+                if total is not None and size != total:
+                    self.logger.warning(f"Incomplete download: {size} of {total} bytes.")
+                    continue
+
+                final_path = os.path.join(download_dir, filename)
+                os.replace(part_path, final_path)
+                self.logger.info(f"Downloaded {size} bytes via HTTP: {final_path}")
+                return final_path
+
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                self.logger.warning(f"Download interrupted (attempt {attempt}/{self.max_attempts}): {e}")
+            except Exception as e:
+                self.logger.error(f"HTTP download failed: {e}")
+                return None
+
+        self.logger.error(f"HTTP download failed after {self.max_attempts} attempts.")
+        return None
+
+    def _total_from_content_range(self, response):
+        match = re.search(r"/(\d+)$", response.headers.get("Content-Range", ""))
+        return int(match.group(1)) if match else None
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,131 @@
+import os
+import re
+import json
+import time
+import logging
+import requests
+from src.browser import USER_AGENT
+from src.scheduler import get_scheduler, is_waf_block
+
+DEFAULT_STATE_FILE = ".probe_state.json"
+
+ISSUE_LINK_PATTERN = re.compile(r'<a[^>]+href="([^"]+)"[^>]*>(?:(?!</a>).)*?aktuellen\s+ausgabe', re.IGNORECASE | re.DOTALL)
+DATE_PATTERN = re.compile(r'(\d{2}\.\d{2}\.\d{4})')
+
+
+class IssueProbe:
+    """
+    Reads the current issue date from the epaper page with a plain HTTP request, without starting Chrome.
+    Uses cached session cookies and conditional requests (ETag / Last-Modified), so an unchanged page costs one 304.
+    probe() returns None whenever the answer is uncertain; the caller then falls back to the browser.
+    """
+    def __init__(self, download_url, cookies=None, state_file=DEFAULT_STATE_FILE, timeout=5):
+        self.download_url = download_url
+        self.state_file = state_file
+        self.timeout = timeout
+        self.logger = logging.getLogger(__name__)
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        for cookie in cookies or []:
+            self.session.cookies.set(
+                cookie["name"], cookie["value"],
+                domain=cookie.get("domain", ""), path=cookie.get("path", "/")
+            )
+        self.sent = {(c.name, c.domain, c.path): c.value for c in self.session.cookies}
+
+    def load_state(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r') as f:
+                    return json.load(f)
+            except:
+                return {}
+        return {}
+
+    def save_state(self, state):
+        try:
+            tmp_path = self.state_file + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.state_file)
+        except Exception as e:
+            self.logger.warning(f"Failed to save probe state: {e}")
+
+    def refreshed_cookies(self):
+        """
+        Returns the cookies the server set or renewed during probe() (Set-Cookie), in the session cache format.
+        """
+        return [
+            {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path, "expires": c.expires or -1}
+            for c in self.session.cookies
+            if c.expires or self.sent.get((c.name, c.domain, c.path)) != c.value
+        ]
+
+    def extract_issue_id(self, html, final_url):
+        match = ISSUE_LINK_PATTERN.search(html)
+        if match:
+            date_match = DATE_PATTERN.search(match.group(1))
+            if date_match:
+                return date_match.group(1)
+        date_match = DATE_PATTERN.search(final_url)
+        return date_match.group(1) if date_match else None
+
+    def probe(self):
+        """
+        Returns the current issue date (e.g. '06.08.2026') or None if it could not be determined.
+        """
+        state = self.load_state()
+        headers = {}
+        if state.get("url") == self.download_url:
+            if state.get("etag"):
+                headers["If-None-Match"] = state["etag"]
+            if state.get("last_modified"):
+                headers["If-Modified-Since"] = state["last_modified"]
+
+        # The probe is only a shortcut, so it doesn't wait out a backoff.
+        scheduler = get_scheduler()
+        if scheduler.next_attempt(self.download_url) > time.time() or not scheduler.acquire(self.download_url):
+            self.logger.info("Issue probe skipped (host in backoff after a WAF block).")
+            return None
+
+        try:
+            response = self.session.get(self.download_url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.logger.info(f"Issue probe inconclusive (request failed: {e}).")
+            return None
+        finally:
+            self.session.close()
+
+        blocked = response.status_code == 429 or is_waf_block(response.text)
+        scheduler.record(self.download_url, latency=response.elapsed.total_seconds() if not blocked else None, blocked=blocked)
+
+        if response.status_code == 304 and state.get("issue_id"):
+            self.logger.info(f"Issue probe: page unchanged (304), current issue {state['issue_id']}.")
+            return state["issue_id"]
+
+        if response.status_code != 200:
+            self.logger.info(f"Issue probe inconclusive (HTTP {response.status_code}).")
+            return None
+
+        text = response.text
+        if blocked:
+            self.logger.info("Issue probe inconclusive (blocked by WAF).")
+            return None
+        if 'id="username"' in text or "login" in response.url.split("?")[0].lower():
+            self.logger.info("Issue probe inconclusive (not logged in).")
+            return None
+
+        issue_id = self.extract_issue_id(text, response.url)
+        if not issue_id:
+            self.logger.info("Issue probe inconclusive (no issue date on page).")
+            return None
+
+        self.save_state({
+            "url": self.download_url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "issue_id": issue_id,
+        })
+        self.logger.info(f"Issue probe: current issue {issue_id}.")
+        return issue_id
@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+ISSUE_DATE_FORMAT = "%d.%m.%Y"
+DEFAULT_LEDGER_FILE = "ledger.sqlite"
+LEGACY_HISTORY_FILE = "download_history.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stages (
+    issue_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    started_at REAL,
+    finished_at REAL,
+    duration REAL,
+    detail TEXT,
+    data TEXT,
+    PRIMARY KEY (issue_id, stage)
+);
+CREATE TABLE IF NOT EXISTS issues (
+    issue_id TEXT PRIMARY KEY,
+    downloaded INTEGER NOT NULL DEFAULT 0,
+    uploaded INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+-- Only not-yet-uploaded issues are in this index, so "what's missing" never scans the full history.
+CREATE INDEX IF NOT EXISTS issues_missing ON issues (issue_id) WHERE uploaded = 0;
+"""
+
+# Stages of one issue, in run order. A rerun resumes after the last completed one.
+STAGES = ("probe", "login", "resolve_link", "download", "validate", "optimize", "upload", "confirm")
+STAGE_FLAGS = {"download": "downloaded", "upload": "uploaded"}
+
+
+def parse_issue_date(issue_id):
+    return datetime.strptime(issue_id, ISSUE_DATE_FORMAT).date()
+
+
+class LedgerLockedError(Exception):
+    pass
+
+
+class RunLedger:
+    """
+    SQLite record of every issue and stage (see STAGES): status, attempts, timestamps, duration and an optional
+    JSON checkpoint (e.g. the resolved EPUB URL) that lets a rerun skip completed work.
+    Every state transition is a single IMMEDIATE transaction. Replaces download_history.json, which is
+    imported once when the database is created.
+    """
+    def __init__(self, path=None, legacy_history_file=LEGACY_HISTORY_FILE):
+        self.path = path or os.getenv("LEDGER_FILE", DEFAULT_LEDGER_FILE)
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+
+        is_new = not os.path.exists(self.path)
+        self.conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(stages)")]
+        if "data" not in columns:
+            self.conn.execute("ALTER TABLE stages ADD COLUMN data TEXT")
+        if is_new and legacy_history_file:
+            self.import_legacy_history(legacy_history_file)
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def import_legacy_history(self, history_file):
+        if not os.path.exists(history_file):
+            return
+        try:
+            with open(history_file, 'r') as f:
+                history = json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Could not import {history_file}: {e}")
+            return
+
+        issues = set(history.get("issues", []))
+        if history.get("last_issue_id"):
+            issues.add(history["last_issue_id"])
+        finished_at = history.get("last_download_time") or time.time()
+        with self.transaction() as conn:
+            for issue_id in issues:
+                # The old history only knew "processed" issues; treat them as fully delivered.
+                for stage in STAGE_FLAGS:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO stages (issue_id, stage, status, attempts, finished_at, detail) VALUES (?, ?, 'done', 1, ?, 'imported')",
+                        (issue_id, stage, finished_at)
+                    )
+                conn.execute(
+                    "INSERT OR IGNORE INTO issues (issue_id, downloaded, uploaded, updated_at) VALUES (?, 1, 1, ?)",
+                    (issue_id, finished_at)
+                )
+        self.logger.info(f"Imported {len(issues)} issue(s) from {history_file}.")
+
+    def begin(self, issue_id, stage):
+        with self.transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO issues (issue_id, updated_at) VALUES (?, ?)", (issue_id, time.time()))
+            conn.execute(
+                """INSERT INTO stages (issue_id, stage, status, attempts, started_at) VALUES (?, ?, 'running', 1, ?)
+                   ON CONFLICT (issue_id, stage) DO UPDATE SET
+                       status = 'running', attempts = attempts + 1, started_at = excluded.started_at,
+                       finished_at = NULL, duration = NULL, detail = NULL""",
+                (issue_id, stage, time.time())
+            )
+
+    def _finish(self, issue_id, stage, status, detail, data=None):
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT started_at FROM stages WHERE issue_id = ? AND stage = ?", (issue_id, stage)).fetchone()
+            if not row:
+                conn.execute("INSERT OR IGNORE INTO issues (issue_id, updated_at) VALUES (?, ?)", (issue_id, now))
+                conn.execute(
+                    "INSERT INTO stages (issue_id, stage, status, attempts, started_at) VALUES (?, ?, 'running', 1, ?)",
+                    (issue_id, stage, now)
+                )
+                started_at = now
+            else:
+                started_at = row["started_at"] or now
+            conn.execute(
+                "UPDATE stages SET status = ?, finished_at = ?, duration = ?, detail = ?, data = ? WHERE issue_id = ? AND stage = ?",
+                (status, now, now - started_at, detail, json.dumps(data) if data is not None else None, issue_id, stage)
+            )
+            flag = STAGE_FLAGS.get(stage)
+            if flag:
+                conn.execute(f"UPDATE issues SET {flag} = ?, updated_at = ? WHERE issue_id = ?", (1 if status == "done" else 0, now, issue_id))
+
+    def complete(self, issue_id, stage, detail=None, data=None):
+        self._finish(issue_id, stage, "done", detail, data)
+
+    def fail(self, issue_id, stage, detail=None):
+        self._finish(issue_id, stage, "failed", detail)
+
+    def fail_running(self, issue_id, detail=None):
+        """
+        Marks every stage of issue_id that is still 'running' (e.g. after a crash) as failed.
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT stage FROM stages WHERE issue_id = ? AND status = 'running'", (issue_id,)).fetchall()
+        for row in rows:
+            self.fail(issue_id, row["stage"], detail)
+
+    def stage(self, issue_id, stage):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM stages WHERE issue_id = ? AND stage = ?", (issue_id, stage)).fetchone()
+        return dict(row) if row else None
+
+    def checkpoint(self, issue_id, stage):
+        """
+        Returns the data saved with a completed stage, or None if the stage is not done.
+        """
+        record = self.stage(issue_id, stage)
+        if not record or record["status"] != "done":
+            return None
+        return json.loads(record["data"]) if record["data"] else {}
+
+    def resume_point(self, issue_id):
+        """
+        Returns the stage a rerun has to start at: the one after the last completed stage (None if all are done).
+        """
+        with self.lock:
+            done = {row["stage"] for row in self.conn.execute("SELECT stage FROM stages WHERE issue_id = ? AND status = 'done'", (issue_id,))}
+        last = max((STAGES.index(stage) for stage in done if stage in STAGES), default=-1)
+        return STAGES[last + 1] if last + 1 < len(STAGES) else None
+
+    def _flag(self, issue_id, flag):
+        with self.lock:
+            row = self.conn.execute(f"SELECT {flag} FROM issues WHERE issue_id = ?", (issue_id,)).fetchone()
+        return bool(row and row[0])
+
+    def is_downloaded(self, issue_id):
+        return self._flag(issue_id, "downloaded")
+
+    def is_complete(self, issue_id):
+        return self._flag(issue_id, "uploaded")
+
+    def missing(self):
+        """
+        Returns [(issue_id, downloaded)], oldest first, for issues that have not been uploaded yet.
+        Served from the partial index, so the cost depends on the number of open issues, not on the history length.
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT issue_id, downloaded FROM issues INDEXED BY issues_missing WHERE uploaded = 0").fetchall()
+        return sorted(((row["issue_id"], bool(row["downloaded"])) for row in rows), key=lambda row: parse_issue_date(row[0]))
+
+    def latest(self):
+        """
+        Returns the newest issue id in the ledger (uploaded or not), or None if it is empty.
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT issue_id FROM issues").fetchall()
+        return max((row["issue_id"] for row in rows), key=parse_issue_date, default=None)
+
+    def first_seen(self):
+        """
+        Returns {issue_id: time the first stage of the issue started}. Imported legacy issues have no start time and are left out.
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT issue_id, MIN(started_at) AS first FROM stages WHERE started_at IS NOT NULL GROUP BY issue_id").fetchall()
+        return {row["issue_id"]: row["first"] for row in rows}
+
+    def history(self, limit=20):
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM stages ORDER BY COALESCE(finished_at, started_at) DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+class RunLock:
+    """
+    Exclusive file lock that keeps overlapping runs (cron + manual dispatch) apart.
+    """
+    def __init__(self, path=None):
+        self.path = path or (os.getenv("LEDGER_FILE", DEFAULT_LEDGER_FILE) + ".lock")
+        self.handle = None
+
+    def acquire(self):
+        self.handle = open(self.path, 'w')
+        try:
+            fcntl.flock(self.handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.handle.close()
+            self.handle = None
+            raise LedgerLockedError(f"Another run holds {self.path}")
+        self.handle.write(str(os.getpid()))
+        self.handle.flush()
+        return self
+
+    def release(self):
+        if self.handle:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the Zeit-Transfer run ledger")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("missing", help="Issues that are not yet uploaded")
+    status = sub.add_parser("status", help="Stages of one issue")
+    status.add_argument("issue_id")
+    history = sub.add_parser("history", help="Most recent stage records")
+    history.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    ledger = RunLedger()
+    if args.command == "missing":
+        rows = ledger.missing()
+        for issue_id, downloaded in rows:
+            print(f"{issue_id}\t{'downloaded, upload pending' if downloaded else 'not downloaded'}")
+        if not rows:
+            print("Nothing missing.")
+    elif args.command == "status":
+        print(f"resume at\t{ledger.resume_point(args.issue_id) or '-'}")
+        for stage in STAGES:
+            record = ledger.stage(args.issue_id, stage)
+            print(f"{stage}\t{json.dumps(record) if record else '-'}")
+    else:
+        for record in ledger.history(args.limit):
+            print(json.dumps(record))
+    ledger.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
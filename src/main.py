@@ -1,11 +1,24 @@
 import os
 import sys
+import time
 import logging
 import glob
+import shutil
 import argparse
+import tempfile
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from src.zeit_scraper import ZeitScraper
-from src.tolino_uploader import TolinoUploader
+from src.browser import launch_chrome
+from src.scheduler import get_scheduler
+from src.session_cache import SessionCache
+from src.issue_probe import IssueProbe
+from src.fanout import FanOutUploader, load_tolino_accounts, build_uploader
+from src.epub_store import EpubStore, inspect_epub, inspect_in_background
+from src.epub_optimizer import optimize_epub, optimization_enabled
+from src.ledger import RunLedger, RunLock, LedgerLockedError, parse_issue_date
+from src.tracing import get_tracer
+from src.resource_monitor import ResourceMonitor
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -13,83 +26,499 @@ logger = logging.getLogger("main")
 
 def load_environment():
     load_dotenv()
-    required_vars = ["ZEIT_USER", "ZEIT_PASSWORD", "ZEIT_LOGIN_URL", "ZEIT_DOWNLOAD_URL", "TOLINO_USER", "TOLINO_PASSWORD"]
+    required_vars = ["ZEIT_USER", "ZEIT_PASSWORD", "ZEIT_LOGIN_URL", "ZEIT_DOWNLOAD_URL"]
+    if not os.getenv("TOLINO_ACCOUNTS") and not os.getenv("TOLINO_ACCOUNTS_FILE"):
+        required_vars += ["TOLINO_USER", "TOLINO_PASSWORD"]
     missing = [var for var in required_vars if not os.getenv(var)]
     if missing:
         logger.error(f"Missing environment variables: {', '.join(missing)}")
         return False
     return True
 
-def get_latest_file(directory, extension=".epub"):
+class BrowserSession:
+    """
+    Owns the single Chrome instance shared by the Zeit download and the Tolino upload.
+    The browser is launched on first use, relaunched if a previous stage left it unresponsive,
+    and quit once at the end of the run.
+    """
+    def __init__(self, download_dir):
+        self.download_dir = os.path.abspath(download_dir)
+        self.driver = None
+        self.stages = 0
+        self.launch_durations = []
+
+    def is_alive(self):
+        if not self.driver:
+            return False
+        try:
+            self.driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def get_driver(self):
+        """
+        Returns the shared driver for the next stage, (re)launching Chrome if necessary.
+        """
+        self.stages += 1
+        if self.driver and not self.is_alive():
+            logger.warning("Browser session is no longer responsive. Relaunching Chrome...")
+            self._quit()
+
+        if not self.driver:
+            start = time.time()
+            self.driver = launch_chrome(download_dir=self.download_dir)
+            self.launch_durations.append(time.time() - start)
+            logger.info(f"Chrome launched in {self.launch_durations[-1]:.1f}s.")
+        return self.driver
+
+    def new_tab(self):
+        """
+        Returns the shared driver switched to a fresh tab, so a stage starts from a clean page.
+        """
+        driver = self.get_driver()
+        try:
+            driver.switch_to.new_window('tab')
+        except Exception as e:
+            logger.warning(f"Could not open new tab, reusing current one: {e}")
+        return driver
+
+    def _quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.warning(f"Failed to quit browser cleanly: {e}")
+        self.driver = None
+
+    def close(self):
+        if self.driver:
+            self._quit()
+        self.report()
+
+    def report(self):
+        launches = len(self.launch_durations)
+        if not launches:
+            return
+        avg_launch = sum(self.launch_durations) / launches
+        saved = max(self.stages - launches, 0) * avg_launch
+        logger.info(
+            f"Browser session: {launches} Chrome launch(es) for {self.stages} stage(s), "
+            f"avg launch {avg_launch:.1f}s, saved ~{saved:.1f}s of startup."
+        )
+
+def issue_already_processed(download_url, ledger, zeit_cache):
+    """
+    Probes the epaper page over HTTP. Returns True only if the probe is conclusive and the issue is already uploaded according to the ledger.
+    """
+    start = time.time()
+    with get_tracer().span("probe") as span:
+        issue_id = IssueProbe(download_url, cookies=zeit_cache.get_cookies()).probe()
+        span.set(issue_id=issue_id)
+    if issue_id and ledger.is_complete(issue_id):
+        logger.info(f"Issue {issue_id} already processed (probe took {time.time() - start:.2f}s). Exiting without starting Chrome.")
+        return True
+    if issue_id:
+        ledger.complete(issue_id, "probe")
+    return False
+
+def log_postponed(download_url):
+    retry_at = datetime.fromtimestamp(get_scheduler().next_attempt(download_url))
+    logger.info(f"Zeit is in backoff after a WAF block. Checking for a new issue again from {retry_at:%d.%m. %H:%M}.")
+
+def find_interrupted_download(ledger):
+    """
+    Returns the newest issue in the ledger if an earlier run resolved its EPUB link but did not finish the download,
+    otherwise None. It is resumed over HTTP without starting Chrome. Older interrupted issues are left to the normal
+    run, so a newer issue is never skipped for them.
+    """
+    issue_id = ledger.latest()
+    if issue_id and not ledger.is_downloaded(issue_id) and ledger.resume_point(issue_id) == "download":
+        return issue_id
+    return None
+
+def run_pipelined(scraper, uploader, session, prepare=None):
+    """
+    Runs the Zeit download (shared session) and the Tolino login (its own Chrome) concurrently.
+    The uploader only blocks on the download right before injecting the file.
+    prepare(epub_path) may return a different path to upload, or None to skip the upload.
+    Returns (epub_path, uploaded) where uploaded is None if no upload was attempted. If the Tolino side failed before
+    it asked for the file (e.g. the login), the download is still prepared and reported as a failed upload.
+    """
+    prepared = []
+    attempted = []
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="zeit") as executor:
+        download = executor.submit(lambda: scraper.download_latest_issue(driver=session.get_driver()))
+
+        def wait_for_download():
+            logger.info("Tolino ready for upload. Waiting for Zeit download...")
+            result = download.result()
+            logger.info(f"Zeit download finished after {time.time() - start:.1f}s.")
+            if not result or result in ("SKIPPED", "POSTPONED"):
+                return None
+            prepared.append(result)
+            path = prepare(result) if prepare else result
+            if path:
+                attempted.append(path)
+            return path
+
+        uploaded = uploader.upload_when_ready(wait_for_download)
+        epub_path = download.result()
+
+    if not epub_path or epub_path in ("SKIPPED", "POSTPONED"):
+        return epub_path, None
+    if not prepared:
+        logger.error("Tolino failed before the download was handed over. The issue is kept for the next run.")
+        path = prepare(epub_path) if prepare else epub_path
+        return epub_path, False if path else None
+    if not attempted:
+        return epub_path, None
+    logger.info(f"Pipelined time-to-upload: {time.time() - start:.1f}s.")
+    return epub_path, uploaded
+
+def get_pending_files(directory, extension=".epub"):
+    """
+    Returns all files left in directory by earlier runs, oldest first.
+    """
     files = glob.glob(os.path.join(directory, f"*{extension}"))
-    if not files:
-        return None
-    return max(files, key=os.path.getctime)
+    return sorted(files, key=os.path.getctime)
 
 def main():
     parser = argparse.ArgumentParser(description="Zeit Transfer Script")
-    parser.add_argument("--test", action="store_true", help="Run in test mode (ignore history check)")
+    parser.add_argument("command", nargs="?", choices=("run", "serve"), default="run", help="'run' once (default) or 'serve': stay resident and deliver new issues shortly after release")
+    parser.add_argument("--test", action="store_true", help="Run in test mode (ignore history check, keep the EPUB store untouched)")
+    parser.add_argument("--pipeline", action="store_true", help="Log in to Tolino while the Zeit issue is still downloading")
+    parser.add_argument("--backfill", nargs=2, metavar=("FROM", "TO"), type=parse_issue_date, help="Download all missing issues dated FROM to TO (DD.MM.YYYY)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Parallel downloads for --backfill (default: 2)")
+    parser.add_argument("--rate", type=float, default=0.5, help="Max requests per second for --backfill (default: 0.5)")
+    parser.add_argument("--parallel", type=int, default=None, help="Tolino accounts uploaded to in parallel (default: TOLINO_PARALLELISM or 2)")
     args = parser.parse_args()
 
     logger.info("Starting Zeit-Transfer...")
     
     if not load_environment():
         sys.exit(1)
+    # Read after load_environment so TOLINO_PARALLELISM may come from .env
+    if args.parallel is None:
+        args.parallel = int(os.getenv("TOLINO_PARALLELISM", "2"))
+
+    if args.command == "serve":
+        if args.test or args.backfill:
+            logger.error("serve cannot be combined with --test or --backfill.")
+            sys.exit(2)
+        from src.daemon import ServeDaemon
+        run_args = (["--pipeline"] if args.pipeline else []) + ["--parallel", str(args.parallel)]
+        sys.exit(ServeDaemon(run_args).serve())
 
     temp_dir = "temp"
+
+    lock = RunLock()
+    try:
+        lock.acquire()
+    except LedgerLockedError as e:
+        logger.warning(f"{e}. Another run is in progress, exiting.")
+        return
+    ledger = RunLedger()
+    tracer = get_tracer()
+    tracer.set("mode", "backfill" if args.backfill else ("pipeline" if args.pipeline else "sequential"))
     
-    # Initialize Scraper
-    scraper = ZeitScraper(
-        username=os.getenv("ZEIT_USER"),
-        password=os.getenv("ZEIT_PASSWORD"),
-        login_url=os.getenv("ZEIT_LOGIN_URL"),
-        download_url=os.getenv("ZEIT_DOWNLOAD_URL"),
-        download_dir=temp_dir,
-        test_mode=args.test
-    )
-
-    # 1. Download Step
-    epub_path = None
-    existing_file = get_latest_file(temp_dir)
-    
-    if existing_file:
-        logger.info(f"Found existing file in temp: {os.path.basename(existing_file)}. Skipping download and retrying upload.")
-        epub_path = existing_file
-    else:
-        # 2. Download latest issue
-        logger.info("Checking for new issue...")
-        epub_path = scraper.download_latest_issue()
+    zeit_cache = SessionCache("zeit", os.getenv("ZEIT_USER"), os.getenv("ZEIT_PASSWORD"))
+
+    tolino_login_url = os.getenv("TOLINO_LOGIN_URL", "https://webreader.mytolino.com/")
+    try:
+        accounts = load_tolino_accounts()
+    except (ValueError, OSError) as e:
+        logger.error(f"Invalid Tolino account configuration: {e}")
+        sys.exit(1)
+    if not accounts:
+        logger.error("No Tolino account configured.")
+        sys.exit(1)
+
+    upload_mode = os.getenv("TOLINO_UPLOAD_MODE", "web")
+    if upload_mode not in ("web", "api"):
+        logger.error(f"Unknown TOLINO_UPLOAD_MODE '{upload_mode}' (expected 'web' or 'api').")
+        sys.exit(1)
+
+    # A test run works on a scratch store, so its download and uploads never change the real upload state
+    store = EpubStore(root=tempfile.mkdtemp(prefix="zeit-test-store-")) if args.test else EpubStore()
+    destinations = {account["user"]: f"tolino:{account['user']}" for account in accounts}
+
+    session = BrowserSession(download_dir=temp_dir)
+    monitor = ResourceMonitor()
+    try:
+        # Files left in temp by older runs (or a crash) are adopted into the store first, if they are valid EPUBs
+        for path in get_pending_files(temp_dir) if not args.test else []:
+            problem, metadata = inspect_epub(path)
+            if problem:
+                logger.error(f"Leftover file is not a valid EPUB: {problem}. Discarding {os.path.basename(path)}.")
+                os.remove(path)
+                continue
+            store.add(path, metadata["issue_id"], metadata=metadata)
+
+        pending = store.pending_uploads(destinations.values()) if not args.backfill else []
+        interrupted = None
+        check_for_new_issue = not args.backfill
+        if check_for_new_issue and get_scheduler().next_attempt(os.getenv("ZEIT_DOWNLOAD_URL")) > time.time():
+            # Neither the probe nor Chrome would get through while Zeit is in backoff after a WAF block
+            log_postponed(os.getenv("ZEIT_DOWNLOAD_URL"))
+            if not pending:
+                return # A backoff is planned, not a failure
+            check_for_new_issue = False
+        if check_for_new_issue and not args.test:
+            # Resume an interrupted download from its checkpoint, otherwise do a cheap pre-check over HTTP.
+            # Both run before the scraper is imported, so a skipped run never loads selenium or starts Chrome.
+            # Stored issues still waiting for an upload don't replace this check: they are retried alongside.
+            interrupted = find_interrupted_download(ledger)
+            if not interrupted and issue_already_processed(os.getenv("ZEIT_DOWNLOAD_URL"), ledger, zeit_cache):
+                if not pending:
+                    return # Success exit for skipped
+                check_for_new_issue = False
+
+        # Samples Chrome and its subprocesses from here on; aborts the run if a configured limit is crossed
+        monitor.start()
+        with tracer.span("import"):
+            from src.zeit_scraper import ZeitScraper
+            scraper = ZeitScraper(
+                username=os.getenv("ZEIT_USER"),
+                password=os.getenv("ZEIT_PASSWORD"),
+                login_url=os.getenv("ZEIT_LOGIN_URL"),
+                download_url=os.getenv("ZEIT_DOWNLOAD_URL"),
+                download_dir=temp_dir,
+                ledger=ledger,
+                test_mode=args.test,
+                session_cache=zeit_cache,
+                http_download=os.getenv("ZEIT_HTTP_DOWNLOAD", "1") != "0"
+            )
+            uploader = build_uploader(accounts[0], tolino_login_url, upload_mode)
+        fanout = FanOutUploader(accounts, tolino_login_url, parallelism=args.parallel, mode=upload_mode) if len(accounts) > 1 else None
+        if fanout and args.pipeline:
+            logger.warning("--pipeline is not supported with several Tolino accounts. Running stages in sequence.")
+            args.pipeline = False
+
+        if args.backfill:
+            results = scraper.download_issues(
+                *args.backfill,
+                archive_url=os.getenv("ZEIT_ARCHIVE_URL"),
+                driver=session.get_driver(),
+                concurrency=args.concurrency,
+                rate=args.rate
+            )
+            if results is None:
+                logger.error("Backfill failed before any issue was downloaded.")
+                sys.exit(1)
+            for issue_id, path in results.items():
+                if not path:
+                    continue
+                problem, metadata = inspect_epub(path)
+                if problem:
+                    logger.error(f"Issue {issue_id} is not a valid EPUB: {problem}. Discarding {os.path.basename(path)}.")
+                    scraper.record_stage(issue_id, "validate", "failed", detail=problem)
+                    os.remove(path)
+                    results[issue_id] = None
+                    continue
+                sha = store.add(path, issue_id, metadata=metadata)
+                scraper.record_stage(issue_id, "validate", "done", detail=sha, data={"sha": sha, "metadata": metadata})
+            if any(path is None for path in results.values()):
+                logger.error("Backfill incomplete.")
+                sys.exit(1)
+            logger.info(f"Backfill downloaded {len(results)} issue(s). They are uploaded on the next run.")
+            return
+
+        # 1. Download Step
+        uploaded = {}
+        confirmed = {}
+        download_failed = False
+
+        if pending:
+            names = ", ".join(os.path.basename(store.path_for(sha)) for sha in pending)
+            logger.info(f"Found {len(pending)} stored issue(s) not yet uploaded: {names}. Retrying their upload.")
+        if check_for_new_issue:
+            # Every finished download is validated in the background right away: in pipeline mode alongside the
+            # Tolino login, otherwise alongside the scraper's teardown.
+            inspections = {}
+            scraper.on_download = lambda path: inspections.setdefault(path, inspect_in_background(path))
+            resumed = scraper.resume_download(interrupted, zeit_cache.get_cookies()) if interrupted else None
+            invalid = []
+
+            def ingest(path):
+                """
+                Validates a fresh download and moves it into the store, linked to the issue date of the page and the one
+                in its metadata. Returns the path to upload, or None if the file is invalid or this issue was already
+                uploaded (the same file, or the same package identifier in a different file).
+                """
+                issue_id = scraper.current_issue_id
+                scraper.record_stage(issue_id, "validate", "running")
+                with tracer.span("validate") as span:
+                    inspection = inspections.pop(path, None)
+                    problem, metadata = inspection.result() if inspection else inspect_epub(path)
+                    if metadata:
+                        span.set(title=metadata["title"], issue_number=metadata["issue_number"])
+                    if problem:
+                        span.fail(problem)
+                if problem:
+                    logger.error(f"Downloaded file is not a valid EPUB: {problem}. Discarding {os.path.basename(path)}.")
+                    scraper.record_stage(issue_id, "validate", "failed", detail=problem)
+                    scraper.record_stage(issue_id, "download", "failed", detail="invalid EPUB")
+                    os.remove(path)
+                    invalid.append(path)
+                    return None
+                if optimization_enabled():
+                    # Optional: shrink images for the e-reader. On any problem the original file is uploaded.
+                    scraper.record_stage(issue_id, "optimize", "running")
+                    with tracer.span("optimize") as span:
+                        stats = optimize_epub(path)
+                        if not stats:
+                            span.fail("kept original")
+                    if stats:
+                        tracer.count("bytes.optimize_saved", stats["before"] - stats["after"])
+                        scraper.record_stage(issue_id, "optimize", "done", detail=f"{stats['before']} -> {stats['after']} bytes", data=stats)
+                    else:
+                        scraper.record_stage(issue_id, "optimize", "failed", detail="kept original")
+                metadata = metadata or {}
+                if metadata.get("issue_id") and issue_id and metadata["issue_id"] != issue_id:
+                    logger.warning(f"Issue date in the EPUB ({metadata['issue_id']}) differs from the page ({issue_id}). Recording both.")
+                issue_ids = [known for known in dict.fromkeys((issue_id, metadata.get("issue_id"))) if known]
+
+                duplicate = store.lookup_identifier(metadata.get("identifier"))
+                if duplicate and all(store.is_uploaded(duplicate, dest) for dest in destinations.values()):
+                    logger.info(f"'{metadata.get('title')}' ({metadata['identifier']}) was already uploaded as {duplicate[:12]}. Dropping the new copy.")
+                    os.remove(path)
+                    sha = duplicate
+                else:
+                    sha = store.add(path, metadata=metadata or None)
+                for known in issue_ids:
+                    store.link_issue(sha, known)
+                    scraper.record_stage(known, "validate", "done", detail=sha, data={"sha": sha, "metadata": metadata})
+                # The new issue goes first, so older retries never hold it back
+                if sha in pending:
+                    pending.remove(sha)
+                pending.insert(0, sha)
+                if all(store.is_uploaded(sha, dest) for dest in destinations.values()):
+                    logger.info(f"Issue already uploaded ({sha[:12]}). Skipping upload.")
+                    # Nothing is uploaded below, so the issue has to be closed here; otherwise every later run
+                    # would take it for a new one and download it again.
+                    if not args.test:
+                        for known in issue_ids:
+                            ledger.complete(known, "upload", detail="already uploaded")
+                            ledger.complete(known, "confirm")
+                    return None
+                return store.path_for(sha)
+
+            # 2. Download latest issue
+            logger.info("Checking for new issue...")
+            if resumed:
+                epub_path, ok = resumed, None
+                ingest(resumed)
+            elif args.pipeline:
+                epub_path, ok = run_pipelined(scraper, uploader, session, prepare=ingest)
+            else:
+                epub_path = scraper.download_latest_issue(driver=session.get_driver())
+                ok = None
+                if epub_path and epub_path not in ("SKIPPED", "POSTPONED"):
+                    ingest(epub_path)
         
-        if epub_path == "SKIPPED":
-            logger.info("Scraper reported no new issue. Exiting.")
-            return # Success exit for skipped
+            if epub_path == "SKIPPED":
+                logger.info("Scraper reported no new issue.")
+                if not pending:
+                    return # Success exit for skipped
+            elif epub_path == "POSTPONED":
+                log_postponed(os.getenv("ZEIT_DOWNLOAD_URL"))
+                if not pending:
+                    return # A backoff is planned, not a failure
+            elif not epub_path or invalid:
+                logger.error("Download failed.")
+                if not pending:
+                    sys.exit(1) # Fail exit
+                download_failed = True
+            else:
+                logger.info(f"Processing issue: {os.path.basename(epub_path)}")
+                if ok is not None:
+                    uploaded = {(accounts[0]["user"], pending[0]): ok}
+                    confirmed[(accounts[0]["user"], pending[0])] = uploader.confirmations.get(store.path_for(pending[0]), False)
 
-        if not epub_path:
-            logger.error("Download failed.")
-            sys.exit(1) # Fail exit
+        # 2. Upload Step (already done in pipeline mode)
+        files_by_user = {
+            user: [store.path_for(sha) for sha in pending if not store.is_uploaded(sha, dest) and (user, sha) not in uploaded]
+            for user, dest in destinations.items()
+        }
+        sha_for_path = {store.path_for(sha): sha for sha in pending}
+        if not args.test:
+            for sha in {sha for user, paths in files_by_user.items() for sha in map(sha_for_path.get, paths)}:
+                for issue_id in store.issues_for(sha):
+                    ledger.begin(issue_id, "upload")
 
-    filename = os.path.basename(epub_path)
-    logger.info(f"Processing issue: {filename}")
+        tracer.set("tolino.upload_mode", upload_mode)
+        tracer.count("upload.files", sum(len(paths) for paths in files_by_user.values()))
+        if fanout:
+            for user, result in fanout.upload(files_by_user).items():
+                for path, ok in result["results"].items():
+                    uploaded[(user, sha_for_path[path])] = ok
+                    confirmed[(user, sha_for_path[path])] = result["confirmed"].get(path, False)
+        else:
+            user = accounts[0]["user"]
+            paths = files_by_user[user]
+            # The API uploader needs no browser
+            if len(paths) == 1:
+                results = {paths[0]: uploader.upload_epub(paths[0], driver=session.new_tab() if upload_mode == "web" else None)}
+            elif paths:
+                results = uploader.upload_many(paths, driver=session.new_tab() if upload_mode == "web" else None)
+            else:
+                results = {}
+            for path, ok in results.items():
+                uploaded[(user, sha_for_path[path])] = ok
+                confirmed[(user, sha_for_path[path])] = uploader.confirmations.get(path, False)
 
-    # 2. Upload Step
-    uploader = TolinoUploader(
-        username=os.getenv("TOLINO_USER"),
-        password=os.getenv("TOLINO_PASSWORD"),
-        login_url="https://webreader.mytolino.com/"
-    )
+        failed = False
+        for (user, sha), ok in uploaded.items():
+            store.mark_upload(sha, destinations[user], ok)
+            filename = os.path.basename(store.path_for(sha))
+            if ok:
+                logger.info(f"Successfully uploaded {filename} to Tolino ({user}).")
+            else:
+                logger.error(f"Failed to upload {filename} to Tolino ({user}).")
+                logger.warning(f"Upload failed. File kept in store: {store.path_for(sha)}")
+                failed = True
 
-    if uploader.upload_epub(epub_path):
-        logger.info(f"Successfully uploaded {filename} to Tolino.")
-        # Cleanup
-        try:
-            os.remove(epub_path)
-            logger.info(f"Cleaned up temporary file: {epub_path}")
-        except Exception as e:
-            logger.warning(f"Failed to cleanup file: {e}")
-    else:
-        logger.error(f"Failed to upload {filename} to Tolino.")
-        logger.warning(f"Upload failed. File preserved at: {epub_path}")
-        sys.exit(1) # Fail exit
+        if not args.test:
+            for sha in {sha for _, sha in uploaded}:
+                done = all(store.is_uploaded(sha, dest) for dest in destinations.values())
+                for issue_id in store.issues_for(sha):
+                    if done:
+                        ledger.complete(issue_id, "upload", detail=", ".join(destinations))
+                    else:
+                        ledger.fail(issue_id, "upload", detail=", ".join(user for user, dest in destinations.items() if not store.is_uploaded(sha, dest)))
+                        continue
+                    # A missing toast does not fail the run (see TolinoUploader), but it is kept in the ledger
+                    unconfirmed = [user for (user, key), ok in uploaded.items() if key == sha and ok and not confirmed.get((user, key))]
+                    if unconfirmed:
+                        ledger.fail(issue_id, "confirm", detail="unconfirmed: " + ", ".join(unconfirmed))
+                    else:
+                        ledger.complete(issue_id, "confirm")
+
+        remaining = store.pending_uploads(destinations.values())
+        store.prune(
+            max_bytes=float(os.getenv("EPUB_STORE_MAX_MB", "500")) * 1e6,
+            max_age_days=float(os.getenv("EPUB_STORE_MAX_AGE_DAYS", "30")),
+            keep=set(remaining)
+        )
+
+        if failed or download_failed:
+            sys.exit(1) # Fail exit
+    except KeyboardInterrupt:
+        if not monitor.diagnosis:
+            raise
+        logger.error(f"Run aborted by resource monitor. {monitor.diagnosis}")
+        sys.exit(1)
+    finally:
+        monitor.stop()
+        session.close()
+        get_scheduler().save()
+        ledger.close()
+        lock.release()
+        if args.test:
+            shutil.rmtree(store.root, ignore_errors=True)
+        exc = sys.exc_info()[1]
+        tracer.finish(success=exc is None or (isinstance(exc, SystemExit) and not exc.code))
 
     logger.info("Zeit-Transfer finished.")
 
@@ -0,0 +1,165 @@
+import os
+import logging
+import _thread
+import threading
+import importlib.util
+from src.tracing import get_tracer
+
+DEFAULT_INTERVAL = 1.0
+TOP_PROCESSES = 5
+
+
+def process_label(proc):
+    """
+    Short name for a process of the tree, e.g. 'chrome (renderer)' or 'chromedriver'.
+    """
+    try:
+        name = proc.name()
+        process_type = next((arg.split("=", 1)[1] for arg in proc.cmdline() if arg.startswith("--type=")), None)
+        return f"{name} ({process_type})" if process_type else name
+    except Exception:
+        return "?"
+
+
+class ResourceMonitor:
+    """
+    Samples RSS, CPU and open file descriptors of this process and all its descendants (chromedriver, Chrome and its
+    renderer/GPU processes) every RESOURCE_SAMPLE_SECONDS in a background thread. Each sample is tagged with the
+    run phase (the innermost open tracer span); stop() logs peak and mean per phase and adds them to the trace.
+    If RESOURCE_MAX_RSS_MB, RESOURCE_MAX_FDS or RESOURCE_MIN_AVAILABLE_MB is crossed, the run is aborted
+    before the kernel's OOM killer steps in: the biggest processes are logged, the browser processes are
+    killed and KeyboardInterrupt is raised in the main thread (see diagnosis). Needs psutil; without it this is a no-op.
+    """
+    def __init__(self, interval=None, max_rss_mb=None, max_fds=None, min_available_mb=None):
+        self.interval = interval or float(os.getenv("RESOURCE_SAMPLE_SECONDS", str(DEFAULT_INTERVAL)))
+        self.max_rss = (max_rss_mb or float(os.getenv("RESOURCE_MAX_RSS_MB", "0"))) * 1024 * 1024
+        self.max_fds = max_fds or int(os.getenv("RESOURCE_MAX_FDS", "0"))
+        self.min_available = (min_available_mb or float(os.getenv("RESOURCE_MIN_AVAILABLE_MB", "0"))) * 1024 * 1024
+        self.logger = logging.getLogger(__name__)
+        self.tracer = get_tracer()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.processes = {}
+        self.phases = {}
+        self.diagnosis = None
+
+    def start(self):
+        if os.getenv("RESOURCE_MONITOR", "1") == "0":
+            return self
+        if importlib.util.find_spec("psutil") is None:
+            self.logger.info("psutil is not installed, resource monitoring disabled.")
+            return self
+        import psutil
+        self.psutil = psutil
+        self.root = psutil.Process(os.getpid())
+        self.thread = threading.Thread(target=self.run, name="resource-monitor", daemon=True)
+        self.thread.start()
+        return self
+
+    def tree(self):
+        """
+        Returns the processes of the tree, reusing the Process objects so cpu_percent() measures since the last sample.
+        """
+        try:
+            current = [self.root] + self.root.children(recursive=True)
+        except self.psutil.Error:
+            current = [self.root]
+        alive = {}
+        for proc in current:
+            alive[proc.pid] = self.processes.get(proc.pid, proc)
+        self.processes = alive
+        return list(alive.values())
+
+    def sample(self):
+        totals = {"rss": 0, "cpu": 0.0, "fds": 0, "procs": 0}
+        usage = []
+        for proc in self.tree():
+            try:
+                with proc.oneshot():
+                    rss = proc.memory_info().rss
+                    totals["cpu"] += proc.cpu_percent(None)
+                    totals["fds"] += proc.num_fds()
+            except self.psutil.Error:
+                continue
+            totals["rss"] += rss
+            totals["procs"] += 1
+            usage.append((rss, proc))
+        return totals, usage
+
+    def add(self, phase, totals):
+        stats = self.phases.setdefault(phase, {"samples": 0, "rss_sum": 0, "rss_peak": 0, "cpu_sum": 0.0, "cpu_peak": 0.0, "fds_peak": 0, "procs_peak": 0})
+        stats["samples"] += 1
+        stats["rss_sum"] += totals["rss"]
+        stats["rss_peak"] = max(stats["rss_peak"], totals["rss"])
+        stats["cpu_sum"] += totals["cpu"]
+        stats["cpu_peak"] = max(stats["cpu_peak"], totals["cpu"])
+        stats["fds_peak"] = max(stats["fds_peak"], totals["fds"])
+        stats["procs_peak"] = max(stats["procs_peak"], totals["procs"])
+
+    def check_limits(self, phase, totals, usage):
+        problems = []
+        if self.max_rss and totals["rss"] > self.max_rss:
+            problems.append(f"RSS {totals['rss'] / 1048576:.0f} MB above RESOURCE_MAX_RSS_MB={self.max_rss / 1048576:.0f}")
+        if self.max_fds and totals["fds"] > self.max_fds:
+            problems.append(f"{totals['fds']} open file descriptors above RESOURCE_MAX_FDS={self.max_fds}")
+        if self.min_available:
+            available = self.psutil.virtual_memory().available
+            if available < self.min_available:
+                problems.append(f"only {available / 1048576:.0f} MB memory available, below RESOURCE_MIN_AVAILABLE_MB={self.min_available / 1048576:.0f}")
+        if not problems:
+            return
+
+        top = sorted(usage, key=lambda item: item[0], reverse=True)[:TOP_PROCESSES]
+        self.diagnosis = (
+            f"Aborting in phase '{phase}': {'; '.join(problems)}. {totals['procs']} processes; largest: "
+            + ", ".join(f"{process_label(proc)} pid {proc.pid} {rss / 1048576:.0f} MB" for rss, proc in top)
+        )
+        self.logger.error(self.diagnosis)
+        self.tracer.set("resources.abort", self.diagnosis)
+        # Free the memory right away; the driver calls in the main thread then fail instead of hanging.
+        for proc in self.processes.values():
+            if proc.pid != self.root.pid:
+                try:
+                    proc.kill()
+                except self.psutil.Error:
+                    pass
+        _thread.interrupt_main()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            phase = self.tracer.current_phase() or "idle"
+            totals, usage = self.sample()
+            self.add(phase, totals)
+            if not self.diagnosis:
+                self.check_limits(phase, totals, usage)
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        """
+        Stops sampling, logs peak/mean values per phase and adds them to the run trace.
+        """
+        if not self.thread:
+            return
+        self.stop_event.set()
+        self.thread.join(timeout=self.interval * 2)
+        self.thread = None
+        if not self.phases:
+            return
+
+        lines = [f"{'phase'.ljust(22)}  {'samples':>7}  {'peak MB':>8}  {'mean MB':>8}  {'peak CPU%':>9}  {'mean CPU%':>9}  {'peak fds':>8}  {'procs':>5}"]
+        for phase, stats in self.phases.items():
+            mean_rss = stats["rss_sum"] / stats["samples"] / 1048576
+            mean_cpu = stats["cpu_sum"] / stats["samples"]
+            lines.append(
+                f"{phase.ljust(22)}  {stats['samples']:>7}  {stats['rss_peak'] / 1048576:>8.0f}  {mean_rss:>8.0f}  "
+                f"{stats['cpu_peak']:>9.0f}  {mean_cpu:>9.0f}  {stats['fds_peak']:>8}  {stats['procs_peak']:>5}"
+            )
+            self.tracer.set(f"resources.{phase}", {
+                "peak_rss_mb": round(stats["rss_peak"] / 1048576, 1),
+                "mean_rss_mb": round(mean_rss, 1),
+                "peak_cpu_percent": round(stats["cpu_peak"], 1),
+                "mean_cpu_percent": round(mean_cpu, 1),
+                "peak_fds": stats["fds_peak"],
+            })
+        self.tracer.count("resources.peak_rss_bytes", max(stats["rss_peak"] for stats in self.phases.values()))
+        self.logger.info("Resource usage (process tree):\n" + "\n".join(lines))
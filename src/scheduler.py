@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+import statistics
+from datetime import datetime
+from urllib.parse import urlparse
+from src.tracing import get_tracer
+
+DEFAULT_STATE_FILE = ".request_budget.json"
+WAF_MARKERS = ("Zugriff wurde geblockt", "Ray ID")
+MAX_SAMPLES = 20
+JITTER = 0.25
+MIN_FACTOR = 1 / 16
+RECOVERY = 1.25
+# A response this many times slower than the host's median counts as a sign of strain; the rate then stops recovering.
+SLOW_FACTOR = 3
+SAVE_INTERVAL = 30
+
+
+def host_of(url):
+    """
+    Returns the domain a budget is kept for, e.g. 'zeit.de' for both meine.zeit.de and epaper.zeit.de:
+    the WAF blocks per site, not per subdomain.
+    """
+    hostname = urlparse(url).hostname or url
+    if hostname.replace(".", "").isdigit():
+        return hostname
+    return ".".join(hostname.split(".")[-2:])
+
+
+def is_waf_block(text):
+    return any(marker in (text or "") for marker in WAF_MARKERS)
+
+
+class RequestScheduler:
+    """
+    Request budgets per host. Every host has a token bucket that refills at SCHEDULER_RATE requests per second
+    (or the rate passed to acquire) and holds up to SCHEDULER_BURST tokens. A WAF block halves the host's rate
+    and puts it into backoff: SCHEDULER_BACKOFF_MINUTES, doubled with every further block in a row up to
+    SCHEDULER_MAX_BACKOFF_MINUTES, with ±25% jitter. Successful requests raise the rate again unless the host
+    answers much slower than usual. Blocks, backoff and response latencies are kept in SCHEDULER_STATE_FILE, so
+    a backoff also holds for the next cron run and for serve mode.
+    """
+    def __init__(self, state_file=None):
+        self.state_file = state_file or os.getenv("SCHEDULER_STATE_FILE", DEFAULT_STATE_FILE)
+        self.rate = float(os.getenv("SCHEDULER_RATE", "1"))
+        self.burst = float(os.getenv("SCHEDULER_BURST", "3"))
+        self.backoff = float(os.getenv("SCHEDULER_BACKOFF_MINUTES", "15")) * 60
+        self.max_backoff = float(os.getenv("SCHEDULER_MAX_BACKOFF_MINUTES", "360")) * 60
+        self.max_wait = float(os.getenv("SCHEDULER_MAX_WAIT_SECONDS", "120"))
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.hosts = self.load()
+        self.last_save = 0
+
+    def load(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r') as f:
+                    return json.load(f)
+            except:
+                return {}
+        return {}
+
+    def save(self):
+        with self.lock:
+            try:
+                tmp_path = self.state_file + ".tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(self.hosts, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.state_file)
+                self.last_save = time.time()
+            except Exception as e:
+                self.logger.warning(f"Failed to save request budget state: {e}")
+
+    def refresh(self):
+        """
+        Reloads the state file, e.g. after a child process recorded blocks.
+        """
+        with self.lock:
+            self.hosts = self.load()
+
+    def state(self, host):
+        return self.hosts.setdefault(host, {
+            "factor": 1.0, "tokens": self.burst, "updated": time.time(),
+            "blocks": 0, "total_blocks": 0, "blocked_until": 0, "last_block": None, "latency": [],
+        })
+
+    def next_attempt(self, url):
+        """
+        Returns the time from which requests to the host of url are allowed again (now if it is not in backoff).
+        """
+        with self.lock:
+            return max(self.state(host_of(url))["blocked_until"], time.time())
+
+    def acquire(self, url, rate=None, max_wait=None):
+        """
+        Waits for a request slot for the host of url. Returns False without waiting if the slot is more than
+        max_wait seconds away (default SCHEDULER_MAX_WAIT_SECONDS), e.g. because the host is in backoff after a block.
+        A rate of 0 only keeps the backoff, without a request budget.
+        """
+        host = host_of(url)
+        limit = self.max_wait if max_wait is None else max_wait
+        ceiling = self.rate if rate is None else rate
+        while True:
+            with self.lock:
+                state = self.state(host)
+                now = time.time()
+                effective = ceiling * state["factor"]
+                if effective > 0:
+                    state["tokens"] = min(self.burst, state["tokens"] + (now - state["updated"]) * effective)
+                state["updated"] = now
+                wait = state["blocked_until"] - now
+                if wait <= 0:
+                    if effective <= 0:
+                        return True
+                    if state["tokens"] >= 1:
+                        state["tokens"] -= 1
+                        return True
+                    wait = (1 - state["tokens"]) / effective
+            if wait > limit:
+                self.logger.warning(
+                    f"Next request to {host} only allowed at {datetime.fromtimestamp(now + wait):%H:%M:%S}, "
+                    f"not waiting {wait:.0f}s (max {limit:.0f}s)."
+                )
+                get_tracer().count("scheduler.skipped")
+                return False
+            time.sleep(wait)
+
+    def record(self, url, latency=None, blocked=False):
+        """
+        Records the outcome of a request to the host of url: a WAF block starts (or extends) the backoff,
+        anything else ends it and lets the rate recover.
+        """
+        host = host_of(url)
+        with self.lock:
+            state = self.state(host)
+            now = time.time()
+            if blocked:
+                state["blocks"] += 1
+                state["total_blocks"] += 1
+                state["factor"] = max(state["factor"] / 2, MIN_FACTOR)
+                state["tokens"] = 0
+                delay = min(self.backoff * 2 ** (state["blocks"] - 1), self.max_backoff) * random.uniform(1 - JITTER, 1 + JITTER)
+                state["blocked_until"] = now + delay
+                state["last_block"] = now
+            else:
+                slow = latency is not None and len(state["latency"]) >= 3 and latency > SLOW_FACTOR * statistics.median(state["latency"])
+                state["blocks"] = 0
+                if not slow:
+                    state["factor"] = min(1.0, state["factor"] * RECOVERY)
+                if latency is not None:
+                    state["latency"] = (state["latency"] + [round(latency, 3)])[-MAX_SAMPLES:]
+            due = blocked or now - self.last_save > SAVE_INTERVAL
+        if blocked:
+            get_tracer().count("scheduler.waf_blocks")
+            self.logger.warning(
+                f"WAF block by {host} ({state['blocks']} in a row). Next attempt not before "
+                f"{datetime.fromtimestamp(state['blocked_until']):%d.%m. %H:%M}, rate reduced to {state['factor']:.0%}."
+            )
+        if due:
+            self.save()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Returns the process-wide RequestScheduler so all modules share one budget per host.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show (or reset) the request budget and backoff per host")
+    parser.add_argument("--file", default=None, help=f"State file (default: SCHEDULER_STATE_FILE or {DEFAULT_STATE_FILE})")
+    parser.add_argument("--reset", metavar="HOST", help="Clear the backoff of HOST")
+    args = parser.parse_args()
+
+    scheduler = RequestScheduler(state_file=args.file)
+    if args.reset:
+        if args.reset not in scheduler.hosts:
+            print(f"Unknown host: {args.reset}")
+            return 1
+        del scheduler.hosts[args.reset]
+        scheduler.save()
+        print(f"Reset {args.reset}.")
+        return 0
+
+    now = time.time()
+    for host, state in sorted(scheduler.hosts.items()):
+        samples = state.get("latency", [])
+        latency = f"{statistics.median(samples) * 1000:.0f} ms" if samples else "-"
+        backoff = f"until {datetime.fromtimestamp(state['blocked_until']):%d.%m. %H:%M}" if state["blocked_until"] > now else "-"
+        print(f"{host:<32} rate {state['factor']:>5.0%}  blocks {state['total_blocks']:>3}  backoff {backoff:<18}  median {latency}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from src.waits import get_wait_engine
+from src.tracing import get_tracer
+
+DEFAULT_STATS_FILE = ".selector_stats.json"
+MAX_SAMPLES = 20
+
+LOWERCASE = "translate(text(), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')"
+
+# Strategies per logical element, as (name, 'css' | 'xpath', selector), in the order they are tried before anything
+# has been learned. Anchored selectors come before full-document text searches, which are slow on large pages.
+SELECTORS = {
+    "zeit.issue.button": (
+        ("text", "xpath", f"//a[contains({LOWERCASE}, 'aktuellen ausgabe')]"),
+        ("css", "css", "a.btn-danger"),
+    ),
+    "zeit.epub.link": (
+        ("link", "xpath", "//a[contains(., 'EPUB')]"),
+        ("text", "xpath", "//*[contains(text(), 'EPUB')]"),
+        ("specific_text", "xpath", f"//*[contains({LOWERCASE}, 'epub für e-reader laden')]"),
+    ),
+    "tolino.login.country": (
+        ("button", "xpath", "//button[contains(., 'Deutschland')]"),
+        ("text", "xpath", "//*[contains(text(), 'Deutschland')]"),
+    ),
+    "tolino.login.provider": (
+        ("css", "css", "img[alt='Thalia DE']"),
+        ("xpath", "xpath", "//img[@alt='Thalia DE']"),
+    ),
+    "tolino.login.username": (
+        ("username", "css", "input[name='username']"),
+        ("email", "css", "input[name='email']"),
+        ("email_type", "css", "input[type='email']"),
+    ),
+    "tolino.login.submit": (
+        ("button", "css", "button[type='submit']"),
+        ("input", "css", "input[type='submit']"),
+        ("primary", "css", ".btn-primary"),
+    ),
+    "tolino.library.menu": (
+        ("test_id", "css", "button[data-test-id='library-headerBar-overflowMenu-button']"),
+    ),
+    "tolino.upload.menu": (
+        ("text", "xpath", "//*[contains(text(), 'Hochladen')]"),
+    ),
+    "tolino.upload.input": (
+        ("file", "css", "input[type='file']"),
+    ),
+}
+
+# Tries the strategies in the given order in one round trip; returns [index, element] of the first match in the
+# required state ('present', 'visible' or 'clickable'), or null.
+FIND_SCRIPT = """
+var strategies = arguments[0], state = arguments[1];
+function ready(el) {
+    if (state === 'present') { return true; }
+    var visible = !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+    return visible && (state === 'visible' || !el.disabled);
+}
+for (var i = 0; i < strategies.length; i++) {
+    var nodes = [];
+    try {
+        if (strategies[i][0] === 'css') {
+            nodes = document.querySelectorAll(strategies[i][1]);
+        } else {
+            var result = document.evaluate(strategies[i][1], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            for (var j = 0; j < result.snapshotLength; j++) { nodes.push(result.snapshotItem(j)); }
+        }
+    } catch (e) { continue; }
+    for (var k = 0; k < nodes.length; k++) {
+        if (nodes[k].nodeType === 1 && ready(nodes[k])) { return [i, nodes[k]]; }
+    }
+}
+return null;
+"""
+
+
+class SelectorRegistry:
+    """
+    Resolves logical elements (see SELECTORS) through their strategies. All strategies are checked together in
+    every poll of a single wait (with the WaitEngine's learned timeout for that name), so a stale strategy costs
+    one failed lookup instead of a timeout of its own. Hits, misses and resolution times are kept per strategy
+    in SELECTOR_STATS_FILE; the strategy that matched last is tried first on the next run, then the ones
+    with the best hit rate.
+    """
+    def __init__(self, stats_file=None, selectors=None):
+        self.stats_file = stats_file or os.getenv("SELECTOR_STATS_FILE", DEFAULT_STATS_FILE)
+        self.selectors = selectors or SELECTORS
+        self.waits = get_wait_engine()
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.stats = self.load()
+
+    def load(self):
+        if os.path.exists(self.stats_file):
+            try:
+                with open(self.stats_file, 'r') as f:
+                    return json.load(f)
+            except:
+                return {}
+        return {}
+
+    def save(self):
+        with self.lock:
+            try:
+                tmp_path = self.stats_file + ".tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(self.stats, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.stats_file)
+            except Exception as e:
+                self.logger.warning(f"Failed to save selector stats: {e}")
+
+    def strategies(self, name):
+        """
+        Returns the strategies of name in the order they are tried.
+        """
+        declared = list(self.selectors[name])
+        with self.lock:
+            element = self.stats.get(name, {})
+            last = element.get("last")
+            counts = element.get("strategies", {})
+
+        def rank(strategy):
+            stats = counts.get(strategy[0], {})
+            tries = stats.get("hits", 0) + stats.get("misses", 0)
+            hit_rate = stats.get("hits", 0) / tries if tries else 0.0
+            return (strategy[0] != last, -hit_rate, declared.index(strategy))
+        return sorted(declared, key=rank)
+
+    def record(self, name, tried, matched=None, latency=None):
+        """
+        Counts a hit for the strategy that matched and a miss for the ones tried before it (all of them if none matched).
+        """
+        with self.lock:
+            element = self.stats.setdefault(name, {"last": None, "strategies": {}})
+            for strategy in tried:
+                stats = element["strategies"].setdefault(strategy, {"hits": 0, "misses": 0, "samples": []})
+                if strategy == matched:
+                    stats["hits"] += 1
+                    stats["samples"] = (stats["samples"] + [round(latency, 3)])[-MAX_SAMPLES:]
+                    element["last"] = strategy
+                    break
+                stats["misses"] += 1
+
+    def find(self, driver, name, default=10, state="clickable", required=True):
+        """
+        Returns the first element of name in the given state ('present', 'visible' or 'clickable').
+        Raises TimeoutException (like WaitEngine.until) if no strategy matched in time.
+        """
+        ordered = self.strategies(name)
+        payload = [[kind, selector] for _, kind, selector in ordered]
+        match = {}
+
+        def resolve(d):
+            try:
+                result = d.execute_script(FIND_SCRIPT, payload, state)
+            except Exception:
+                # Page is navigating; try again on the next poll.
+                return False
+            if result:
+                match["index"] = result[0]
+                return result[1]
+            return False
+
+        names = [strategy[0] for strategy in ordered]
+        start = time.time()
+        try:
+            element = self.waits.until(driver, name, resolve, default, required)
+        except Exception:
+            self.record(name, names)
+            self.logger.info(f"No strategy for '{name}' matched ({', '.join(names)}).")
+            raise
+        strategy = names[match["index"]]
+        self.record(name, names, strategy, time.time() - start)
+        get_tracer().set(f"selector.{name}", strategy)
+        if match["index"]:
+            self.logger.info(f"'{name}' resolved by fallback strategy '{strategy}'.")
+        return element
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_selector_registry():
+    """
+    Returns the process-wide SelectorRegistry so all stages share (and persist) one set of statistics.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = SelectorRegistry()
+        return _registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the learned selector strategy statistics")
+    parser.add_argument("--file", default=None, help=f"Stats file (default: SELECTOR_STATS_FILE or {DEFAULT_STATS_FILE})")
+    args = parser.parse_args()
+
+    registry = SelectorRegistry(stats_file=args.file)
+    for name in registry.selectors:
+        print(name)
+        counts = registry.stats.get(name, {}).get("strategies", {})
+        for strategy, _, selector in registry.strategies(name):
+            stats = counts.get(strategy, {})
+            samples = stats.get("samples", [])
+            avg = f"{sum(samples) / len(samples) * 1000:.0f} ms" if samples else "-"
+            print(f"  {strategy:<14} hits {stats.get('hits', 0):>4}  misses {stats.get('misses', 0):>4}  avg {avg:>7}  {selector}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
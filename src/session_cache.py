@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import logging
+from cryptography.fernet import Fernet, InvalidToken
+
+DEFAULT_CACHE_DIR = ".session_cache"
+DEFAULT_TTL_HOURS = 72
+
+# Fields accepted by CDP Network.setCookies (Network.getAllCookies returns a few more).
+COOKIE_FIELDS = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires")
+
+RESTORE_STORAGE_SCRIPT = """
+(function() {
+    var data = %s;
+    var items = data[window.location.origin];
+    if (!items) { return; }
+    try {
+        for (var key in items) {
+            if (window.localStorage.getItem(key) === null) {
+                window.localStorage.setItem(key, items[key]);
+            }
+        }
+    } catch (e) {}
+})();
+"""
+
+
+class SessionCache:
+    """
+    Encrypted on-disk cache of browser cookies and localStorage for one site/account pair.
+    Restoring it before the first page load lets the scrapers skip their login sequence.
+    The encryption key is SESSION_CACHE_KEY if set, otherwise it is derived from the account secret.
+    """
+    def __init__(self, site, account, secret, cache_dir=None, ttl_hours=None):
+        self.site = site
+        self.account = account
+        self.cache_dir = cache_dir or os.getenv("SESSION_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.ttl = float(ttl_hours or os.getenv("SESSION_CACHE_TTL_HOURS", DEFAULT_TTL_HOURS)) * 3600
+        self.logger = logging.getLogger(__name__)
+
+        entry_id = hashlib.sha256(f"{site}:{account}".encode()).hexdigest()[:32]
+        self.path = os.path.join(self.cache_dir, f"{entry_id}.bin")
+
+        key_material = os.getenv("SESSION_CACHE_KEY") or secret or ""
+        derived = hashlib.pbkdf2_hmac("sha256", key_material.encode(), f"{site}:{account}".encode(), 100000)
+        self.fernet = Fernet(base64.urlsafe_b64encode(derived))
+
+    def load(self):
+        """
+        Returns the cached entry ({'saved_at', 'cookies', 'storage'}) or None if missing, expired or unreadable.
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                entry = json.loads(self.fernet.decrypt(f.read()))
+        except (InvalidToken, ValueError, OSError) as e:
+            self.logger.warning(f"Discarding unreadable session cache for {self.site}: {e}")
+            self.invalidate()
+            return None
+
+        age = time.time() - entry.get("saved_at", 0)
+        if age > self.ttl:
+            self.logger.info(f"Session cache for {self.site} expired ({age / 3600:.1f}h old).")
+            self.invalidate()
+            return None
+        return entry
+
+    def get_cookies(self):
+        entry = self.load()
+        return entry.get("cookies", []) if entry else []
+
+    def save(self, driver):
+        """
+        Stores all cookies of the browser and the localStorage of the current origin.
+        localStorage of other origins saved earlier is kept.
+        """
+        try:
+            cookies = driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", [])
+            origin = driver.execute_script("return window.location.origin;")
+            local_storage = driver.execute_script("return Object.assign({}, window.localStorage);") or {}
+
+            previous = self.load() or {}
+            storage = previous.get("storage", {})
+            if origin and origin != "null":
+                storage[origin] = local_storage
+
+            entry = dict(previous, saved_at=time.time(), cookies=cookies, storage=storage)
+            self._write(entry)
+            self.logger.info(f"Saved session cache for {self.site} ({len(cookies)} cookies).")
+        except Exception as e:
+            self.logger.warning(f"Failed to save session cache for {self.site}: {e}")
+
+    def update_cookies(self, cookies):
+        """
+        Merges cookies renewed outside the browser (e.g. by the issue probe) into the cached entry. saved_at is
+        kept, so the entry still expires after the TTL. Returns the number of cookies changed.
+        """
+        entry = self.load()
+        if not entry:
+            return 0
+        cached = {(c["name"], c.get("domain"), c.get("path", "/")): c for c in entry.get("cookies", [])}
+        changed = 0
+        for cookie in cookies:
+            current = cached.get((cookie["name"], cookie["domain"], cookie["path"]))
+            if current is None:
+                entry.setdefault("cookies", []).append(dict(cookie))
+            elif current.get("value") != cookie["value"] or (cookie["expires"] > 0 and current.get("expires") != cookie["expires"]):
+                current["value"] = cookie["value"]
+                if cookie["expires"] > 0:
+                    current["expires"] = cookie["expires"]
+            else:
+                continue
+            changed += 1
+        if changed:
+            try:
+                self._write(entry)
+                self.logger.info(f"Updated {changed} cookie(s) in the session cache for {self.site}.")
+            except Exception as e:
+                self.logger.warning(f"Failed to update session cache for {self.site}: {e}")
+        return changed
+
+    def get_value(self, key):
+        """
+        Returns a non-browser value (e.g. API tokens) stored with set_value, or None.
+        """
+        entry = self.load()
+        return entry.get("values", {}).get(key) if entry else None
+
+    def set_value(self, key, value):
+        try:
+            entry = self.load() or {"cookies": [], "storage": {}}
+            entry.setdefault("values", {})[key] = value
+            entry["saved_at"] = time.time()
+            self._write(entry)
+        except Exception as e:
+            self.logger.warning(f"Failed to save {key} in session cache for {self.site}: {e}")
+
+    def _write(self, entry):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.fernet.encrypt(json.dumps(entry).encode()))
+        os.replace(tmp_path, self.path)
+
+    def restore(self, driver):
+        """
+        Injects cached cookies and localStorage into the browser before the first navigation.
+        Returns True if a cached session was restored.
+        """
+        entry = self.load()
+        if not entry:
+            return False
+        try:
+            cookies = [{k: c[k] for k in COOKIE_FIELDS if k in c} for c in entry.get("cookies", [])]
+            for cookie in cookies:
+                # Session cookies are reported with expires=-1, which setCookies rejects.
+                if cookie.get("expires", 0) <= 0:
+                    cookie.pop("expires", None)
+            if cookies:
+                driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+
+            storage = entry.get("storage", {})
+            if storage:
+                driver.execute_cdp_cmd(
+                    "Page.addScriptToEvaluateOnNewDocument",
+                    {"source": RESTORE_STORAGE_SCRIPT % json.dumps(storage)}
+                )
+            self.logger.info(f"Restored cached session for {self.site} ({len(cookies)} cookies).")
+            return True
+        except Exception as e:
+            self.logger.warning(f"Failed to restore session cache for {self.site}: {e}")
+            return False
+
+    def invalidate(self):
+        try:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+                self.logger.info(f"Invalidated session cache for {self.site}.")
+        except OSError as e:
+            self.logger.warning(f"Failed to remove session cache for {self.site}: {e}")
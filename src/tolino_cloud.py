@@ -0,0 +1,281 @@
+import os
+import time
+import uuid
+import hashlib
+import logging
+import requests
+from urllib.parse import urlparse, parse_qs
+from requests.adapters import HTTPAdapter
+from src.browser import USER_AGENT
+from src.tracing import get_tracer, traced
+
+# Refresh the access token this many seconds before it expires.
+TOKEN_LEEWAY = 60
+
+# Endpoints the webreader uses for Thalia DE accounts. Each one can be overridden via the environment,
+# e.g. to point the client at a local stub server.
+DEFAULT_ENDPOINTS = {
+    "login_url": "https://www.thalia.de/de.thalia.ecp.authentication.login.form",
+    "auth_url": "https://www.thalia.de/auth/oauth2/authorize",
+    "token_url": "https://www.thalia.de/auth/oauth2/token",
+    "upload_url": "https://bosh.pageplace.de/bosh/rest/upload",
+    "redirect_uri": "https://webreader.mytolino.com/library/",
+    "client_id": "webreader",
+    "scope": "SCOPE_BOSH",
+    "reseller_id": "3",
+}
+
+
+def load_endpoints():
+    """
+    Returns DEFAULT_ENDPOINTS with overrides from TOLINO_CLOUD_<NAME> (e.g. TOLINO_CLOUD_UPLOAD_URL).
+    """
+    return {name: os.getenv(f"TOLINO_CLOUD_{name.upper()}", value) for name, value in DEFAULT_ENDPOINTS.items()}
+
+
+class MultipartFile:
+    """
+    Read-only file object that yields a multipart/form-data body for one file without loading it into memory.
+    Defines __len__, so requests sends a Content-Length and streams the body in chunks.
+    """
+    def __init__(self, file_path, field="file", content_type="application/epub+zip"):
+        self.boundary = uuid.uuid4().hex
+        filename = os.path.basename(file_path).replace('"', "")
+        self.head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self.size = os.path.getsize(file_path)
+        self.file = open(file_path, 'rb')
+        self.parts = [self.head, None, self.tail]
+        self.buffer = b""
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return len(self.head) + self.size + len(self.tail)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self)
+        while len(self.buffer) < size and self.parts:
+            part = self.parts[0]
+            if part is None:
+                chunk = self.file.read(size - len(self.buffer))
+                if chunk:
+                    self.buffer += chunk
+                    continue
+            else:
+                self.buffer += part
+            self.parts.pop(0)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class TolinoCloudUploader:
+    """
+    Uploads EPUBs directly to the Tolino cloud API the webreader calls, without a browser.
+    OAuth tokens are kept in the (encrypted) session cache and refreshed before they expire; a password login
+    only happens when no usable refresh token is left. Offers the same upload_epub/upload_many/upload_when_ready
+    interface as TolinoUploader; the driver arguments are accepted and ignored.
+    """
+    def __init__(self, username, password, session_cache=None, endpoints=None, hardware_id=None, timeout=60):
+        self.username = username
+        self.password = password
+        self.session_cache = session_cache
+        self.endpoints = endpoints or load_endpoints()
+        # Stable per account, so the cloud sees the same "device" on every run.
+        self.hardware_id = hardware_id or os.getenv("TOLINO_HARDWARE_ID") or hashlib.sha256(f"zeit-transfer:{username}".encode()).hexdigest()[:32]
+        self.timeout = timeout
+        self.token = None
+        self.confirmations = {}
+        self.tracer = get_tracer()
+        self.logger = logging.getLogger(__name__)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+
+    def _store_token(self, payload):
+        self.token = {
+            "access_token": payload["access_token"],
+            "refresh_token": payload.get("refresh_token") or (self.token or {}).get("refresh_token"),
+            "expires_at": time.time() + float(payload.get("expires_in", 3600)),
+        }
+        if self.session_cache:
+            self.session_cache.set_value("oauth", self.token)
+
+    def _token_request(self, data):
+        data = dict(data, client_id=self.endpoints["client_id"])
+        response = self.session.post(self.endpoints["token_url"], data=data, timeout=self.timeout)
+        response.raise_for_status()
+        self._store_token(response.json())
+
+    def _password_login(self):
+        self.logger.info("Tolino API: logging in with password...")
+        response = self.session.post(
+            self.endpoints["login_url"],
+            data={"j_username": self.username, "j_password": self.password, "login": ""},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+
+        response = self.session.get(
+            self.endpoints["auth_url"],
+            params={
+                "client_id": self.endpoints["client_id"],
+                "response_type": "code",
+                "scope": self.endpoints["scope"],
+                "redirect_uri": self.endpoints["redirect_uri"],
+            },
+            allow_redirects=False,
+            timeout=self.timeout
+        )
+        code = parse_qs(urlparse(response.headers.get("Location", "")).query).get("code", [None])[0]
+        if not code:
+            raise RuntimeError(f"No authorization code received (HTTP {response.status_code}). Credentials rejected?")
+
+        self._token_request({
+            "grant_type": "authorization_code",
+            "code": code,
+            "scope": self.endpoints["scope"],
+            "redirect_uri": self.endpoints["redirect_uri"],
+        })
+
+    @traced("tolino.api.login")
+    def login(self, driver=None):
+        """
+        Makes sure a valid access token is available (cached, refreshed or from a fresh login).
+        Returns True if logged in, False otherwise.
+        """
+        if not self.token and self.session_cache:
+            self.token = self.session_cache.get_value("oauth")
+
+        try:
+            if self.token and self.token.get("expires_at", 0) - TOKEN_LEEWAY > time.time():
+                self.logger.info("Tolino API: using cached access token.")
+                self.tracer.set("tolino.api.login_mode", "cached_token")
+                return True
+            if self.token and self.token.get("refresh_token"):
+                try:
+                    self._token_request({"grant_type": "refresh_token", "refresh_token": self.token["refresh_token"]})
+                    self.logger.info("Tolino API: access token refreshed.")
+                    self.tracer.set("tolino.api.login_mode", "refresh")
+                    return True
+                except requests.RequestException as e:
+                    self.logger.warning(f"Tolino API: token refresh failed ({e}), logging in again.")
+            self._password_login()
+            self.logger.info("Tolino API: logged in.")
+            self.tracer.set("tolino.api.login_mode", "password")
+            return True
+        except Exception as e:
+            self.logger.error(f"Tolino API login failed: {e}")
+            self.token = None
+            return False
+
+    def _post_file(self, file_path):
+        body = MultipartFile(file_path)
+        try:
+            return self.session.post(
+                self.endpoints["upload_url"],
+                data=body,
+                headers={
+                    "Content-Type": body.content_type,
+                    "t_auth_token": self.token["access_token"],
+                    "hardware_id": self.hardware_id,
+                    "reseller_id": self.endpoints["reseller_id"],
+                },
+                timeout=self.timeout
+            )
+        finally:
+            body.close()
+
+    @traced("tolino.api.upload")
+    def upload_file(self, file_path):
+        """
+        Streams one file to the cloud. Retries once with a fresh token if the current one is rejected.
+        """
+        start = time.time()
+        response = self._post_file(file_path)
+        if response.status_code in (401, 403):
+            self.logger.info("Tolino API: token rejected, renewing...")
+            self.tracer.count("retries.tolino_api_upload")
+            self.token["expires_at"] = 0
+            if not self.login():
+                return False
+            response = self._post_file(file_path)
+
+        if not response.ok:
+            self.logger.error(f"Tolino API upload of {os.path.basename(file_path)} failed: HTTP {response.status_code} {response.text[:200]}")
+            return False
+
+        # The API answers with the metadata of the new library entry; that is our confirmation.
+        try:
+            confirmed = bool(response.json())
+        except ValueError:
+            confirmed = False
+        self.confirmations[file_path] = confirmed
+        size = os.path.getsize(file_path)
+        self.tracer.count("bytes.tolino_upload", size)
+        elapsed = max(time.time() - start, 0.001)
+        self.logger.info(f"Tolino API: uploaded {os.path.basename(file_path)} ({size / 1e6:.1f} MB in {elapsed:.1f}s, {'confirmed' if confirmed else 'unconfirmed'}).")
+        return True
+
+    def upload_epub(self, file_path, driver=None):
+        """
+        Uploads one EPUB. Returns True if successful, False otherwise.
+        """
+        if not os.path.exists(file_path):
+            self.logger.error(f"File not found: {file_path}")
+            return False
+        return self.upload_when_ready(lambda: file_path)
+
+    def upload_when_ready(self, get_file, driver=None):
+        """
+        Logs in first, then calls get_file() (which may block on a running download) and uploads the path it returns.
+        """
+        try:
+            if not self.login():
+                return False
+            file_path = get_file()
+            if not file_path or not os.path.exists(file_path):
+                self.logger.warning(f"No file to upload (got: {file_path}).")
+                return False
+            return self.upload_file(file_path)
+        except Exception as e:
+            self.logger.error(f"Critical Error in TolinoCloudUploader: {e}")
+            return False
+
+    def upload_many(self, file_paths, driver=None):
+        """
+        Uploads several EPUBs with one token. Returns {file_path: True/False}.
+        """
+        results = {path: False for path in file_paths}
+        queue = [path for path in file_paths if os.path.exists(path)]
+        for path in set(file_paths) - set(queue):
+            self.logger.error(f"File not found: {path}")
+        if not queue or not self.login():
+            return results
+
+        start = time.time()
+        for path in queue:
+            try:
+                results[path] = self.upload_file(path)
+            except Exception as e:
+                self.logger.error(f"Tolino API upload of {os.path.basename(path)} crashed: {e}")
+        elapsed = max(time.time() - start, 0.001)
+        uploaded = sum(1 for ok in results.values() if ok)
+        self.logger.info(f"Bulk upload: {uploaded}/{len(file_paths)} uploaded in {elapsed:.1f}s ({uploaded / elapsed * 60:.1f} books/min).")
+        return results
+
+    def close(self):
+        self.session.close()
@@ -1,17 +1,34 @@
 import os
 import time
 import logging
-import undetected_chromedriver as uc
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support import expected_conditions as EC
+from src.browser import launch_chrome, apply_request_blocking, record_page_stats
+from src.waits import get_wait_engine
+from src.selector_registry import get_selector_registry
+from src.scheduler import get_scheduler, is_waf_block
+from src.tracing import get_tracer, traced
+
+DEFAULT_LIBRARY_URL = "https://webreader.mytolino.com/library/index.html#/mybooks/titles"
+SUCCESS_XPATH = "//*[contains(text(), 'erfolgreich') or contains(text(), 'hinzugefügt')]"
+
 
 class TolinoUploader:
-    def __init__(self, username, password, login_url):
+    def __init__(self, username, password, login_url, session_cache=None, profile_dir=None, library_url=None):
         self.username = username
         self.password = password
-        self.login_url = login_url 
+        self.login_url = login_url
+        self.library_url = library_url or os.getenv("TOLINO_LIBRARY_URL", DEFAULT_LIBRARY_URL)
+        self.session_cache = session_cache
+        self.profile_dir = profile_dir
+        self.waits = get_wait_engine()
+        self.selectors = get_selector_registry()
+        self.scheduler = get_scheduler()
+        self.tracer = get_tracer()
+        # file path -> whether the success toast was seen, for every file injected by this uploader
+        self.confirmations = {}
         self.logger = logging.getLogger(__name__)
 
     def take_screenshot(self, driver, name):
@@ -22,25 +39,252 @@ class TolinoUploader:
         except Exception as e:
             self.logger.warning(f"Failed to take screenshot: {e}")
 
-    def get_chrome_version(self, chrome_bin=None):
+    @traced("tolino.login")
+    def login(self, driver):
+        """
+        Brings the driver to a logged-in Tolino Webreader session (restored from cache or via the Thalia DE form).
+        Returns True if logged in, False otherwise.
+        """
+        waits = self.waits
+
+        # --- Login Phase ---
+        apply_request_blocking(driver, "tolino")
+        restored_session = False
+        if self.session_cache:
+            restored_session = self.session_cache.restore(driver)
+
+        if not self.scheduler.acquire(self.login_url):
+            self.logger.error("Tolino login postponed, the site blocked an earlier attempt.")
+            return False
+        self.logger.info(f"Navigating to {self.login_url}")
+        start = time.time()
+        driver.get(self.login_url)
+
+        # Detect Cloudflare Block
+        page_text = driver.find_element(By.TAG_NAME, "body").text
+        if is_waf_block(page_text):
+            self.logger.error("ACCESS DENIED: The browser has been blocked by the site's WAF (Cloudflare).")
+            self.scheduler.record(self.login_url, blocked=True)
+            self.take_screenshot(driver, "waf_blocked")
+            return False
+        self.scheduler.record(self.login_url, latency=time.time() - start)
+
+        # Smart check for login state
+        # Wait for either 'Deutschland' (not logged in) OR 'Library Menu' (logged in)
+        is_logged_in = False
+        try:
+            # Give it a moment to load
+            waits.until(driver, "tolino.login.page", EC.presence_of_element_located((By.TAG_NAME, "body")), default=20)
+
+            if restored_session:
+                # The library SPA needs a moment to render with a restored session,
+                # so wait for either the menu (logged in) or the country picker (logged out).
+                waits.until(driver, "tolino.login.state", EC.presence_of_element_located((
+                    By.XPATH, "//button[@data-test-id='library-headerBar-overflowMenu-button'] | //*[contains(text(), 'Deutschland')]"
+                )), default=10)
+
+            # Check for indicators
+            if len(driver.find_elements(By.CSS_SELECTOR, "button[data-test-id='library-headerBar-overflowMenu-button']")) > 0:
+                 is_logged_in = True
+                 self.logger.info("Already logged in (Menu found).")
+        except Exception:
+            pass
+
+        if not is_logged_in and restored_session:
+            self.logger.info("Cached session was not accepted. Logging in from scratch.")
+            self.session_cache.invalidate()
+
+        if not is_logged_in:
+            self.logger.info("Performing Login Sequence...")
+
+            # 1. Country Selection
+            self.logger.info("Looking for Country Selection...")
+            try:
+                # Wait explicitly
+                de_btn = self.selectors.find(driver, "tolino.login.country", default=10, required=False)
+                de_btn.click()
+                self.logger.info("Clicked 'Deutschland'.")
+            except Exception:
+                self.logger.info("Country selection skipped (not found or already selected).")
+
+            # 2. Provider "Thalia DE"
+            self.logger.info("Looking for Provider 'Thalia DE'...")
+            try:
+                 thalia_img = self.selectors.find(driver, "tolino.login.provider", default=20)
+                 try:
+                     thalia_img.click()
+                 except Exception:
+                     thalia_img.find_element(By.XPATH, "./..").click()
+                 self.logger.info("Clicked 'Thalia DE'.")
+            except Exception:
+                 self.logger.info("Provider selection skipped.")
+
+            # 3. Thalia Login Form
+            self.logger.info("Waiting for Login Form...")
+
+            # Handle 'Anmelden' landing page button if sticking
+            try:
+                anmelden_landing = waits.until(driver, "tolino.login.landing", EC.element_to_be_clickable((By.XPATH, "//*[contains(text(), 'Anmelden')]")), default=5, required=False)
+                if anmelden_landing.is_displayed():
+                    anmelden_landing.click()
+            except Exception:
+                pass
+
+            # Enter Credentials
+            try:
+                # Specific wait for Thalia/Tolino user input
+                user_input = self.selectors.find(driver, "tolino.login.username", default=20)
+                waits.settle(driver, "tolino.login.form_ready", default=1) # Stabilization wait
+                user_input.click()
+                user_input.clear()
+                user_input.send_keys(self.username)
+
+                try:
+                    pass_input = driver.find_element(By.CSS_SELECTOR, "input[type='password']")
+                except Exception:
+                    # Sometimes need to hit enter to reveal password
+                    user_input.send_keys(Keys.RETURN)
+                    pass_input = waits.until(driver, "tolino.login.password", EC.element_to_be_clickable((By.CSS_SELECTOR, "input[type='password']")), default=20)
+
+                pass_input.click()
+                pass_input.clear()
+                pass_input.send_keys(self.password)
+
+                # Submit Strategy 1: Enter Key
+                self.logger.info("Submitting Tolino login via Enter key...")
+                pass_input.send_keys(Keys.RETURN)
+                try:
+                    waits.until(driver, "tolino.login.submit_enter", EC.url_contains("library"), default=2, required=False)
+                except TimeoutException:
+                    pass
+
+                # Submit Strategy 2: Click Button (if 'Anmelden' button is visible)
+                # Note: Tolino/Thalia login usually autoruns on Enter, but we look for a submit button just in case
+                try:
+                     submit_btn = self.selectors.find(driver, "tolino.login.submit", default=0, state="present", required=False)
+                     if submit_btn.is_displayed():
+                         self.logger.info("Submit button found. Clicking...")
+                         submit_btn.click()
+                         try:
+                             waits.until(driver, "tolino.login.submit_click", EC.url_contains("library"), default=1, required=False)
+                         except TimeoutException:
+                             pass
+                except Exception:
+                    pass
+
+                self.logger.info("Credentials submitted.")
+
+                # 4. Verify Success
+                self.logger.info("Waiting for successful login redirect...")
+
+                # Wait for library URL AND absence of Anmelden button
+                waits.until(driver, "tolino.login.redirect", EC.url_contains("library"), default=20)
+
+                # Ensure 'Anmelden' is gone (give it a few seconds to transition)
+                waits.until_not(driver, "tolino.login.verify",
+                    EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'Anmelden')]")),
+                    default=15
+                )
+                self.logger.info("Login verified.")
+                if self.session_cache:
+                    self.session_cache.save(driver)
+
+            except Exception as e:
+                self.logger.error(f"Login Failure: {e}")
+                self.take_screenshot(driver, "login_failed")
+                if self.session_cache:
+                    self.session_cache.invalidate()
+                return False
+
+        return True
+
+    @traced("tolino.open_library")
+    def open_library(self, driver):
+        """
+        Navigates to 'My Books' and waits until the overflow menu used for uploads is ready.
+        """
+        target_url = self.library_url
+        self.logger.info(f"Navigating to specific upload page: {target_url}")
+        driver.get(target_url)
+        
+        # Wait for Overflow Menu button
+        self.logger.info("Waiting for page header/menu to load...")
+        try:
+            self.selectors.find(driver, "tolino.library.menu", default=20)
+            self.logger.info("Overflow Menu button found.")
+            record_page_stats(driver, "tolino.library")
+            return True
+        except Exception as e:
+            self.logger.error(f"Could not load library page: {e}")
+            self.take_screenshot(driver, "menu_interaction_failed")
+            return False
+
+    @traced("tolino.inject")
+    def inject_file(self, driver, file_path):
+        """
+        Opens the overflow menu and hands the file to the hidden upload input.
+        file_path may also be a list of paths, which requires an input with the 'multiple' attribute.
+        """
+        file_paths = file_path if isinstance(file_path, (list, tuple)) else [file_path]
+        try:
+            menu_btn = self.selectors.find(driver, "tolino.library.menu", default=20)
+            menu_btn.click()
+            self.logger.info("Overflow Menu clicked.")
+        except Exception as e:
+            self.logger.error(f"Could not interact with Overflow Menu: {e}")
+            self.take_screenshot(driver, "menu_interaction_failed")
+            return False
+
+        self.logger.info("Looking for file input...")
+        try:
+            # Wait for 'Hochladen' option
+            self.selectors.find(driver, "tolino.upload.menu", default=20, state="visible")
+            self.logger.info("'Hochladen' option visible.")
+            
+            # Find input and send keys
+            file_input = self.selectors.find(driver, "tolino.upload.input", default=0, state="present")
+            self.logger.info(f"Sending file(s) to input: {', '.join(file_paths)}")
+            file_input.send_keys("\n".join(os.path.abspath(path) for path in file_paths))
+            self.tracer.count("bytes.tolino_upload", sum(os.path.getsize(path) for path in file_paths))
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"Failed to inject file: {e}")
+            self.take_screenshot(driver, "upload_injection_failed")
+            return False
+
+    @traced("tolino.confirm")
+    def confirm_upload(self, driver, count=1):
+        """
+        Waits until `count` upload toasts are visible. Returns True if confirmed, False if the confirmation is missing.
+        """
+        self.logger.info("Waiting for success confirmation...")
+        try:
+            toasts_visible = lambda d: len([e for e in d.find_elements(By.XPATH, SUCCESS_XPATH) if e.is_displayed()]) >= count
+            self.waits.until(driver, "tolino.upload.confirm", toasts_visible, default=20)
+            self.logger.info(f"Success detected: {driver.find_element(By.XPATH, SUCCESS_XPATH).text}")
+            # Wait a tiny bit for UI to settle before closing (optional safety)
+            self.waits.settle(driver, "tolino.upload.settle", default=1)
+            return True
+            
+        except Exception as e:
+            self.logger.warning(f"Success confirmation missing/timed out: {e}")
+            self.take_screenshot(driver, "success_confirmation_missing")
+            return False
+
+    def wait_for_toasts_to_clear(self, driver):
+        """
+        Lets the previous upload toast disappear, so the next confirmation is not matched against it.
+        """
         try:
-            import subprocess
-            import re
-            # Read the version of the exact binary we will launch (chrome_bin),
-            # falling back to 'google-chrome' on PATH for local runs.
-            executable = chrome_bin or 'google-chrome'
-            result = subprocess.run([executable, '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            output = result.stdout
-            match = re.search(r'Chrome (\d+)', output)
-            if match:
-                return int(match.group(1))
-        except:
+            self.waits.until_not(driver, "tolino.upload.toast_clear", EC.visibility_of_element_located((By.XPATH, SUCCESS_XPATH)), default=10, required=False)
+        except TimeoutException:
             pass
-        return None
 
-    def upload_epub(self, file_path):
+    def upload_epub(self, file_path, driver=None):
         """
         Logs in to Tolino Webreader using Selenium and uploads the EPUB file via the 'My Books' overflow menu.
+        If a driver is passed in, it is reused and left running; otherwise a new Chrome is launched and quit afterwards.
         Returns True if successful, False otherwise.
         """
         if not os.path.exists(file_path):
@@ -48,205 +292,34 @@ class TolinoUploader:
             return False
 
         self.logger.info(f"Starting Upload for {file_path}...")
-        driver = None
+        return self.upload_when_ready(lambda: file_path, driver=driver)
+
+    def upload_when_ready(self, get_file, driver=None):
+        """
+        Logs in and opens the library first, then calls get_file() (which may block, e.g. on a running download)
+        and uploads the path it returns. Lets the login overlap with the Zeit download.
+        Returns True if successful, False otherwise (also if get_file() returns no file).
+        """
+        owns_driver = driver is None
         
         try:
-            # Initialize Undetected Chromedriver
-            options = uc.ChromeOptions()
-            options.add_argument("--disable-blink-features=AutomationControlled")
-            options.add_argument("--no-sandbox")
-            options.add_argument("--disable-gpu")
-            options.add_argument("--window-size=1920,1080")
-            options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-
-            # Use the Chrome + ChromeDriver paths provided by the CI workflow so that
-            # the launched browser and the driver always come from the same matched pair.
-            chrome_bin = os.environ.get("CHROME_BIN")
-            driver_bin = os.environ.get("CHROMEDRIVER_BIN")
-            version_main = self.get_chrome_version(chrome_bin)
-
-            kwargs = dict(use_subprocess=True, options=options)
-            if chrome_bin:
-                kwargs["browser_executable_path"] = chrome_bin
-            if driver_bin:
-                kwargs["driver_executable_path"] = driver_bin
-            if version_main:
-                kwargs["version_main"] = version_main
-
-            self.logger.info(
-                f"Starting Chrome (binary={chrome_bin or 'auto'}, driver={driver_bin or 'auto'}, version_main={version_main})"
-            )
-            driver = uc.Chrome(**kwargs)
-                 
-            driver.set_window_size(1920, 1080)
-            
-            wait = WebDriverWait(driver, 20)
-            
-            # --- Login Phase ---
-            self.logger.info(f"Navigating to {self.login_url}")
-            driver.get(self.login_url)
-            
-            # Detect Cloudflare Block
-            page_text = driver.find_element(By.TAG_NAME, "body").text
-            if "Zugriff wurde geblockt" in page_text or "Ray ID" in page_text:
-                self.logger.error("ACCESS DENIED: The browser has been blocked by the site's WAF (Cloudflare).")
-                self.take_screenshot(driver, "waf_blocked")
-                return False
+            if owns_driver:
+                driver = launch_chrome(profile_dir=self.profile_dir)
 
-            # Smart check for login state
-            # Wait for either 'Deutschland' (not logged in) OR 'Library Menu' (logged in)
-            is_logged_in = False
-            try:
-                # Give it a moment to load
-                wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-                
-                # Check for indicators
-                if len(driver.find_elements(By.CSS_SELECTOR, "button[data-test-id='library-headerBar-overflowMenu-button']")) > 0:
-                     is_logged_in = True
-                     self.logger.info("Already logged in (Menu found).")
-            except:
-                pass
-            
-            if not is_logged_in:
-                self.logger.info("Performing Login Sequence...")
+            if not self.login(driver) or not self.open_library(driver):
+                return False
 
-                # 1. Country Selection
-                self.logger.info("Looking for Country Selection...")
-                try:
-                    # Wait explicitly
-                    de_btn = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, "//*[contains(text(), 'Deutschland')]")))
-                    de_btn.click()
-                    self.logger.info("Clicked 'Deutschland'.")
-                except:
-                    self.logger.info("Country selection skipped (not found or already selected).")
-
-                # 2. Provider "Thalia DE"
-                self.logger.info("Looking for Provider 'Thalia DE'...")
-                try:
-                     thalia_img = wait.until(EC.element_to_be_clickable((By.XPATH, "//img[@alt='Thalia DE']")))
-                     try:
-                         thalia_img.click()
-                     except:
-                         thalia_img.find_element(By.XPATH, "./..").click()
-                     self.logger.info("Clicked 'Thalia DE'.")
-                except:
-                     self.logger.info("Provider selection skipped.")
-
-                # 3. Thalia Login Form
-                self.logger.info("Waiting for Login Form...")
-                
-                # Handle 'Anmelden' landing page button if sticking
-                try:
-                    anmelden_landing = WebDriverWait(driver, 5).until(EC.element_to_be_clickable((By.XPATH, "//*[contains(text(), 'Anmelden')]")))
-                    if anmelden_landing.is_displayed():
-                        anmelden_landing.click()
-                except:
-                    pass
-                
-                # Enter Credentials
-                try:
-                    # Specific wait for Thalia/Tolino user input
-                    user_input = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "input[name='username'], input[name='email'], input[type='email']")))
-                    time.sleep(1) # Stabilization wait
-                    user_input.click()
-                    user_input.clear()
-                    user_input.send_keys(self.username)
-                    
-                    try:
-                        pass_input = driver.find_element(By.CSS_SELECTOR, "input[type='password']")
-                    except:
-                        # Sometimes need to hit enter to reveal password
-                        user_input.send_keys(Keys.RETURN)
-                        pass_input = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "input[type='password']")))
-                    
-                    pass_input.click()
-                    pass_input.clear()
-                    pass_input.send_keys(self.password)
-                    
-                    # Submit Strategy 1: Enter Key
-                    self.logger.info("Submitting Tolino login via Enter key...")
-                    pass_input.send_keys(Keys.RETURN)
-                    time.sleep(2)
-                    
-                    # Submit Strategy 2: Click Button (if 'Anmelden' button is visible)
-                    # Note: Tolino/Thalia login usually autoruns on Enter, but we look for a submit button just in case
-                    try:
-                         submit_btn = driver.find_element(By.CSS_SELECTOR, "button[type='submit'], input[type='submit'], .btn-primary")
-                         if submit_btn.is_displayed():
-                             self.logger.info("Submit button found. Clicking...")
-                             submit_btn.click()
-                             time.sleep(1)
-                    except:
-                        pass
-                        
-                    self.logger.info("Credentials submitted.")
-                    
-                    # 4. Verify Success
-                    self.logger.info("Waiting for successful login redirect...")
-                    
-                    # Wait for library URL AND absence of Anmelden button
-                    wait.until(EC.url_contains("library"))
-                    
-                    # Ensure 'Anmelden' is gone (give it a few seconds to transition)
-                    WebDriverWait(driver, 15).until_not(
-                        EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'Anmelden')]"))
-                    )
-                    self.logger.info("Login verified.")
-                    
-                except Exception as e:
-                    self.logger.error(f"Login Failure: {e}")
-                    self.take_screenshot(driver, "login_failed")
-                    return False
-
-            # --- Navigation Phase ---
-            target_url = "https://webreader.mytolino.com/library/index.html#/mybooks/titles"
-            self.logger.info(f"Navigating to specific upload page: {target_url}")
-            driver.get(target_url)
-            
-            # Wait for Overflow Menu button
-            self.logger.info("Waiting for page header/menu to load...")
-            try:
-                menu_btn = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "button[data-test-id='library-headerBar-overflowMenu-button']")))
-                self.logger.info("Overflow Menu button found.")
-                
-                menu_btn.click()
-                self.logger.info("Overflow Menu clicked.")
-                
-            except Exception as e:
-                self.logger.error(f"Could not interact with Overflow Menu: {e}")
-                self.take_screenshot(driver, "menu_interaction_failed")
+            with self.tracer.span("tolino.wait_for_file"):
+                file_path = get_file()
+            if not file_path or not os.path.exists(file_path):
+                self.logger.warning(f"No file to upload (got: {file_path}).")
                 return False
 
-            # --- Upload Phase ---
-            self.logger.info("Looking for file input...")
-            try:
-                # Wait for 'Hochladen' option
-                wait.until(EC.visibility_of_element_located((By.XPATH, "//*[contains(text(), 'Hochladen')]")))
-                self.logger.info("'Hochladen' option visible.")
-                
-                # Find input and send keys
-                file_input = driver.find_element(By.CSS_SELECTOR, "input[type='file']")
-                self.logger.info(f"Sending file to input: {file_path}")
-                file_input.send_keys(os.path.abspath(file_path))
-                
-            except Exception as e:
-                self.logger.error(f"Failed to inject file: {e}")
-                self.take_screenshot(driver, "upload_injection_failed")
+            if not self.inject_file(driver, file_path):
                 return False
-            
-            # --- Verification Phase ---
-            self.logger.info("Waiting for success confirmation...")
-            try:
-                success_msg = wait.until(EC.visibility_of_element_located((By.XPATH, "//*[contains(text(), 'erfolgreich') or contains(text(), 'hinzugefügt')]")))
-                self.logger.info(f"Success detected: {success_msg.text}")
-                # Wait a tiny bit for UI to settle before closing (optional safety)
-                time.sleep(1) 
-                return True
-                
-            except Exception as e:
-                self.logger.warning(f"Success confirmation missing/timed out: {e}")
-                self.take_screenshot(driver, "success_confirmation_missing")
-                return True 
+            # A missing confirmation is logged but not treated as a failure.
+            self.confirmations[file_path] = self.confirm_upload(driver)
+            return True
 
         except Exception as e:
             self.logger.error(f"Critical Error in TolinoUploader: {e}")
@@ -255,5 +328,81 @@ class TolinoUploader:
             return False
             
         finally:
+            self.waits.save()
+            self.selectors.save()
+            if driver and owns_driver:
+                driver.quit()
+
+    def upload_many(self, file_paths, driver=None):
+        """
+        Uploads several EPUBs in one logged-in session. If the upload input accepts multiple files they are
+        injected together, otherwise one after another. Returns {file_path: True/False}; like upload_epub,
+        an upload without a visible confirmation still counts as uploaded (it is logged as unconfirmed).
+        """
+        results = {path: False for path in file_paths}
+        queue = [path for path in file_paths if os.path.exists(path)]
+        for path in set(file_paths) - set(queue):
+            self.logger.error(f"File not found: {path}")
+        if not queue:
+            return results
+
+        self.logger.info(f"Starting bulk upload of {len(queue)} file(s)...")
+        owns_driver = driver is None
+        start = None
+        confirmed = 0
+
+        try:
+            if owns_driver:
+                driver = launch_chrome(profile_dir=self.profile_dir)
+
+            if not self.login(driver) or not self.open_library(driver):
+                return results
+
+            start = time.time()
+            accepts_multiple = bool(driver.execute_script(
+                "var input = document.querySelector(\"input[type='file']\"); return input ? input.multiple : false;"
+            ))
+
+            self.tracer.set("tolino.inject_mode", "multiple" if accepts_multiple and len(queue) > 1 else "sequential")
+            if accepts_multiple and len(queue) > 1:
+                self.logger.info("Upload input accepts multiple files. Injecting all at once...")
+                if self.inject_file(driver, queue):
+                    ok = self.confirm_upload(driver, count=len(queue))
+                    confirmed += len(queue) if ok else 0
+                    for path in queue:
+                        results[path] = True
+                        self.confirmations[path] = ok
+                        self.logger.info(f"{os.path.basename(path)}: uploaded ({'confirmed' if ok else 'unconfirmed'}).")
+            else:
+                for index, path in enumerate(queue, 1):
+                    self.logger.info(f"Uploading {index}/{len(queue)}: {os.path.basename(path)}")
+                    if index > 1:
+                        self.wait_for_toasts_to_clear(driver)
+                    if not self.inject_file(driver, path):
+                        continue
+                    ok = self.confirm_upload(driver)
+                    confirmed += 1 if ok else 0
+                    results[path] = True
+                    self.confirmations[path] = ok
+                    self.logger.info(f"{os.path.basename(path)}: uploaded ({'confirmed' if ok else 'unconfirmed'}).")
+
+            return results
+
+        except Exception as e:
+            self.logger.error(f"Critical Error in TolinoUploader bulk upload: {e}")
             if driver:
+                self.take_screenshot(driver, "critical_crash")
+            return results
+
+        finally:
+            if start:
+                elapsed = max(time.time() - start, 0.001)
+                uploaded = sum(1 for ok in results.values() if ok)
+                self.logger.info(
+                    f"Bulk upload: {uploaded}/{len(file_paths)} uploaded, {confirmed} confirmed in {elapsed:.1f}s "
+                    f"({uploaded / elapsed * 60:.1f} books/min)."
+                )
+            self.waits.save()
+            self.selectors.save()
+            if driver and owns_driver:
                 driver.quit()
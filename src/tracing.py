@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import socket
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+
+DEFAULT_TRACE_DIR = "traces"
+METRIC_PREFIX = "zeit_transfer"
+
+
+class Span:
+    """
+    One timed phase of a run. Spans opened while another one is active on the same thread become its children.
+    """
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end_time = None
+        self.status = "ok"
+
+    @property
+    def duration(self):
+        return (self.end_time or time.time()) - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, reason=None):
+        self.status = "error"
+        if reason:
+            self.attributes["error"] = reason
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "start": self.start,
+            "duration": round(self.duration, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    """
+    Collects spans, counters (bytes, retries, ...) and attributes (selector strategies, modes, ...) for one run.
+    At the end of the run finish() writes a JSON trace to TRACE_DIR, optionally a Prometheus textfile
+    (TRACE_PROMETHEUS_FILE, for the node_exporter textfile collector) and logs a summary table.
+    """
+    def __init__(self, run_id=None):
+        self.run_id = run_id or time.strftime("%Y%m%d-%H%M%S")
+        self.started_at = time.time()
+        self.spans = []
+        self.counters = {}
+        self.attributes = {}
+        self.active = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.logger = logging.getLogger(__name__)
+
+    def _stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def start_span(self, name, **attributes):
+        """
+        Opens a span that has to be closed with end_span(). Prefer span() where the phase is one block.
+        """
+        stack = self._stack()
+        span = Span(name, stack[-1].name if stack else None, attributes)
+        span.attributes.setdefault("thread", threading.current_thread().name)
+        stack.append(span)
+        with self.lock:
+            self.active.append(span)
+        return span
+
+    def end_span(self, span, status=None):
+        if span.end_time:
+            return
+        if status:
+            span.status = status
+        span.end_time = time.time()
+        stack = self._stack()
+        if span in stack:
+            stack.remove(span)
+        with self.lock:
+            if span in self.active:
+                self.active.remove(span)
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = self.start_span(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.fail(type(e).__name__)
+            raise
+        finally:
+            self.end_span(span)
+
+    def current_phase(self):
+        """
+        Returns the name of the most recently opened span that is still running (on any thread), or None.
+        """
+        with self.lock:
+            return self.active[-1].name if self.active else None
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set(self, key, value):
+        with self.lock:
+            self.attributes[key] = value
+
+    def phases(self):
+        """
+        Returns {span name: {'count', 'total', 'max', 'errors'}}, in order of first occurrence.
+        """
+        phases = {}
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        for span in spans:
+            phase = phases.setdefault(span.name, {"count": 0, "total": 0.0, "max": 0.0, "errors": 0})
+            phase["count"] += 1
+            phase["total"] += span.duration
+            phase["max"] = max(phase["max"], span.duration)
+            phase["errors"] += 1 if span.status != "ok" else 0
+        return phases
+
+    def to_dict(self, success=None):
+        with self.lock:
+            spans = [span.to_dict() for span in sorted(self.spans, key=lambda span: span.start)]
+            counters = dict(self.counters)
+            attributes = dict(self.attributes)
+        return {
+            "run_id": self.run_id,
+            "host": socket.gethostname(),
+            "started_at": self.started_at,
+            "duration": round(time.time() - self.started_at, 3),
+            "success": success,
+            "phases": {name: {k: round(v, 3) for k, v in phase.items()} for name, phase in self.phases().items()},
+            "counters": counters,
+            "attributes": attributes,
+            "spans": spans,
+        }
+
+    def summary(self):
+        phases = self.phases()
+        width = max([len(name) for name in phases] + [len("phase")])
+        lines = [f"{'phase'.ljust(width)}  {'count':>5}  {'total s':>8}  {'max s':>7}  errors"]
+        for name, phase in phases.items():
+            lines.append(f"{name.ljust(width)}  {phase['count']:>5}  {phase['total']:>8.2f}  {phase['max']:>7.2f}  {phase['errors']}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name}: {value}")
+        for key, value in sorted(self.attributes.items()):
+            lines.append(f"{key} = {value}")
+        return "\n".join(lines)
+
+    def write_json(self, directory, success=None):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"run-{self.run_id}.json")
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(success), f, indent=2)
+        return path
+
+    def write_prometheus(self, path, success=None):
+        """
+        Writes the run as Prometheus text exposition format. The file is replaced atomically, as the textfile collector expects.
+        """
+        lines = [
+            f"# HELP {METRIC_PREFIX}_phase_seconds Total duration of each phase in the last run.",
+            f"# TYPE {METRIC_PREFIX}_phase_seconds gauge",
+        ]
+        for name, phase in self.phases().items():
+            lines.append(f'{METRIC_PREFIX}_phase_seconds{{phase="{name}"}} {phase["total"]:.3f}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_phase_errors Failed spans of each phase in the last run.",
+            f"# TYPE {METRIC_PREFIX}_phase_errors gauge",
+        ]
+        for name, phase in self.phases().items():
+            lines.append(f'{METRIC_PREFIX}_phase_errors{{phase="{name}"}} {phase["errors"]}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_counter Counters of the last run (bytes, retries, ...).",
+            f"# TYPE {METRIC_PREFIX}_counter gauge",
+        ]
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'{METRIC_PREFIX}_counter{{name="{name}"}} {value}')
+        lines += [
+            f"# TYPE {METRIC_PREFIX}_run_duration_seconds gauge",
+            f"{METRIC_PREFIX}_run_duration_seconds {time.time() - self.started_at:.3f}",
+            f"# TYPE {METRIC_PREFIX}_run_success gauge",
+            f"{METRIC_PREFIX}_run_success {1 if success else 0}",
+            f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge",
+            f"{METRIC_PREFIX}_last_run_timestamp_seconds {self.started_at:.0f}",
+        ]
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def finish(self, success=None):
+        """
+        Writes the configured exports and logs the summary table. Never raises.
+        """
+        try:
+            trace_dir = os.getenv("TRACE_DIR", DEFAULT_TRACE_DIR)
+            if trace_dir:
+                self.logger.info(f"Trace written to {self.write_json(trace_dir, success)}")
+            prometheus_file = os.getenv("TRACE_PROMETHEUS_FILE")
+            if prometheus_file:
+                self.write_prometheus(prometheus_file, success)
+            self.logger.info("Run summary:\n" + self.summary())
+        except Exception as e:
+            self.logger.warning(f"Failed to write trace: {e}")
+
+
+def traced(name):
+    """
+    Decorator that runs the function in a span. A falsy return value marks the span as failed.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_tracer().span(name) as span:
+                result = func(*args, **kwargs)
+                if not result:
+                    span.fail(f"{func.__name__} returned {result!r}")
+                return result
+        return wrapper
+    return decorator
+
+
+_tracer = None
+
+
+def get_tracer():
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def reset_tracer():
+    """
+    Replaces the run tracer with a fresh one (e.g. per benchmark iteration) and returns it.
+    """
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
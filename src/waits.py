@@ -0,0 +1,144 @@
+import os
+import json
+import math
+import time
+import logging
+import threading
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+DEFAULT_STATS_FILE = ".wait_stats.json"
+MAX_SAMPLES = 50
+MIN_SAMPLES = 5
+HEADROOM = 2.0
+MIN_TIMEOUT = 1.0
+POLL_FREQUENCY = 0.1
+
+IDLE_SCRIPT = "return [document.readyState, performance.getEntriesByType('resource').length];"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class WaitEngine:
+    """
+    Named wait points (e.g. 'zeit.login.verify') whose timeouts are learned from observed latencies.
+    Each successful wait records how long it took; once a point has enough samples its timeout becomes
+    p95 * HEADROOM (never above the hardcoded default). Required waits that miss the learned timeout keep
+    waiting up to the default, so a slow day only costs what it did before. Optional waits (elements that
+    may legitimately be absent, like the cookie banner) give up at the learned timeout.
+    """
+    def __init__(self, stats_file=None):
+        self.stats_file = stats_file or os.getenv("WAIT_STATS_FILE", DEFAULT_STATS_FILE)
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.stats = self.load()
+
+    def load(self):
+        if os.path.exists(self.stats_file):
+            try:
+                with open(self.stats_file, 'r') as f:
+                    return json.load(f)
+            except:
+                return {}
+        return {}
+
+    def save(self):
+        with self.lock:
+            try:
+                tmp_path = self.stats_file + ".tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(self.stats, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.stats_file)
+            except Exception as e:
+                self.logger.warning(f"Failed to save wait stats: {e}")
+
+    def timeout_for(self, name, default):
+        with self.lock:
+            point = self.stats.get(name, {})
+            samples = point.get("samples", [])
+            if len(samples) < MIN_SAMPLES:
+                if point.get("misses", 0) >= MIN_SAMPLES and not samples:
+                    # Never seen this element appear: don't pay the full default for it every run.
+                    return min(default, MIN_TIMEOUT)
+                return default
+            return min(default, max(MIN_TIMEOUT, percentile(samples, 95) * HEADROOM))
+
+    def record(self, name, latency=None):
+        with self.lock:
+            point = self.stats.setdefault(name, {"samples": [], "hits": 0, "misses": 0})
+            if latency is None:
+                point["misses"] += 1
+            else:
+                point["hits"] += 1
+                point["samples"] = (point["samples"] + [round(latency, 3)])[-MAX_SAMPLES:]
+
+    def _wait(self, driver, name, condition, default, required, negate):
+        timeout = self.timeout_for(name, default)
+        start = time.time()
+        method = "until_not" if negate else "until"
+        try:
+            try:
+                result = getattr(WebDriverWait(driver, timeout, poll_frequency=POLL_FREQUENCY), method)(condition)
+            except TimeoutException:
+                remaining = default - timeout
+                if not required or remaining <= 0:
+                    raise
+                self.logger.info(f"Wait point '{name}' exceeded learned timeout {timeout:.1f}s, extending to {default}s.")
+                result = getattr(WebDriverWait(driver, remaining, poll_frequency=POLL_FREQUENCY), method)(condition)
+        except TimeoutException:
+            self.record(name)
+            raise
+        self.record(name, time.time() - start)
+        return result
+
+    def until(self, driver, name, condition, default, required=True):
+        """
+        WebDriverWait(driver, ...).until(condition) with a learned timeout. Raises TimeoutException on a miss.
+        """
+        return self._wait(driver, name, condition, default, required, negate=False)
+
+    def until_not(self, driver, name, condition, default, required=True):
+        return self._wait(driver, name, condition, default, required, negate=True)
+
+    def settle(self, driver, name, default=2.0, quiet_period=0.3):
+        """
+        Replaces blind sleeps: returns once the document has loaded and no new resources
+        were requested for quiet_period seconds, or after the (learned) timeout.
+        """
+        state = {"count": None, "since": time.time()}
+
+        def idle(d):
+            try:
+                ready_state, resource_count = d.execute_script(IDLE_SCRIPT)
+            except Exception:
+                # Page is navigating; try again on the next poll.
+                return False
+            now = time.time()
+            if resource_count != state["count"]:
+                state["count"], state["since"] = resource_count, now
+                return False
+            return ready_state == "complete" and now - state["since"] >= quiet_period
+
+        try:
+            self.until(driver, name, idle, default, required=False)
+        except TimeoutException:
+            pass
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_wait_engine():
+    """
+    Returns the process-wide WaitEngine so all stages share (and persist) one set of statistics.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = WaitEngine()
+        return _engine
@@ -1,266 +1,330 @@
 import os
 import time
 import logging
-import glob
-import json
 import re
-import undetected_chromedriver as uc
+from concurrent.futures import ThreadPoolExecutor
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support import expected_conditions as EC
+from src.browser import launch_chrome, set_download_dir, apply_request_blocking, record_page_stats
+from src.http_download import HttpDownloader
+from src.scheduler import get_scheduler, is_waf_block
+from src.download_watcher import DownloadWatcher
+from src.waits import get_wait_engine
+from src.selector_registry import get_selector_registry
+from src.tracing import get_tracer
+from src.ledger import RunLedger, parse_issue_date
+
 
 class ZeitScraper:
-    def __init__(self, username, password, login_url, download_url, download_dir="temp", history_file="download_history.json", test_mode=False):
+    def __init__(self, username, password, login_url, download_url, download_dir="temp", ledger=None, test_mode=False, session_cache=None, http_download=True):
         self.username = username
         self.password = password
         self.login_url = login_url
         self.download_url = download_url
         self.download_dir = os.path.abspath(download_dir)
-        self.history_file = history_file
+        self.ledger = ledger or RunLedger()
         self.test_mode = test_mode
+        self.session_cache = session_cache
+        self.http_download = http_download
+        self.waits = get_wait_engine()
+        self.selectors = get_selector_registry()
+        self.scheduler = get_scheduler()
+        self.tracer = get_tracer()
+        self.current_issue_id = None
+        # Called with the path of every finished download, e.g. to start its validation while the run goes on.
+        self.on_download = None
         self.logger = logging.getLogger(__name__)
 
         if not os.path.exists(self.download_dir):
             os.makedirs(self.download_dir)
 
-    def load_history(self):
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
-
-    def save_history(self, issue_id):
-        history = self.load_history()
-        history['last_issue_id'] = issue_id
-        history['last_download_time'] = time.time()
-        try:
-            with open(self.history_file, 'w') as f:
-                json.dump(history, f, indent=2)
-            self.logger.info(f"Updated history with issue: {issue_id}")
-        except Exception as e:
-            self.logger.error(f"Failed to save history: {e}")
+    def is_downloaded(self, issue_id):
+        return self.ledger.is_downloaded(issue_id)
+
+    def record_stage(self, issue_id, stage, status, **kwargs):
+        """
+        Records a stage transition ('running', 'done' or 'failed') in the ledger. Nothing is recorded in test mode.
+        """
+        if not issue_id or self.test_mode:
+            return
+        if status == "running":
+            self.ledger.begin(issue_id, stage)
+        elif status == "done":
+            self.ledger.complete(issue_id, stage, **kwargs)
+        else:
+            self.ledger.fail(issue_id, stage, **kwargs)
+
+    def postponed(self):
+        """
+        Returns True if the Zeit host is in backoff after a WAF block, so a refused or failed request is retried by a later run.
+        """
+        return self.scheduler.next_attempt(self.download_url) > time.time()
 
     def take_screenshot(self, driver, name):
         try:
             filename = f"{name}_{int(time.time())}.png"
             driver.save_screenshot(filename)
             self.logger.info(f"Saved screenshot: {filename}")
-        except:
+        except Exception:
             pass
 
-    def get_chrome_version(self, chrome_bin=None):
+    def get_link_url(self, element):
+        """
+        Returns the absolute http(s) URL behind a link element (or its enclosing <a>), or None.
+        """
         try:
-            import subprocess
-            import re
-            # Read the version of the exact binary we will launch (chrome_bin),
-            # falling back to 'google-chrome' on PATH for local runs.
-            executable = chrome_bin or 'google-chrome'
-            result = subprocess.run([executable, '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            output = result.stdout
-            match = re.search(r'Chrome (\d+)', output)
-            if match:
-                return int(match.group(1))
-        except Exception as e:
-            self.logger.warning(f"Could not detect Chrome version: {e}")
+            href = element.get_attribute('href')
+            if not href:
+                href = element.find_element(By.XPATH, "./ancestor::a[1]").get_attribute('href')
+        except Exception:
+            return None
+        if href and href.startswith(("http://", "https://")):
+            return href
         return None
 
-    def download_latest_issue(self):
+    def finish_download(self, downloaded_file, current_issue_id):
+        self.logger.info(f"Download complete: {downloaded_file}")
+        if self.on_download:
+            self.on_download(downloaded_file)
+        if current_issue_id and not self.test_mode:
+            self.record_stage(current_issue_id, "download", "done", detail=os.path.basename(downloaded_file), data={"path": downloaded_file})
+            self.logger.info(f"Recorded download of issue {current_issue_id} in ledger.")
+        elif self.test_mode:
+            self.logger.info("Test Mode: Not updating ledger.")
+        return downloaded_file
+
+    def login(self, driver):
         """
-        Logs in to Die Zeit and downloads the latest EPUB issue using Selenium.
-        Returns the path to the downloaded file or None if failed OR if already processed.
+        Brings the driver to a logged-in Zeit session (restored from cache or via the Keycloak form).
+        Returns True if logged in, False otherwise.
         """
-        self.logger.info("Starting Zeit Scraper (Selenium)...")
-        driver = None
-        
+        waits = self.waits
+
+        # --- Login Phase ---
+        apply_request_blocking(driver, "zeit")
+        restored_session = False
+        if self.session_cache:
+            restored_session = self.session_cache.restore(driver)
+
+        if not self.scheduler.acquire(self.login_url):
+            self.logger.error("Zeit login postponed, the site blocked an earlier attempt.")
+            return False
+        self.logger.info(f"Navigating to login page: {self.login_url}")
+        start = time.time()
+        driver.get(self.login_url)
+        latency = time.time() - start
+        # Remove static sleep, wait for username or active session indicator
+
+        # Detect Login State
+        needs_login = False
         try:
-            # Configure Chrome Options for Download
-            options = uc.ChromeOptions()
-            options.add_argument("--disable-blink-features=AutomationControlled")
-            options.add_argument("--no-sandbox")
-            options.add_argument("--disable-gpu")
-            options.add_argument("--window-size=1920,1080")
-            options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-            
-            prefs = {
-                "download.default_directory": self.download_dir,
-                "download.prompt_for_download": False,
-                "download.directory_upgrade": True,
-                "safebrowsing.enabled": True,
-                "plugins.always_open_pdf_externally": True 
-            }
-            options.add_experimental_option("prefs", prefs)
-            
-            # Initialize Driver.
-            # Use the Chrome + ChromeDriver paths provided by the CI workflow so that
-            # the launched browser and the driver always come from the same matched pair.
-            chrome_bin = os.environ.get("CHROME_BIN")
-            driver_bin = os.environ.get("CHROMEDRIVER_BIN")
-            version_main = self.get_chrome_version(chrome_bin)
-
-            kwargs = dict(use_subprocess=True, options=options)
-            if chrome_bin:
-                kwargs["browser_executable_path"] = chrome_bin
-            if driver_bin:
-                kwargs["driver_executable_path"] = driver_bin
-            if version_main:
-                kwargs["version_main"] = version_main
-
-            self.logger.info(
-                f"Starting Chrome (binary={chrome_bin or 'auto'}, driver={driver_bin or 'auto'}, version_main={version_main})"
+            # Wait up to 5s for either username OR logout button
+            login_or_account = waits.until(driver, "zeit.login.state",
+               EC.presence_of_element_located((By.XPATH, "//*[@id='username'] | //*[contains(text(), 'Abmelden')] | //*[contains(text(), 'Konto')]")),
+               default=5
             )
-            driver = uc.Chrome(**kwargs)
-                
-            driver.set_window_size(1920, 1080)
-            
-            wait = WebDriverWait(driver, 20)
-            
-            # --- Login Phase ---
-            self.logger.info(f"Navigating to login page: {self.login_url}")
-            driver.get(self.login_url)
-            # Remove static sleep, wait for username or active session indicator
 
-            # Detect Login State
-            needs_login = False
+            # Check what we found
+            if login_or_account.get_attribute("id") == "username":
+                 needs_login = True
+                 self.logger.info("Login form detected.")
+            else:
+                 self.logger.info("Active session detected.")
+                 needs_login = False
+        except Exception:
+            # Fallback
+            self.logger.info("Login state unclear, assuming login needed.")
+            needs_login = True
+
+        self.tracer.set("zeit.login_mode", "form" if needs_login else ("cached_session" if restored_session else "active_session"))
+
+        if needs_login and restored_session:
+            self.logger.info("Cached session was not accepted. Logging in from scratch.")
+            self.session_cache.invalidate()
+
+        if needs_login:
             try:
-                # Wait up to 5s for either username OR logout button
-                login_or_account = WebDriverWait(driver, 5).until(
-                   EC.presence_of_element_located((By.XPATH, "//*[@id='username'] | //*[contains(text(), 'Abmelden')] | //*[contains(text(), 'Konto')]"))
-                )
-                
-                # Check what we found
-                if login_or_account.get_attribute("id") == "username":
-                     needs_login = True
-                     self.logger.info("Login form detected.")
-                else:
-                     self.logger.info("Active session detected.")
-                     needs_login = False
-            except:
-                # Fallback
-                self.logger.info("Login state unclear, assuming login needed.")
-                needs_login = True
-
-            if needs_login:
+                cookie_btn = waits.until(driver, "zeit.login.cookie_banner", EC.element_to_be_clickable((By.CSS_SELECTOR, "button[title='Zustimmen']")), default=3, required=False)
+                cookie_btn.click()
+            except Exception:
+                pass
+
+            try:
+                self.logger.info("Entering credentials...");
+                email_input = waits.until(driver, "zeit.login.username", EC.element_to_be_clickable((By.CSS_SELECTOR, "input#username")), default=20)
+                waits.settle(driver, "zeit.login.form_ready", default=1) # Focus wait
+                email_input.click()
+                email_input.clear()
+                email_input.send_keys(self.username)
+
+                pass_input = driver.find_element(By.CSS_SELECTOR, "input#password")
+                pass_input.click()
+                pass_input.clear()
+                pass_input.send_keys(self.password)
+
+                # Submit Strategy 1: Enter Key
+                self.logger.info("Submitting via Enter key...")
+                submit_strategy = "enter"
+                pass_input.send_keys(Keys.RETURN)
+                login_form_gone = lambda d: not d.find_elements(By.CSS_SELECTOR, "#kc-login")
                 try:
-                    cookie_btn = WebDriverWait(driver, 3).until(EC.element_to_be_clickable((By.CSS_SELECTOR, "button[title='Zustimmen']")))
-                    cookie_btn.click()
-                except:
+                    waits.until(driver, "zeit.login.submit_enter", login_form_gone, default=2, required=False)
+                except TimeoutException:
                     pass
-                
-                try:
-                    self.logger.info("Entering credentials...");
-                    email_input = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "input#username")))
-                    time.sleep(1) # Focus wait
-                    email_input.click()
-                    email_input.clear()
-                    email_input.send_keys(self.username)
-                    
-                    pass_input = driver.find_element(By.CSS_SELECTOR, "input#password")
-                    pass_input.click()
-                    pass_input.clear()
-                    pass_input.send_keys(self.password)
-                    
-                    # Submit Strategy 1: Enter Key
-                    self.logger.info("Submitting via Enter key...")
-                    pass_input.send_keys(Keys.RETURN)
-                    time.sleep(2)
-                    
-                    # Submit Strategy 2: Click Button (if still present)
-                    if len(driver.find_elements(By.CSS_SELECTOR, "#kc-login")) > 0:
-                        self.logger.info("Login form still present. Trying button click...")
-                        login_btn = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "#kc-login")))
-                        login_btn.click()
-                        time.sleep(1)
-                        
-                        # Submit Strategy 3: JS Click (if STILL present)
-                        if len(driver.find_elements(By.CSS_SELECTOR, "#kc-login")) > 0:
-                            self.logger.info("Login form still present. Trying JS click...")
-                            driver.execute_script("arguments[0].click();", login_btn)
-
-                    self.logger.info("Credentials submitted.")
-
-                    # Strict Login Verification
-                    self.logger.info("Waiting for login to complete (looking for 'Abmelden' or 'Konto')...")
+
+                # Submit Strategy 2: Click Button (if still present)
+                if len(driver.find_elements(By.CSS_SELECTOR, "#kc-login")) > 0:
+                    self.logger.info("Login form still present. Trying button click...")
+                    submit_strategy = "button"
+                    login_btn = waits.until(driver, "zeit.login.submit_button", EC.element_to_be_clickable((By.CSS_SELECTOR, "#kc-login")), default=20)
+                    login_btn.click()
                     try:
-                        # Wait for specific "Logged In" indicator
-                        WebDriverWait(driver, 20).until(
-                            EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'Abmelden')] | //*[contains(text(), 'Konto')]"))
-                        )
-                        self.logger.info("Login successful (verified 'Abmelden'/'Konto' presence).")
-                    except:
-                        # Check for WAF block or Error Message
-                        page_text = driver.find_element(By.TAG_NAME, "body").text
-                        if "Zugriff wurde geblockt" in page_text or "Ray ID" in page_text:
-                            self.logger.error("ACCESS DENIED: Zeit Login blocked by WAF.")
-                        elif "Benutzername oder Passwort falsch" in page_text or "Ungültige Anmeldedaten" in page_text:
-                            self.logger.error("LOGIN FAILED: Invalid credentials.")
-                        else:
-                            self.logger.error("Login verification timed out. Session not established.")
-                            
-                        self.take_screenshot(driver, "zeit_login_verification_failed")
-                        return None
-                except Exception as e:
-                    self.logger.error(f"Login interaction failed: {e}")
-                    self.logger.info(f"Current URL: {driver.current_url}")
-                    self.take_screenshot(driver, "zeit_login_failed")
-                    return None
+                        waits.until(driver, "zeit.login.submit_click", login_form_gone, default=1, required=False)
+                    except TimeoutException:
+                        pass
 
-            # --- Check Issue Date & Navigate ---
-            self.logger.info(f"Navigating to download URL: {self.download_url}")
-            driver.get(self.download_url)
+                    # Submit Strategy 3: JS Click (if STILL present)
+                    if len(driver.find_elements(By.CSS_SELECTOR, "#kc-login")) > 0:
+                        self.logger.info("Login form still present. Trying JS click...")
+                        submit_strategy = "js"
+                        driver.execute_script("arguments[0].click();", login_btn)
+
+                self.logger.info("Credentials submitted.")
+                self.tracer.set("selector.zeit.login_submit", submit_strategy)
+
+                # Strict Login Verification
+                self.logger.info("Waiting for login to complete (looking for 'Abmelden' or 'Konto')...")
+                try:
+                    # Wait for specific "Logged In" indicator
+                    waits.until(driver, "zeit.login.verify",
+                        EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'Abmelden')] | //*[contains(text(), 'Konto')]")),
+                        default=20
+                    )
+                    self.logger.info("Login successful (verified 'Abmelden'/'Konto' presence).")
+                except Exception:
+                    # Check for WAF block or Error Message
+                    page_text = driver.find_element(By.TAG_NAME, "body").text
+                    if is_waf_block(page_text):
+                        self.logger.error("ACCESS DENIED: Zeit Login blocked by WAF.")
+                        self.scheduler.record(self.login_url, blocked=True)
+                    elif "Benutzername oder Passwort falsch" in page_text or "Ungültige Anmeldedaten" in page_text:
+                        self.logger.error("LOGIN FAILED: Invalid credentials.")
+                    else:
+                        self.logger.error("Login verification timed out. Session not established.")
+
+                    self.take_screenshot(driver, "zeit_login_verification_failed")
+                    if self.session_cache:
+                        self.session_cache.invalidate()
+                    return False
+            except Exception as e:
+                self.logger.error(f"Login interaction failed: {e}")
+                self.logger.info(f"Current URL: {driver.current_url}")
+                self.take_screenshot(driver, "zeit_login_failed")
+                return False
+
+        self.scheduler.record(self.login_url, latency=latency)
+        return True
+
+    def find_epub_link(self, driver):
+        """
+        Returns the 'EPUB FÜR E-READER LADEN' link element of the current issue page, or None.
+        """
+        self.logger.info("Looking for 'EPUB FÜR E-READER LADEN'...")
+
+        try:
+            epub_link = self.selectors.find(driver, "zeit.epub.link", default=20)
+            self.logger.info("Found EPUB link.")
+        except Exception:
+            self.logger.error("Could not find EPUB link.")
+            self.take_screenshot(driver, "epub_link_missing")
+            return None
+        return epub_link
+
+    def download_latest_issue(self, driver=None):
+        """
+        Logs in to Die Zeit and downloads the latest EPUB issue using Selenium.
+        If a driver is passed in, it is reused and left running; otherwise a new Chrome is launched and quit afterwards.
+        Returns the path to the downloaded file, "SKIPPED" if the issue was already uploaded, "POSTPONED" if the
+        Zeit host is in backoff after a WAF block, or None if the download failed.
+        """
+        self.logger.info("Starting Zeit Scraper (Selenium)...")
+        owns_driver = driver is None
+        
+        try:
+            if owns_driver:
+                driver = launch_chrome(download_dir=self.download_dir)
+            else:
+                set_download_dir(driver, self.download_dir)
             
-            current_issue_id = None
+            waits = self.waits
             
-            # 1. Wait for ANY key element to be present (button or title) to ensure page load
-            try:
-                # Look for "Aktuelle Ausgabe" or just generic body check
-                WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-            except:
-                pass
+            # --- Login Phase ---
+            with self.tracer.span("zeit.login") as span:
+                if not self.login(driver):
+                    span.fail("not logged in")
+                    return "POSTPONED" if self.postponed() else None
 
-            # 1. Find "ZUR AKTUELLEN AUSGABE" button
-            issue_btn = None
-            try:
-                # Try explicit text match
-                issue_btn = driver.find_element(By.XPATH, "//a[contains(translate(text(), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'aktuellen ausgabe')]")
-            except:
+            # --- Check Issue Date & Navigate ---
+            with self.tracer.span("zeit.issue_detect") as span:
+                self.logger.info(f"Navigating to download URL: {self.download_url}")
+                driver.get(self.download_url)
+            
+                current_issue_id = None
+                self.current_issue_id = None
+            
+                # 1. Wait for ANY key element to be present (button or title) to ensure page load
                 try:
-                    issue_btn = driver.find_element(By.CSS_SELECTOR, "a.btn-danger")
-                except:
+                    # Look for "Aktuelle Ausgabe" or just generic body check
+                    waits.until(driver, "zeit.issue.page", EC.presence_of_element_located((By.TAG_NAME, "body")), default=10)
+                except Exception:
                     pass
+                record_page_stats(driver, "zeit.epaper")
 
-            if issue_btn:
+                if self.session_cache:
+                    self.session_cache.save(driver)
+
+                # 1. Find "ZUR AKTUELLEN AUSGABE" button
+                issue_btn = None
                 try:
-                    href = issue_btn.get_attribute('href')
-                    self.logger.info(f"Found Issue Button pointing to: {href}")
-                    # Extract date
-                    match = re.search(r'(\d{2}\.\d{2}\.\d{4})', href)
+                    # The page is loaded at this point, so a single check of all strategies is enough.
+                    issue_btn = self.selectors.find(driver, "zeit.issue.button", default=0, state="present", required=False)
+                except Exception:
+                    pass
+
+                if issue_btn:
+                    try:
+                        href = issue_btn.get_attribute('href')
+                        self.logger.info(f"Found Issue Button pointing to: {href}")
+                        # Extract date
+                        match = re.search(r'(\d{2}\.\d{2}\.\d{4})', href)
+                        if match:
+                            current_issue_id = match.group(1)
+                            self.logger.info(f"Identified Issue Date: {current_issue_id}")
+                    except Exception:
+                        pass
+                else:
+                    self.logger.warning("'ZUR AKTUELLEN AUSGABE' button not found. Checking current URL...")
+                    # Backup: check URL
+                    match = re.search(r'(\d{2}\.\d{2}\.\d{4})', driver.current_url)
                     if match:
                         current_issue_id = match.group(1)
-                        self.logger.info(f"Identified Issue Date: {current_issue_id}")
-                except:
-                    pass
-            else:
-                self.logger.warning("'ZUR AKTUELLEN AUSGABE' button not found. Checking current URL...")
-                # Backup: check URL
-                match = re.search(r'(\d{2}\.\d{2}\.\d{4})', driver.current_url)
-                if match:
-                    current_issue_id = match.group(1)
-                    self.logger.info(f"Identified Issue Date from URL: {current_issue_id}")
-
-            # --- Smart Check ---
-            if current_issue_id:
-                history = self.load_history()
-                last_processed = history.get('last_issue_id')
-                
-                if self.test_mode:
-                    self.logger.info(f"Test Mode: Ignoring history check (Issue {current_issue_id} vs Last {last_processed})")
-                elif last_processed == current_issue_id:
-                    self.logger.info(f"Skipping: Issue {current_issue_id} already processed.")
-                    return "SKIPPED"
+                        self.logger.info(f"Identified Issue Date from URL: {current_issue_id}")
+                        self.tracer.set("selector.zeit.issue.button", "url")
+
+                # --- Smart Check ---
+                self.current_issue_id = current_issue_id
+                if current_issue_id:
+                    if self.test_mode:
+                        self.logger.info(f"Test Mode: Ignoring ledger check (Issue {current_issue_id})")
+                    elif self.ledger.is_complete(current_issue_id):
+                        self.logger.info(f"Skipping: Issue {current_issue_id} already uploaded.")
+                        return "SKIPPED"
+                    else:
+                        self.record_stage(current_issue_id, "login", "done")
+                        self.record_stage(current_issue_id, "resolve_link", "running")
+                span.set(issue_id=current_issue_id)
             
             # --- Navigate to Issue Page ---
             if issue_btn and issue_btn.is_displayed():
@@ -268,54 +332,66 @@ class ZeitScraper:
                 issue_btn.click()
             
             # --- Find EPUB Download ---
-            self.logger.info("Looking for 'EPUB FÜR E-READER LADEN'...")
-            
-            try:
-                # 1. Simple Text Search "EPUB" (Fastest)
-                xpath_text = "//*[contains(text(), 'EPUB')]"
-                
-                epub_link = wait.until(EC.element_to_be_clickable((By.XPATH, xpath_text)))
-                self.logger.info("Found EPUB link via text. Clicking...")
-                epub_link.click()
-                
-            except:
-                self.logger.warning("Simple 'EPUB' text link not found. Trying specific text...")
+            with self.tracer.span("zeit.resolve_link") as span:
+                epub_link = self.find_epub_link(driver)
+                if not epub_link:
+                    span.fail("no EPUB link")
+                    return None
+                link_url = self.get_link_url(epub_link)
+            self.record_stage(current_issue_id, "resolve_link", "done", detail=link_url, data={"url": link_url, "referer": driver.current_url})
+            self.record_stage(current_issue_id, "download", "running")
+
+            # --- HTTP Fast Path ---
+            epub_url = link_url if self.http_download else None
+            if epub_url:
+                self.logger.info(f"Resolved EPUB URL: {epub_url}. Downloading via HTTP...")
+                downloader = HttpDownloader(user_agent=driver.execute_script("return navigator.userAgent;"))
+                downloader.load_cookies(driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", []))
+                referer = driver.current_url
+                if owns_driver:
+                    # Only the session cookies are needed from here on, free the browser early.
+                    driver.quit()
+                    driver = None
+
+                with self.tracer.span("zeit.download", method="http") as span:
+                    try:
+                        downloaded_file = downloader.download(epub_url, self.download_dir, referer=referer)
+                    finally:
+                        downloader.close()
+                    if not downloaded_file:
+                        span.fail("HTTP download failed")
+
+                if downloaded_file:
+                    return self.finish_download(downloaded_file, current_issue_id)
+                if self.postponed():
+                    # A browser download would hit the same block
+                    return "POSTPONED"
+                if not driver:
+                    self.logger.error("HTTP download failed.")
+                    return None
+                self.logger.warning("HTTP download failed. Falling back to browser download...")
+
+            with self.tracer.span("zeit.download", method="browser") as span:
+                self.logger.info("Clicking EPUB link...")
+                watcher = DownloadWatcher(self.download_dir).start()
                 try:
-                    # 2. Specific Backup if "EPUB" is too generic (unlikely)
-                    xpath_text = "//*[contains(translate(text(), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'epub für e-reader laden')]"
-                    epub_link = driver.find_element(By.XPATH, xpath_text)
                     epub_link.click()
-                except:
-                    self.logger.error("Could not find EPUB link.")
-                    self.take_screenshot(driver, "epub_link_missing")
-                    return None
-            
-            # Wait for download
-            self.logger.info("Waiting for download...")
-            timeout = 60
-            start_time = time.time()
-            downloaded_file = None
-            
-            while time.time() - start_time < timeout:
-                epubs = glob.glob(os.path.join(self.download_dir, "*.epub"))
-                if epubs:
-                    latest_epub = max(epubs, key=os.path.getctime)
-                    if os.path.getctime(latest_epub) > start_time - 10:
-                        crdownloads = glob.glob(os.path.join(self.download_dir, "*.crdownload"))
-                        if not crdownloads:
-                            downloaded_file = latest_epub
-                            break
-                time.sleep(0.5) # reduced check interval
+                except Exception:
+                    watcher.close()
+                    raise
+
+                # Wait for download
+                self.logger.info("Waiting for download...")
+                downloaded_file = watcher.wait(timeout=60)
+                if downloaded_file:
+                    self.tracer.count("bytes.browser_download", os.path.getsize(downloaded_file))
+                else:
+                    span.fail("timed out or cancelled")
             
             if downloaded_file:
-                self.logger.info(f"Download complete: {downloaded_file}")
-                if current_issue_id and not self.test_mode:
-                    self.save_history(current_issue_id)
-                elif self.test_mode:
-                    self.logger.info("Test Mode: Not updating history file.")
-                return downloaded_file
+                return self.finish_download(downloaded_file, current_issue_id)
             else:
-                self.logger.error("Download timed out.")
+                self.logger.error("Download timed out or was cancelled.")
                 self.take_screenshot(driver, "download_timeout")
                 return None
         
@@ -326,5 +402,159 @@ class ZeitScraper:
             return None
             
         finally:
+            self.waits.save()
+            self.selectors.save()
+            if self.current_issue_id and not self.test_mode:
+                self.ledger.fail_running(self.current_issue_id)
+            if driver and owns_driver:
+                driver.quit()
+
+    def resume_download(self, issue_id, cookies):
+        """
+        Resumes an issue whose EPUB link was resolved by an earlier run: downloads it over HTTP with the cached
+        session cookies, continuing a partial .part file if one is left. No browser is started.
+        Returns the path, or None if there is no checkpoint or the link/cookies are no longer accepted. A failed
+        resume drops the checkpoint (resolve_link is marked failed), so the next run resolves the link again.
+        """
+        checkpoint = self.ledger.checkpoint(issue_id, "resolve_link")
+        if checkpoint is None:
+            return None
+        if not checkpoint.get("url") or not cookies:
+            self.record_stage(issue_id, "resolve_link", "failed", detail="resume not possible")
+            return None
+
+        self.logger.info(f"Resuming issue {issue_id} at download: {checkpoint['url']}")
+        self.current_issue_id = issue_id
+        self.record_stage(issue_id, "download", "running")
+        downloader = HttpDownloader()
+        downloader.load_cookies(cookies)
+        with self.tracer.span("zeit.download", method="resume") as span:
+            try:
+                downloaded_file = downloader.download(checkpoint["url"], self.download_dir, referer=checkpoint.get("referer"))
+            finally:
+                downloader.close()
+            if not downloaded_file:
+                span.fail("resume failed")
+
+        if not downloaded_file:
+            self.record_stage(issue_id, "download", "failed", detail="resume failed")
+            self.record_stage(issue_id, "resolve_link", "failed", detail="resume failed")
+            return None
+        return self.finish_download(downloaded_file, issue_id)
+
+    def list_archive(self, driver, archive_url):
+        """
+        Returns {issue_id: issue_url} for every issue linked from the archive page.
+        """
+        self.logger.info(f"Listing issue archive: {archive_url}")
+        driver.get(archive_url)
+        try:
+            self.waits.until(driver, "zeit.archive.page", EC.presence_of_element_located((By.TAG_NAME, "body")), default=10)
+        except Exception:
+            pass
+
+        hrefs = driver.execute_script("return Array.from(document.querySelectorAll('a[href]'), a => a.href);") or []
+        issues = {}
+        for href in hrefs:
+            match = re.search(r'(\d{2}\.\d{2}\.\d{4})', href)
+            if match and match.group(1) not in issues:
+                issues[match.group(1)] = href
+        self.logger.info(f"Found {len(issues)} issues in archive.")
+        return issues
+
+    def download_issues(self, start_date, end_date, archive_url=None, driver=None, concurrency=2, rate=0.5):
+        """
+        Backfills all archive issues dated between start_date and end_date (inclusive) that are not downloaded yet.
+        EPUB links are resolved one after another in the logged-in browser; the files are then fetched by up to
+        `concurrency` HTTP workers sharing the browser cookies, with at most `rate` requests per second to the Zeit host
+        (see RequestScheduler; a WAF block stops the backfill until its backoff is over).
+        Returns {issue_id: path or None} for every missing issue (None also for issues skipped because of a backoff
+        or a crash), or None if the login or the archive listing failed.
+        """
+        self.logger.info(f"Starting backfill {start_date:%d.%m.%Y} - {end_date:%d.%m.%Y} (concurrency={concurrency}, rate={rate}/s)...")
+        owns_driver = driver is None
+        results = {}
+        missing = []
+
+        try:
+            if owns_driver:
+                driver = launch_chrome(download_dir=self.download_dir)
+            else:
+                set_download_dir(driver, self.download_dir)
+
+            with self.tracer.span("zeit.login") as span:
+                if not self.login(driver):
+                    span.fail("not logged in")
+                    return None
+
+            archive = self.list_archive(driver, archive_url or self.download_url)
+            wanted = sorted(
+                (issue_id for issue_id in archive if start_date <= parse_issue_date(issue_id) <= end_date),
+                key=parse_issue_date
+            )
+            missing = [issue_id for issue_id in wanted if self.test_mode or not self.is_downloaded(issue_id)]
+            self.logger.info(f"{len(wanted)} issues in range, {len(missing)} missing.")
+            if not missing:
+                return results
+
+            user_agent = driver.execute_script("return navigator.userAgent;")
+            cookies = driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", [])
+
+            def fetch(issue_id, epub_url, referer):
+                downloader = HttpDownloader(user_agent=user_agent, rate=rate)
+                downloader.load_cookies(cookies)
+                try:
+                    with self.tracer.span("zeit.download", method="http", issue_id=issue_id):
+                        return downloader.download(epub_url, self.download_dir, referer=referer)
+                finally:
+                    downloader.close()
+
+            with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="backfill") as pool:
+                futures = {}
+                for issue_id in missing:
+                    if not self.scheduler.acquire(archive[issue_id], rate=rate):
+                        self.logger.error("Stopping backfill, the Zeit host is in backoff. Missing issues are fetched by a later run.")
+                        break
+                    self.logger.info(f"Resolving EPUB link for issue {issue_id}...")
+                    with self.tracer.span("zeit.resolve_link", issue_id=issue_id):
+                        driver.get(archive[issue_id])
+                        epub_link = self.find_epub_link(driver)
+                        epub_url = self.get_link_url(epub_link) if epub_link else None
+                    if not epub_url:
+                        self.logger.error(f"No downloadable EPUB link for issue {issue_id}.")
+                        results[issue_id] = None
+                        self.record_stage(issue_id, "resolve_link", "failed")
+                        continue
+                    self.record_stage(issue_id, "resolve_link", "done", detail=epub_url, data={"url": epub_url, "referer": archive[issue_id]})
+                    self.record_stage(issue_id, "download", "running")
+                    futures[issue_id] = pool.submit(fetch, issue_id, epub_url, archive[issue_id])
+
+                for issue_id, future in futures.items():
+                    path = future.result()
+                    results[issue_id] = path
+                    if path:
+                        self.record_stage(issue_id, "download", "done", detail=os.path.basename(path), data={"path": path})
+                    else:
+                        self.record_stage(issue_id, "download", "failed")
+
+            for issue_id in missing:
+                results.setdefault(issue_id, None)
+            done = sum(1 for path in results.values() if path)
+            self.logger.info(f"Backfill finished: {done}/{len(missing)} issues downloaded.")
+            return results
+
+        except Exception as e:
+            self.logger.error(f"Backfill crashed: {e}")
             if driver:
+                self.take_screenshot(driver, "backfill_crash")
+            if not missing:
+                return None
+            for issue_id in missing:
+                results.setdefault(issue_id, None)
+            return results
+
+        finally:
+            self.waits.save()
+            self.selectors.save()
+            if driver and owns_driver:
                 driver.quit()